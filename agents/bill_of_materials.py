@@ -0,0 +1,59 @@
+from pydantic import BaseModel, Field
+from llm.models import get_chat_model
+from typing import Dict, Any, List
+from .state import FootprintState
+import yaml
+from pathlib import Path
+
+class Component(BaseModel):
+    component: str = Field(description="The part of the product, e.g. 'frame' or 'battery'.")
+    material: str = Field(description="The material of the part, e.g. 'aluminum 6061' or 'lithium-ion cells'.")
+    mass_kg: float = Field(description="The estimated mass of the part in kg.")
+    recycled_content: float = Field(default=0.0, description="Estimated fraction (0-1) of recycled material in the part.")
+
+class BillOfMaterials(BaseModel):
+    components: List[Component] = Field(description="The components of ONE item of the product, excluding packaging.")
+    total_mass_kg: float = Field(description="The estimated total mass of one item in kg, excluding packaging.")
+    assumptions: str = Field(description="A short note of the key assumptions behind the estimate.")
+
+# Load prompts from YAML
+_PROMPTS_FILE = Path(__file__).parent / "prompts.yaml"
+with open(_PROMPTS_FILE, 'r') as f:
+    _prompts_data = yaml.safe_load(f)
+
+bill_of_materials_prompt_text = _prompts_data['bill_of_materials_prompt']
+
+bom_llm = get_chat_model(route="bill_of_materials", temperature=0).with_structured_output(BillOfMaterials)
+
+def material_description(bill_of_materials: Dict[str, Any]) -> str:
+    """Renders a bill of materials as text for the lifecycle agents' input."""
+    lines = [
+        f"- {c['component']}: {c['material']}, {c['mass_kg']} kg"
+        + (f" ({c['recycled_content']:.0%} recycled)" if c.get("recycled_content") else "")
+        for c in bill_of_materials["components"]
+    ]
+    lines.append(f"Assumptions: {bill_of_materials['assumptions']}")
+    return "\n".join(lines)
+
+async def bill_of_materials_phase(state: FootprintState) -> Dict[str, Any]:
+    """
+    Estimates a structured bill of materials (components, materials and masses)
+    once, so the materials, manufacturing, packaging and end-of-life agents
+    share it instead of each working out the product's composition.
+    """
+    # Stored analyses and catalogue hits may already have one
+    if state.get("bill_of_materials"):
+        bill_of_materials = state["bill_of_materials"]
+    else:
+        input = f"""Brand: {state["brand"]}\nCategory: {state["category"]}\nDescription: {state["long_description"]}"""
+        response: BillOfMaterials = await bom_llm.ainvoke([
+            {"role": "system", "content": bill_of_materials_prompt_text},
+            {"role": "user", "content": input}
+        ])
+        bill_of_materials = response.model_dump()
+
+    return {
+        "bill_of_materials": bill_of_materials,
+        "weight_kg": bill_of_materials["total_mass_kg"],
+        "material_description": material_description(bill_of_materials),
+    }
@@ -0,0 +1,186 @@
+"""
+Local product catalogue index.
+
+Maps canonical product URLs and product identifiers (SKU, GTIN/UPC, ASIN,
+MPN, ...) to pre-extracted page-analysis fields, so known products can be
+analysed without scraping or page-analysis LLM calls.
+
+The index is a single SQLite file: a key table (WITHOUT ROWID, so lookups are
+one B-tree search) pointing at zlib-compressed JSON product records.
+
+Bulk load from JSONL or CSV with:
+    python -m agents.catalogue products.jsonl --db catalogue.db
+
+Each record needs a "url" and the page-analysis fields ("brand", "category",
+"short_description", "long_description", "product_image_urls"), plus any of
+the identifier fields in IDENTIFIER_FIELDS. A "bill_of_materials" (see
+agents/bill_of_materials.py) may also be given, in which case it is not
+estimated again. In CSV files product_image_urls is a space-separated list and
+bill_of_materials a JSON string.
+"""
+
+import argparse
+import csv
+import json
+import os
+import re
+import sqlite3
+import threading
+import zlib
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+from urllib.parse import parse_qsl, urlencode, urlparse
+
+IDENTIFIER_FIELDS = ["sku", "gtin", "upc", "ean", "asin", "mpn", "product_id"]
+RECORD_FIELDS = ["url", "brand", "category", "short_description", "long_description", "product_image_urls", "bill_of_materials"]
+
+# Query parameters that track the visit rather than identify the product
+_TRACKING_PARAMETERS = re.compile(r"^(utm_\w+|gclid|gbraid|wbraid|fbclid|msclkid|dclid|srsltid|mc_cid|mc_eid|_ga|_gl|ref|ref_|tag|icid|intcmp)$")
+
+# Retailer URL patterns that embed a product identifier
+_URL_IDENTIFIERS = [
+    ("asin", r"amazon\.[\w.]+/(?:.*/)?(?:dp|gp/product)/([A-Z0-9]{10})"),
+    ("sku", r"target\.com/.*/-/A-(\d+)"),
+    ("sku", r"bestbuy\.com/.*/(\d{6,8})\.p"),
+]
+
+
+def canonical_url(url: str) -> str:
+    """
+    Scheme-less, lower-cased host, no www., fragment or trailing slash. The query
+    is kept, sorted and without tracking parameters, since many retailers name
+    the product or variant there (?pid=, ?variant=).
+    """
+    parsed = urlparse(url.strip())
+    host = parsed.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    query = sorted((name, value) for name, value in parse_qsl(parsed.query, keep_blank_values=True)
+                   if not _TRACKING_PARAMETERS.match(name.lower()))
+    return f"{host}{parsed.path.rstrip('/')}" + (f"?{urlencode(query)}" if query else "")
+
+
+def identifier_key(field: str, value: str) -> str:
+    return f"{field}:{str(value).strip().lower()}"
+
+
+def identifiers_from_url(url: str) -> List[str]:
+    """Identifier keys that can be read off a retailer URL."""
+    return [identifier_key(field, m.group(1)) for field, pattern in _URL_IDENTIFIERS
+            for m in [re.search(pattern, url)] if m]
+
+
+class Catalogue:
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS products (id INTEGER PRIMARY KEY, record BLOB NOT NULL)")
+            db.execute("CREATE TABLE IF NOT EXISTS product_keys (key TEXT PRIMARY KEY, product INTEGER NOT NULL) WITHOUT ROWID")
+
+    def _connect(self) -> sqlite3.Connection:
+        # sqlite3 connections can't be shared between threads
+        if getattr(self._local, "db", None) is None:
+            self._local.db = sqlite3.connect(self.path)
+        return self._local.db
+
+    def add(self, records: Iterable[Dict[str, Any]]) -> int:
+        """
+        Add or replace product records.
+
+        Returns:
+            The number of records added
+        """
+        db = self._connect()
+        count = 0
+        with db:
+            for record in records:
+                if not record.get("url"):
+                    continue
+                record = {field: record[field] for field in RECORD_FIELDS + IDENTIFIER_FIELDS if record.get(field)}
+                keys = [canonical_url(record["url"])] + identifiers_from_url(record["url"])
+                keys += [identifier_key(field, record[field]) for field in IDENTIFIER_FIELDS if field in record]
+                # A replaced record's keys go with it, so identifiers it no longer has stop resolving
+                db.execute("DELETE FROM product_keys WHERE product IN (SELECT product FROM product_keys WHERE key = ?)",
+                           (keys[0],))
+                blob = zlib.compress(json.dumps(record, separators=(",", ":")).encode())
+                product = db.execute("INSERT INTO products (record) VALUES (?)", (blob,)).lastrowid
+                db.executemany("INSERT OR REPLACE INTO product_keys (key, product) VALUES (?, ?)",
+                               [(key, product) for key in keys])
+                count += 1
+            # Drop records no key points at any more
+            db.execute("DELETE FROM products WHERE id NOT IN (SELECT product FROM product_keys)")
+        return count
+
+    def lookup(self, url: Optional[str] = None, identifiers: Optional[Dict[str, str]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Find a product by URL and/or identifiers.
+
+        Args:
+            url: Product page URL
+            identifiers: e.g. {"gtin": "0012345678905"}
+
+        Returns:
+            The stored product record, or None. Records without a long description
+            (which the lifecycle agents need) are treated as missing.
+        """
+        keys = []
+        if url:
+            keys += [canonical_url(url)] + identifiers_from_url(url)
+        keys += [identifier_key(field, value) for field, value in (identifiers or {}).items() if value]
+        db = self._connect()
+        for key in keys:
+            row = db.execute(
+                "SELECT record FROM products JOIN product_keys ON products.id = product_keys.product WHERE key = ?",
+                (key,)
+            ).fetchone()
+            if row:
+                record = json.loads(zlib.decompress(row[0]))
+                if record.get("long_description"):
+                    return record
+        return None
+
+    def __len__(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM products").fetchone()[0]
+
+
+def read_records(path: str) -> Iterator[Dict[str, Any]]:
+    """Read product records from a .jsonl or .csv file."""
+    with open(path, "r", newline="") as f:
+        if path.endswith(".csv"):
+            for row in csv.DictReader(f):
+                if row.get("product_image_urls"):
+                    row["product_image_urls"] = row["product_image_urls"].split()
+                if row.get("bill_of_materials"):
+                    row["bill_of_materials"] = json.loads(row["bill_of_materials"])
+                yield row
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+_catalogue: Optional[Catalogue] = None
+
+
+def get_catalogue() -> Optional[Catalogue]:
+    """The catalogue configured with CATALOGUE_PATH, or None if there isn't one."""
+    global _catalogue
+    path = os.environ.get("CATALOGUE_PATH")
+    if not path or not Path(path).exists():
+        return None
+    if _catalogue is None or _catalogue.path != path:
+        _catalogue = Catalogue(path)
+    return _catalogue
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk load product records into the catalogue index.")
+    parser.add_argument("files", nargs="+", help="JSONL or CSV files with product records")
+    parser.add_argument("--db", default=os.environ.get("CATALOGUE_PATH", "catalogue.db"), help="Catalogue file")
+    args = parser.parse_args()
+
+    catalogue = Catalogue(args.db)
+    for file in args.files:
+        print(f"Loaded {catalogue.add(read_records(file))} records from {file}")
+    print(f"{args.db} now holds {len(catalogue)} products")
@@ -0,0 +1,204 @@
+"""
+Product image extraction and fetching.
+
+extract_image_urls finds, de-duplicates and ranks product image URLs in
+scraped markdown/HTML without an LLM call. ImageFetcher downloads, downsizes
+and caches the top images over a pooled async HTTP client, returning base64
+JPEGs ready for vision queries (see page_analysis.query_images).
+"""
+
+import asyncio
+import base64
+import io
+import os
+import re
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import urljoin, urlparse
+
+import httpx
+from PIL import Image
+
+image_link_regex = r"https?://\S+?\.(?:jpg|jpeg|png|gif|svg|webp)(?:\?[\w=&%.\-]*)?"
+markdown_image_regex = r"!\[([^\]]*)\]\((\S+?)(?:\s+\"[^\"]*\")?\)"
+html_image_regex = r"<img\b[^>]*>"
+html_attr_regex = r"""([\w\-:]+)\s*=\s*(?:"([^"]*)"|'([^']*)')"""
+
+# Words that mark an image as something other than the product itself
+_NOT_PRODUCT_WORDS = ["logo", "icon", "sprite", "badge", "avatar", "favicon", "placeholder", "pixel", "tracking",
+                      "banner", "flag", "payment", "rating", "star", "social", "thumbnail-nav", "swatch", "loader"]
+# Size tokens in CDN URLs, e.g. _200x200, -300x, w_640, width=800
+_SIZE_TOKEN_REGEX = r"(?:[_\-](\d{2,4})x(\d{0,4})(?=[_.\-@])|[/,_]w_(\d{2,4})|[?&](?:w|width)=(\d{2,4}))"
+
+
+def _canonical(url: str) -> str:
+    """Key that treats size variants and query strings of the same image as one image."""
+    parsed = urlparse(url)
+    path = re.sub(r"[_\-]\d{2,4}x\d{0,4}(?=[_.\-@])|@\dx", "", parsed.path)
+    path = re.sub(r"/w_\d{2,4}[^/]*", "", path)
+    return parsed.netloc.lower() + path
+
+
+def _size_hint(url: str) -> Optional[int]:
+    match = re.search(_SIZE_TOKEN_REGEX, url)
+    if not match:
+        return None
+    return max(int(g) for g in match.groups() if g)
+
+
+def _score(url: str, alt: str, position: int, keywords: Iterable[str], is_og_image: bool) -> float:
+    text = f"{url} {alt}".lower()
+    score = 0.0
+    if is_og_image:
+        score += 4
+    if alt.strip():
+        score += 1
+    score += 2 * sum(1 for word in keywords if word in text)
+    if any(word in text for word in _NOT_PRODUCT_WORDS):
+        score -= 5
+    path = urlparse(url).path.lower()
+    if path.endswith((".svg", ".gif")):
+        score -= 3
+    size = _size_hint(url)
+    if size is not None:
+        score += 1 if size >= 500 else -3 if size <= 100 else 0
+    # Product images usually appear near the top of the page
+    score -= position * 0.05
+    return score
+
+
+def _html_images(html: str, base_url: str) -> List[tuple]:
+    images = []
+    for tag in re.findall(html_image_regex, html, re.IGNORECASE):
+        attrs = {m[0].lower(): m[1] or m[2] for m in re.findall(html_attr_regex, tag)}
+        src = attrs.get("data-src") or attrs.get("src") or ""
+        if not src and attrs.get("srcset"):
+            src = attrs["srcset"].split(",")[-1].strip().split(" ")[0]
+        if src and not src.startswith("data:"):
+            images.append((urljoin(base_url, src), attrs.get("alt", "")))
+    return images
+
+
+def extract_image_urls(markdown: str, html: Optional[str] = None, base_url: str = "",
+                       keywords: Iterable[str] = (), og_image: Optional[str] = None, limit: int = 10) -> List[str]:
+    """
+    Extract, de-duplicate and rank product image URLs from a scraped page.
+
+    Args:
+        markdown: The scraped markdown
+        html: The scraped HTML, if available (adds alt text and lazy-loaded images)
+        base_url: Page URL used to resolve relative image URLs
+        keywords: Words (e.g. from the page title) that suggest an image shows the product
+        og_image: The page's og:image, which is usually the main product image
+        limit: Maximum number of URLs to return
+
+    Returns:
+        Image URLs, best first
+    """
+    candidates = []
+    if og_image:
+        candidates.append((urljoin(base_url, og_image), ""))
+    candidates += [(urljoin(base_url, url), alt) for alt, url in re.findall(markdown_image_regex, markdown or "")]
+    if html:
+        candidates += _html_images(html, base_url)
+    candidates += [(url, "") for url in re.findall(image_link_regex, markdown or "")]
+
+    keywords = [word.lower() for word in keywords if len(word) > 2]
+    ranked = {}
+    for position, (url, alt) in enumerate(candidates):
+        if not url.startswith(("http://", "https://")):
+            continue
+        key = _canonical(url)
+        score = _score(url, alt, position, keywords, is_og_image=bool(og_image) and position == 0)
+        # Keep the best scoring variant of each image, and its best score
+        if key not in ranked or score > ranked[key][0]:
+            ranked[key] = (score, url)
+
+    best = sorted(ranked.values(), key=lambda item: item[0], reverse=True)
+    return [url for score, url in best if score > -3][:limit]
+
+
+class ImageFetcher:
+    """
+    Downloads, downsizes and caches images for vision queries.
+
+    A single pooled httpx.AsyncClient is shared by all fetches, concurrency is
+    bounded, and encoded images are kept in an LRU cache keyed by URL.
+    """
+
+    def __init__(self, max_side: int = 768, max_concurrency: int = 8, cache_size: int = 256, timeout: float = 10.0):
+        self.max_side = max_side
+        self.cache_size = cache_size
+        self.timeout = timeout
+        self._max_concurrency = max_concurrency
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop = None
+
+    async def _bind_loop(self):
+        # The client and semaphore belong to one event loop (batch runs may use several)
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # Rebind before awaiting, so concurrent fetches on this loop see the new state
+            old_client, self._client = self._client, None
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self._max_concurrency)
+            if old_client is not None:
+                # Connections opened on a loop that has since closed can't shut down cleanly
+                try:
+                    await old_client.aclose()
+                except Exception as e:
+                    print(f"Could not close the previous image client: {e}")
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                follow_redirects=True,
+                limits=httpx.Limits(max_connections=self._max_concurrency, max_keepalive_connections=self._max_concurrency),
+                headers={"User-Agent": "Mozilla/5.0 (compatible; footprint-any-product)"},
+            )
+        return self._client
+
+    def _downsize(self, data: bytes) -> str:
+        image = Image.open(io.BytesIO(data))
+        image.thumbnail((self.max_side, self.max_side))
+        buffer = io.BytesIO()
+        image.convert("RGB").save(buffer, format="JPEG", quality=85)
+        return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+    async def fetch(self, url: str) -> Optional[str]:
+        """Return the image as a base64 JPEG, or None if it can't be fetched or decoded."""
+        if url in self._cache:
+            self._cache.move_to_end(url)
+            return self._cache[url]
+        await self._bind_loop()
+        try:
+            async with self._semaphore:
+                response = await self._get_client().get(url)
+                response.raise_for_status()
+            encoded = await asyncio.to_thread(self._downsize, response.content)
+        except Exception as e:
+            print(f"Could not fetch image {url}: {e}")
+            return None
+
+        self._cache[url] = encoded
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return encoded
+
+    async def fetch_images(self, urls: List[str]) -> Dict[str, str]:
+        """Fetch several images concurrently, returning {url: base64 JPEG} for those that succeeded."""
+        encoded = await asyncio.gather(*[self.fetch(url) for url in urls])
+        return {url: image for url, image in zip(urls, encoded) if image is not None}
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+
+
+image_fetcher = ImageFetcher(
+    max_side=int(os.environ.get("PRODUCT_IMAGE_MAX_SIDE", 768)),
+    max_concurrency=int(os.environ.get("PRODUCT_IMAGE_FETCH_CONCURRENCY", 8)),
+)
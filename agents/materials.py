@@ -1,9 +1,11 @@
 from pydantic import BaseModel, Field
-from langchain_openai import ChatOpenAI
+from llm.models import get_chat_model
+from langchain_core.runnables import RunnableConfig
 from langgraph.prebuilt import create_react_agent
-from tools.calculator.calculator import calculator
-from tools.emissions_factors.emissions_factors import emissions_factor_finder_tool
+from tools.calculator.calculator import calculator, batch_calculator
+from tools.emissions_factors.emissions_factors import emissions_factor_finder_tool, emissions_factors_batch_finder_tool
 from .state import FootprintState
+from .transcript import compact_messages, store_transcript
 import os
 import logging
 import yaml
@@ -23,15 +25,15 @@ with open(_PROMPTS_FILE, 'r') as f:
 materials_agent_prompt_text = _prompts_data['materials_agent_prompt']
 
 materials_agent = create_react_agent(
-    model=ChatOpenAI(model_name="gpt-4.1-2025-04-14"),
-    tools=[emissions_factor_finder_tool, calculator],
+    model=get_chat_model(route="agents.materials"),
+    tools=[emissions_factor_finder_tool, emissions_factors_batch_finder_tool, calculator, batch_calculator],
     prompt=materials_agent_prompt_text,
     response_format=MaterialsResponse,
     name="materials_agent"
 )
 
-async def materials_phase(state: FootprintState):
-    input = f"""Brand: {state["brand"]}\nCategory: {state["category"]}\nDescription: {state["long_description"]}"""
+async def materials_phase(state: FootprintState, config: RunnableConfig):
+    input = f"""Brand: {state["brand"]}\nCategory: {state["category"]}\nDescription: {state["long_description"]}\nWeight: {state.get("weight_kg", 0)} kg\nMaterials: {state.get("material_description", "")}"""
     response = await materials_agent.ainvoke({
         "messages": [{"role": "user", "content": input}]
     })
@@ -46,9 +48,10 @@ async def materials_phase(state: FootprintState):
         "materials": {
             "carbon": response["structured_response"].carbon, 
             "summary": response["structured_response"].summary, 
-            "messages": response["messages"]
+            "messages": compact_messages(response["messages"])
         }
     }
+    store_transcript(config, "materials", response["messages"])
     
     logger.info(f"Materials Result has {len(result['materials']['messages'])} messages")
     return result
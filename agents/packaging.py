@@ -1,9 +1,11 @@
 from pydantic import BaseModel, Field
-from langchain_openai import ChatOpenAI
+from llm.models import get_chat_model
+from langchain_core.runnables import RunnableConfig
 from langgraph.prebuilt import create_react_agent
-from tools.calculator.calculator import calculator
-from tools.emissions_factors.emissions_factors import emissions_factor_finder_tool
+from tools.calculator.calculator import calculator, batch_calculator
+from tools.emissions_factors.emissions_factors import emissions_factor_finder_tool, emissions_factors_batch_finder_tool
 from .state import FootprintState
+from .transcript import compact_messages, store_transcript
 import os
 import logging
 import yaml
@@ -27,15 +29,15 @@ with open(_PROMPTS_FILE, 'r') as f:
 packaging_agent_prompt_text = _prompts_data['packaging_agent_prompt']
 
 packaging_agent = create_react_agent(
-    model=ChatOpenAI(model_name="gpt-4.1-2025-04-14"),
-    tools=[emissions_factor_finder_tool, calculator],
+    model=get_chat_model(route="agents.packaging"),
+    tools=[emissions_factor_finder_tool, emissions_factors_batch_finder_tool, calculator, batch_calculator],
     prompt=packaging_agent_prompt_text,
     response_format=PackagingResponse,
     name="packaging_agent"
 )
 
-async def packaging_phase(state: FootprintState):
-    input = f"""Brand: {state["brand"]}\nCategory: {state["category"]}\nDescription: {state["long_description"]}"""
+async def packaging_phase(state: FootprintState, config: RunnableConfig):
+    input = f"""Brand: {state["brand"]}\nCategory: {state["category"]}\nDescription: {state["long_description"]}\nWeight: {state.get("weight_kg", 0)} kg\nMaterials: {state.get("material_description", "")}"""
     response = await packaging_agent.ainvoke({
         "messages": [{"role": "user", "content": input}]
     })
@@ -50,9 +52,10 @@ async def packaging_phase(state: FootprintState):
         "packaging": {
             "carbon": response["structured_response"].carbon, 
             "summary": response["structured_response"].summary, 
-            "messages": response["messages"]
+            "messages": compact_messages(response["messages"])
         }
     }
+    store_transcript(config, "packaging", response["messages"])
     
     logger.info(f"Packaging Result has {len(result['packaging']['messages'])} messages")
     return result
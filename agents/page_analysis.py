@@ -2,80 +2,169 @@ import asyncio
 import os
 import re
 import yaml
+from functools import lru_cache
 from urllib.parse import urlparse
 from firecrawl import FirecrawlApp
 from typing import Dict, Any
-from .state import FootprintState
+from .state import FootprintState, PageDetailsState
+from .catalogue import get_catalogue
+from .images import extract_image_urls, image_fetcher
+from .page_context import build_page_context
 from langchain.schema import HumanMessage
-from langchain_openai import ChatOpenAI
+from llm.models import get_chat_model
+from llm.tracing import span
 from pathlib import Path
 
 api_key = os.environ["FIRECRAWL_API_KEY"]
-image_link_regex = r"https?://\S+\.(?:jpg|jpeg|png|gif|svg)(?:\?[\w=&]*)?"
 
 # Load prompts from YAML
 _PROMPTS_FILE = Path(__file__).parent / "prompts.yaml"
 with open(_PROMPTS_FILE, 'r') as f:
     _prompts_data = yaml.safe_load(f)
 
-image_question = _prompts_data['page_analysis_image_question']
 brand_question = _prompts_data['page_analysis_brand_question']
 category_question = _prompts_data['page_analysis_category_question']
 short_description_question = _prompts_data['page_analysis_short_description_question']
 long_description_question = _prompts_data['page_analysis_long_description_question']
 
-llm = ChatOpenAI(model_name="gpt-4.1-2025-04-14")
+@lru_cache(maxsize=None)
+def extractor_llm(field):
+    """The model for a page analysis extractor, from its route (page_analysis.<field>) in llm/routing.yaml."""
+    return get_chat_model(route=f"page_analysis.{field}")
+
+@lru_cache(maxsize=1)
+def firecrawl_app():
+    """The Firecrawl client, shared by all sessions."""
+    return FirecrawlApp(api_key=api_key)
 
 def trim_url(url):
     parsed = urlparse(url)
     return parsed.scheme + '://' + parsed.netloc + parsed.path
 
-def query_markdown(markdown, question):
-    return llm.invoke(f"{question} \n\n {markdown}").content
+def query_markdown(markdown, question, field="long_description"):
+    return extractor_llm(field).invoke(f"{question} \n\n {markdown}").content
+
+async def aquery_markdown(markdown, question, field="long_description"):
+    return (await extractor_llm(field).ainvoke(f"{question} \n\n {markdown}")).content
 
 def query_images(question, images):
-    return llm.invoke([
+    return extractor_llm("images").invoke([
         HumanMessage(content=[
             {"type": "text", "text": question},
             *[{"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image}"}} for image in images.values()]
         ])]).content
 
+async def aquery_image_urls(question, image_urls):
+    """Ask a vision question about images by URL, fetching them through the shared image cache."""
+    images = await image_fetcher.fetch_images(image_urls)
+    return (await extractor_llm("images").ainvoke([
+        HumanMessage(content=[
+            {"type": "text", "text": question},
+            *[{"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image}"}} for image in images.values()]
+        ])])).content
+
 
 async def page_analysis_phase(state: FootprintState) -> Dict[str, Any]:
     """
-    Analyzes the product URL using PageAnalyzer to extract initial product details.
+    Analyzes the product URL to extract the product details the lifecycle agents
+    need (brand, category, long description) and the product image URLs.
+
+    The remaining details are filled in by page_details_phase, which runs
+    alongside the lifecycle agents.
     """
-    await asyncio.sleep(0.1) # Small delay for streaming appearance
-    
-    # Scrape the markdown
-    product_url = trim_url(state["url"])
+    requested_url = state["url"]
+    product_url = trim_url(requested_url)
     state['url'] = product_url
-    markdown = FirecrawlApp(api_key=api_key).scrape_url(product_url, formats=['markdown']).markdown
+
+    # Known products are read from the local catalogue, with no scrape or LLM calls
+    catalogue = get_catalogue()
+    # The full URL, since the query may name the product or variant
+    record = catalogue.lookup(requested_url, state.get("identifiers")) if catalogue else None
+    if record:
+        print(f"Catalogue hit for {product_url}")
+        return {
+            "url": product_url,
+            "product_image_urls": record.get("product_image_urls", []),
+            "brand": record.get("brand", ""),
+            "category": record.get("category", ""),
+            "short_description": record.get("short_description", ""),
+            "long_description": record.get("long_description", ""),
+            **({"bill_of_materials": record["bill_of_materials"]} if record.get("bill_of_materials") else {}),
+            "messages": [
+                {"role": "ai", "content": f"Page analysis loaded from catalogue for {product_url}. Brand: {record.get('brand', '')}, Category: {record.get('category', '')}."}
+            ]
+        }
+
+    # Scrape the markdown (the Firecrawl client is synchronous, so keep it off the event loop)
+    with span("scrape", "scrape", url=product_url):
+        scrape = await asyncio.to_thread(firecrawl_app().scrape_url, product_url, formats=['markdown', 'html'])
+    markdown = scrape.markdown
     print(f"Scraped markdown for {product_url}")
 
-    # Extract images
-    image_urls_response = llm.invoke(f"{image_question} \n\n {markdown}").content
-    images = dict([(image_url, None) for image_url in re.findall(image_link_regex, image_urls_response)])
-    print(f"Extracted {len(images)} image urls from {product_url}")
-
-    # Extracted data
-    brand = query_markdown(markdown, brand_question)
-    category = query_markdown(markdown, category_question)
-    short_description = query_markdown(markdown, short_description_question)
-    long_description = query_markdown(markdown, long_description_question)
-    
-    # Limit product images to the first 10
-    image_urls = list(images.keys())[:10]
-    print(f"Limiting product images from {len(images)} to {len(image_urls)} (max 10)")
+    # Extract and rank product images deterministically (no LLM call)
+    metadata = scrape.metadata or {}
+    og_image = metadata.get("ogImage") or metadata.get("og:image")
+    title = metadata.get("title") or metadata.get("ogTitle") or ""
+    image_urls = extract_image_urls(
+        markdown,
+        html=scrape.html,
+        base_url=product_url,
+        keywords=title.split(),
+        og_image=og_image if isinstance(og_image, str) else None,
+        limit=10,
+    )
+    print(f"Extracted {len(image_urls)} product image urls from {product_url}")
+
+    # Strip boilerplate and fit the page into the token budget before asking questions
+    context, page_tokens = build_page_context(markdown)
+    print(f"Page context for {product_url}: {page_tokens['context']} of {page_tokens['raw']} tokens ({page_tokens['saved']} saved)")
+
+    # Extracted data the lifecycle agents need, asked concurrently
+    brand, category, long_description = await asyncio.gather(
+        aquery_markdown(context, brand_question, "brand"),
+        aquery_markdown(context, category_question, "category"),
+        aquery_markdown(context, long_description_question, "long_description"),
+    )
 
     return {
         "url": product_url,
         "product_image_urls": image_urls,
         "brand": brand,
         "category": category,
-        "short_description": short_description,
         "long_description": long_description,
-        "messages": state.get("messages", []) + [ # Append to existing messages
+        "page_tokens": page_tokens,
+        "page_context": context, # Private to page_details_phase, see PageDetailsState
+        "messages": [ # add_messages appends this to the existing messages
             {"role": "ai", "content": f"Page analysis complete for {product_url}. Brand: {brand}, Category: {category}."}
         ]
     }
+
+
+def short_description_from(long_description: str, max_words: int = 30) -> str:
+    """The first sentence of a long description, cut to max_words words."""
+    sentence = re.split(r"(?<=[.!?])\s+", long_description.strip(), maxsplit=1)[0]
+    words = sentence.split()
+    return " ".join(words[:max_words]) + ("..." if len(words) > max_words else "")
+
+
+async def page_details_phase(state: PageDetailsState) -> Dict[str, Any]:
+    """
+    Fills in the product details the lifecycle agents don't need (the short
+    description) and optionally warms the image cache, while the agents run.
+    """
+    # Clear the page context once read, so it doesn't stay in the state
+    updates = {"page_context": None}
+    context = state.get("page_context")
+    if not state.get("short_description"):
+        if context:
+            updates["short_description"] = await aquery_markdown(context, short_description_question, "short_description")
+        else:
+            # No page to ask (e.g. a catalogue record without one), so use the long description
+            updates["short_description"] = short_description_from(state.get("long_description", ""))
+
+    # Optionally warm the image cache so later vision queries don't wait on downloads
+    prefetch = int(os.environ.get("PREFETCH_PRODUCT_IMAGES", 0))
+    if prefetch:
+        await image_fetcher.fetch_images(state.get("product_image_urls", [])[:prefetch])
+
+    return updates
@@ -0,0 +1,182 @@
+"""
+Markdown pre-processing for page analysis.
+
+Scraped retail pages carry navigation, footers, reviews and related products
+alongside the product itself. build_page_context strips that boilerplate,
+keeps product-relevant sections first and fits the result into a token budget
+so that every page-analysis question is sent a small, focused context.
+"""
+
+import os
+import re
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+import tiktoken
+
+DEFAULT_TOKEN_BUDGET = 8000
+
+# Sections whose heading contains one of these words or phrases are dropped
+_BOILERPLATE_HEADINGS = [
+    r"reviews?", r"ratings?", r"q&a", r"questions?", r"customers also", r"customers who", r"you may also",
+    r"you might also", r"related", r"recommended", r"recently viewed", r"similar", r"compare", r"more from",
+    r"shop the look", r"complete the look", r"frequently bought", r"sponsored", r"newsletters?", r"sign up",
+    r"join", r"footer", r"follow us", r"connect with us", r"customer service", r"help", r"privacy", r"cookies?",
+    r"careers", r"about us", r"store locator", r"gift cards?", r"accessibility", r"legal", r"terms",
+]
+# Sections whose heading contains one of these are kept first when over budget, and
+# are never dropped as boilerplate ("Power Rating", "Helpful Specifications")
+_PRODUCT_HEADINGS = [
+    r"specs?", r"specifications?", r"details?", r"features?", r"materials?", r"composition", r"fabrics?",
+    r"dimensions?", r"sizes?", r"sizing", r"weights?", r"overview", r"description", r"about this", r"product details",
+    r"product information", r"made (?:in|of|from|with)", r"origin", r"care", r"construction", r"power", r"battery",
+    r"batteries", r"energy", r"what's in the box", r"included", r"sustainab\w*",
+]
+
+
+def _heading_regex(phrases: List[str]) -> re.Pattern:
+    # Whole words only, so "help" doesn't match "helpful" nor "rating" "operating"
+    return re.compile(r"(?<!\w)(?:" + "|".join(phrases) + r")(?!\w)")
+
+
+_BOILERPLATE_REGEX = _heading_regex(_BOILERPLATE_HEADINGS)
+_PRODUCT_REGEX = _heading_regex(_PRODUCT_HEADINGS)
+
+_IMAGE_REGEX = r"!\[([^\]]*)\]\([^)]*\)"
+_LINK_REGEX = r"\[([^\]]*)\]\([^)]*\)"
+_HEADING_REGEX = r"^(#{1,6})\s+(.*)$"
+
+
+# Characters per token of the approximate count used without the tiktoken encoding
+_CHARS_PER_TOKEN = 4
+
+
+class _ApproximateEncoding:
+    """Stand-in for the tiktoken encoding: fixed-size character chunks as tokens."""
+
+    def encode(self, text: str) -> List[str]:
+        return [text[i:i + _CHARS_PER_TOKEN] for i in range(0, len(text), _CHARS_PER_TOKEN)]
+
+    def decode(self, tokens: List[str]) -> str:
+        return "".join(tokens)
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    # tiktoken downloads the encoding on first use; without network access
+    # token counts are approximated instead of failing every page analysis
+    try:
+        return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        print(f"Page context: Could not load the o200k_base encoding ({e}), approximating token counts")
+        return _ApproximateEncoding()
+
+
+def count_tokens(text: str) -> int:
+    return len(_encoding().encode(text))
+
+
+def _truncate_tokens(text: str, max_tokens: int) -> str:
+    tokens = _encoding().encode(text)
+    return text if len(tokens) <= max_tokens else _encoding().decode(tokens[:max_tokens])
+
+
+def _clean_line(line: str) -> str:
+    line = re.sub(_IMAGE_REGEX, lambda m: m.group(1), line)
+    return re.sub(_LINK_REGEX, lambda m: m.group(1), line).strip()
+
+
+def _is_navigation(line: str) -> bool:
+    """Lines that are (almost) only links, like menus and breadcrumbs."""
+    links = re.findall(_LINK_REGEX, line)
+    if not links:
+        return False
+    text = _clean_line(line)
+    link_text = sum(len(link) for link in links)
+    return (len(links) > 1 and link_text >= 0.7 * len(text)) or (len(links) == 1 and len(text.split()) <= 3)
+
+
+def _sections(markdown: str) -> List[Tuple[str, List[str]]]:
+    sections = [("", [])]
+    for line in markdown.splitlines():
+        heading = re.match(_HEADING_REGEX, line.strip())
+        if heading:
+            sections.append((_clean_line(heading.group(2)).lower(), [_clean_line(line)]))
+        else:
+            sections[-1][1].append(line)
+    return sections
+
+
+def strip_boilerplate(markdown: str) -> str:
+    """Remove navigation, boilerplate sections, link/image markup and repeated lines."""
+    kept = []
+    seen = set()
+    for heading, lines in _sections(markdown or ""):
+        if not _PRODUCT_REGEX.search(heading) and _BOILERPLATE_REGEX.search(heading):
+            continue
+        section = []
+        for line in lines:
+            if _is_navigation(line):
+                continue
+            cleaned = _clean_line(line)
+            # Menus and legal text are often repeated across the page
+            if cleaned and cleaned in seen and len(cleaned) < 200:
+                continue
+            seen.add(cleaned)
+            section.append(cleaned)
+        text = re.sub(r"\n{3,}", "\n\n", "\n".join(section)).strip()
+        if text:
+            kept.append((heading, text))
+    return "\n\n".join(text for _, text in kept)
+
+
+def build_page_context(markdown: str, token_budget: int = None) -> Tuple[str, Dict[str, int]]:
+    """
+    Build the context sent with page-analysis questions.
+
+    Args:
+        markdown: The raw scraped markdown
+        token_budget: Maximum context size in tokens. Defaults to
+            PAGE_ANALYSIS_TOKEN_BUDGET or 8000.
+
+    Returns:
+        The context text and token statistics ({"raw", "context", "saved"})
+    """
+    if token_budget is None:
+        token_budget = int(os.environ.get("PAGE_ANALYSIS_TOKEN_BUDGET", DEFAULT_TOKEN_BUDGET))
+
+    raw_tokens = count_tokens(markdown or "")
+    sections = []
+    for i, (heading, lines) in enumerate(_sections(strip_boilerplate(markdown))):
+        text = "\n".join(lines).strip()
+        if text:
+            sections.append((i, heading, text, count_tokens(text)))
+
+    if sum(tokens for *_, tokens in sections) > token_budget:
+        # The top of the page (title, price, summary) comes first, then product sections
+        first = sections[0][0]
+        def priority(section):
+            i, heading, _, _ = section
+            if i == first:
+                return 0
+            return 1 if _PRODUCT_REGEX.search(heading) else 2
+        selected = []
+        remaining = token_budget
+        for section in sorted(sections, key=priority):
+            if remaining <= 0:
+                break
+            i, heading, text, tokens = section
+            if tokens > remaining:
+                # A few tokens of a section are more noise than signal
+                if remaining < 50:
+                    continue
+                text = _truncate_tokens(text, remaining)
+                tokens = remaining
+            selected.append((i, heading, text, tokens))
+            remaining -= tokens
+        # Restore page order
+        sections = sorted(selected)
+
+    context = "\n\n".join(text for _, _, text, _ in sections)
+    context_tokens = count_tokens(context)
+    return context, {"raw": raw_tokens, "context": context_tokens, "saved": raw_tokens - context_tokens}
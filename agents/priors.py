@@ -0,0 +1,321 @@
+"""
+Category prior index of past footprints.
+
+Keeps the typical footprint of each lifecycle phase (and the total) by
+normalised product category, so a provisional estimate with a range can be
+shown as soon as page analysis knows the category, and agent results far
+outside what the category usually gets can be flagged.
+
+Footprints of a category spread over orders of magnitude, so each phase is
+modelled as log-normal: the index stores the count, sum and sum of squares of
+log footprints per (category, phase). Estimates are the geometric mean with a
+90% range, and completed analyses are added one at a time (leaving out results
+flagged as outliers). Reference bounds for totals (co2_ref.csv) are kept
+alongside and reported with the estimate.
+
+Lookups fall back from the full category to shorter ones ("ergonomic office
+chair", "office chair", "chair") until one has enough samples.
+
+Bulk load past results with:
+    python -m agents.priors results/interim_results.json notebooks/data/carbon_footprint_analyses_*.csv notebooks/data/co2_ref.csv --db priors.db
+
+Accepted files are batch results (JSON or JSONL records with a "category" and
+"carbon_by_phase"/"carbon_total", or "phases" as stored by jobs), analysis
+CSVs with "item" and "total_carbon" columns, and reference CSVs with "item",
+"lbound" and "ubound" columns.
+
+Configured with environment variables:
+- PRIORS_PATH: Prior index file, created if missing (unset disables priors).
+- PRIOR_MIN_SAMPLES: Samples a phase needs before it is estimated (default 3).
+- PRIOR_OUTLIER_Z: Log-space standard deviations from the category mean at
+  which a result is flagged (default 3).
+"""
+
+import argparse
+import csv
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+PRIOR_PHASES = ["materials", "manufacturing", "packaging", "transportation", "use", "eol", "total"]
+
+# Footprints are floored here before taking logs (some results are 0)
+_MIN_FOOTPRINT = 1e-4
+# Floor of the log-space spread, so categories with a few close samples don't
+# flag everything (0.35 is about a factor of 1.4 per standard deviation)
+_MIN_LOG_SD = 0.35
+# z of the two-sided 90% range
+_RANGE_Z = 1.645
+
+
+def normalize_category(category: str) -> str:
+    """Lower-cased words, separators as spaces, last word singular ("Office_Chairs" -> "office chair")."""
+    words = re.sub(r"[^a-z0-9]+", " ", category.lower()).split()
+    if not words:
+        return ""
+    last = words[-1]
+    if last.endswith("ies") and len(last) > 4:
+        last = last[:-3] + "y"
+    elif re.search(r"(s|x|ch|sh)es$", last):
+        last = last[:-2]
+    elif last.endswith("s") and not last.endswith("ss") and len(last) > 3:
+        last = last[:-1]
+    return " ".join(words[:-1] + [last])
+
+
+def _candidates(category: str) -> List[str]:
+    words = normalize_category(category).split()
+    return [" ".join(words[i:]) for i in range(len(words))]
+
+
+class PriorIndex:
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as db:
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS priors (
+                    category TEXT NOT NULL,
+                    phase TEXT NOT NULL,
+                    n INTEGER NOT NULL,
+                    sum_log REAL NOT NULL,
+                    sum_log_sq REAL NOT NULL,
+                    PRIMARY KEY (category, phase)
+                ) WITHOUT ROWID
+            """)
+            db.execute("CREATE TABLE IF NOT EXISTS reference_bounds (category TEXT PRIMARY KEY, low REAL NOT NULL, high REAL NOT NULL) WITHOUT ROWID")
+
+    def _connect(self) -> sqlite3.Connection:
+        # sqlite3 connections can't be shared between threads
+        if getattr(self._local, "db", None) is None:
+            self._local.db = sqlite3.connect(self.path)
+        return self._local.db
+
+    def add(self, category: str, footprints: Dict[str, float]) -> None:
+        """Add one analysis's footprints (kg CO2e by phase, and optionally "total")."""
+        key = normalize_category(category)
+        rows = []
+        for phase, value in footprints.items():
+            if phase not in PRIOR_PHASES or value is None:
+                continue
+            log = math.log(max(float(value), _MIN_FOOTPRINT))
+            rows.append((key, phase, log, log * log))
+        if not key or not rows:
+            return
+        db = self._connect()
+        with db:
+            db.executemany("""
+                INSERT INTO priors (category, phase, n, sum_log, sum_log_sq) VALUES (?, ?, 1, ?, ?)
+                ON CONFLICT (category, phase) DO UPDATE SET
+                    n = n + 1, sum_log = sum_log + excluded.sum_log, sum_log_sq = sum_log_sq + excluded.sum_log_sq
+            """, rows)
+
+    def add_bounds(self, category: str, low: float, high: float) -> None:
+        """Set the reference range of a category's total footprint."""
+        db = self._connect()
+        with db:
+            db.execute("INSERT OR REPLACE INTO reference_bounds (category, low, high) VALUES (?, ?, ?)",
+                       (normalize_category(category), low, high))
+
+    def _stats(self, category: str) -> Dict[str, Tuple[int, float, float]]:
+        """(n, mean, sd) of log footprints by phase."""
+        stats = {}
+        rows = self._connect().execute("SELECT phase, n, sum_log, sum_log_sq FROM priors WHERE category = ?", (category,))
+        for phase, n, sum_log, sum_log_sq in rows:
+            mean = sum_log / n
+            variance = (sum_log_sq - n * mean * mean) / (n - 1) if n > 1 else 0.0
+            stats[phase] = (n, mean, max(math.sqrt(max(variance, 0.0)), _MIN_LOG_SD))
+        return stats
+
+    def _match(self, category: str, min_samples: int) -> Tuple[Optional[str], Dict[str, Tuple[int, float, float]]]:
+        """The most specific stored category with a phase of at least min_samples samples, and its statistics."""
+        for candidate in _candidates(category):
+            stats = {phase: s for phase, s in self._stats(candidate).items() if s[0] >= min_samples}
+            if stats:
+                return candidate, stats
+        return None, {}
+
+    def _bounds(self, category: str) -> Optional[Dict[str, float]]:
+        for candidate in _candidates(category):
+            row = self._connect().execute("SELECT low, high FROM reference_bounds WHERE category = ?", (candidate,)).fetchone()
+            if row:
+                return {"category": candidate, "low": row[0], "high": row[1]}
+        return None
+
+    def estimate(self, category: str, min_samples: int = 3) -> Optional[Dict[str, Any]]:
+        """
+        Provisional footprint of a category.
+
+        Returns:
+            {"category" (as asked), "matched" (the stored category used),
+            "by_phase": {phase: {"estimate", "low", "high", "samples"}},
+            "total" (same fields, or the sum of the phase estimates), "reference"
+            (bounds of the total, if known)}, or None if nothing is known
+        """
+        matched, stats = self._match(category, min_samples)
+        reference = self._bounds(category)
+        if matched is None and reference is None:
+            return None
+        by_phase = {
+            phase: {
+                "estimate": math.exp(mean),
+                "low": math.exp(mean - _RANGE_Z * sd),
+                "high": math.exp(mean + _RANGE_Z * sd),
+                "samples": n,
+            }
+            for phase, (n, mean, sd) in stats.items()
+        }
+        total = by_phase.pop("total", None)
+        if total is None and by_phase and all(phase in by_phase for phase in PRIOR_PHASES[:-1]):
+            total = {field: sum(p[field] for p in by_phase.values()) for field in ("estimate", "low", "high")}
+            total["samples"] = min(p["samples"] for p in by_phase.values())
+        return {"category": category, "matched": matched, "by_phase": by_phase, "total": total, "reference": reference}
+
+    def check(self, category: str, phase: str, value: float, min_samples: int = 3, z: float = 3.0) -> Optional[Dict[str, Any]]:
+        """
+        Compare a result with the category prior.
+
+        Returns:
+            {"phase", "value", "expected", "low", "high", "z", "samples",
+            "category"} if the value is more than z log-space standard deviations
+            from the category mean, otherwise None
+        """
+        matched, stats = self._match(category, min_samples)
+        if phase not in stats or value is None:
+            return None
+        n, mean, sd = stats[phase]
+        score = (math.log(max(float(value), _MIN_FOOTPRINT)) - mean) / sd
+        if abs(score) <= z:
+            return None
+        return {
+            "phase": phase,
+            "value": value,
+            "expected": math.exp(mean),
+            "low": math.exp(mean - _RANGE_Z * sd),
+            "high": math.exp(mean + _RANGE_Z * sd),
+            "z": round(score, 2),
+            "samples": n,
+            "category": matched,
+        }
+
+    def __len__(self) -> int:
+        return self._connect().execute("SELECT COUNT(DISTINCT category) FROM priors").fetchone()[0]
+
+
+def read_observations(path: str) -> Iterator[Tuple[str, str, Any]]:
+    """
+    Read ("footprints", category, {phase: kg}) and ("bounds", category, (low, high))
+    entries from a batch results, analysis CSV or reference CSV file.
+    """
+    with open(path, "r", newline="") as f:
+        if path.endswith(".csv"):
+            for row in csv.DictReader(f):
+                row = {(key or "").strip(): (value or "").strip() for key, value in row.items()}
+                category = row.get("category") or row.get("item")
+                if not category:
+                    continue
+                if row.get("lbound") and row.get("ubound"):
+                    yield "bounds", category, (float(row["lbound"]), float(row["ubound"]))
+                elif row.get("total_carbon"):
+                    yield "footprints", category, {"total": float(row["total_carbon"])}
+            return
+        text = f.read()
+    records = json.loads(text) if text.lstrip().startswith("[") else [json.loads(line) for line in text.splitlines() if line.strip()]
+    for record in records:
+        if not record.get("category") or record.get("success") is False:
+            continue
+        footprints = dict(record.get("carbon_by_phase") or {})
+        if not footprints and record.get("phases"):
+            footprints = {phase: value.get("carbon") for phase, value in record["phases"].items()}
+        # Partial results (e.g. stopped at a deadline) don't have a comparable total
+        footprint = record.get("footprint") or {}
+        if record.get("carbon_total") is not None and not footprint.get("missing") and not footprint.get("partial"):
+            footprints["total"] = record["carbon_total"]
+        if footprints:
+            yield "footprints", record["category"], footprints
+
+
+def load_observations(index: PriorIndex, observations: Iterable[Tuple[str, str, Any]]) -> int:
+    """
+    Returns:
+        The number of observations added
+    """
+    count = 0
+    for kind, category, value in observations:
+        if kind == "bounds":
+            index.add_bounds(category, *value)
+        else:
+            index.add(category, value)
+        count += 1
+    return count
+
+
+_priors: Optional[PriorIndex] = None
+
+
+def get_priors() -> Optional[PriorIndex]:
+    """The prior index configured with PRIORS_PATH, or None if there isn't one."""
+    global _priors
+    path = os.environ.get("PRIORS_PATH")
+    if not path:
+        return None
+    if _priors is None or _priors.path != path:
+        _priors = PriorIndex(path)
+    return _priors
+
+
+def prior_estimate(category: Optional[str]) -> Optional[Dict[str, Any]]:
+    """The configured index's estimate for a category, or None."""
+    priors = get_priors()
+    if priors is None or not category:
+        return None
+    return priors.estimate(category, int(os.environ.get("PRIOR_MIN_SAMPLES", 3)))
+
+
+def prior_check(category: Optional[str], phase: str, value: Optional[float]) -> Optional[Dict[str, Any]]:
+    """The configured index's outlier check of a result, or None if it is not an outlier."""
+    priors = get_priors()
+    if priors is None or not category:
+        return None
+    return priors.check(category, phase, value, int(os.environ.get("PRIOR_MIN_SAMPLES", 3)),
+                        float(os.environ.get("PRIOR_OUTLIER_Z", 3)))
+
+
+def record_analysis(category: Optional[str], phase_results: Dict[str, Dict[str, Any]], complete: bool) -> None:
+    """
+    Add a finished analysis's freshly computed phase results to the configured
+    index. The total is only added when every phase was computed (complete).
+    Results flagged by prior_check are left out, since they would widen the
+    very prior that flagged them; the total is left out with them.
+    """
+    priors = get_priors()
+    if priors is None or not category:
+        return
+    footprints = {phase: result["carbon"] for phase, result in phase_results.items()
+                  if isinstance(result, dict) and result.get("carbon") is not None}
+    if complete and all(phase in footprints for phase in PRIOR_PHASES[:-1]):
+        footprints["total"] = sum(footprints[phase] for phase in PRIOR_PHASES[:-1])
+    outliers = [phase for phase, value in footprints.items() if prior_check(category, phase, value)]
+    if outliers:
+        print(f"Priors: Not recording outlier results of {category}: {', '.join(outliers)}")
+        footprints = {phase: value for phase, value in footprints.items() if phase not in outliers and phase != "total"}
+    try:
+        priors.add(category, footprints)
+    except sqlite3.Error as e:
+        print(f"Priors: Could not record the analysis of {category}: {e}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk load past results into the category prior index.")
+    parser.add_argument("files", nargs="+", help="Batch results (JSON/JSONL), analysis CSVs or reference bound CSVs")
+    parser.add_argument("--db", default=os.environ.get("PRIORS_PATH", "priors.db"), help="Prior index file")
+    args = parser.parse_args()
+
+    index = PriorIndex(args.db)
+    for file in args.files:
+        print(f"Loaded {load_observations(index, read_observations(file))} observations from {file}")
+    print(f"{args.db} now holds priors for {len(index)} categories")
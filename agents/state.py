@@ -2,9 +2,10 @@ from typing import Annotated, TypedDict
 from langgraph.graph import START, END
 from langgraph.graph.message import add_messages
 from pydantic import Field
+from .transcript import TranscriptRecord
 
 class PhaseData(TypedDict):
-    messages: list
+    messages: list[TranscriptRecord] # Compact transcript, see agents/transcript.py
     summary: str
     carbon: float
 
@@ -13,17 +14,26 @@ class FootprintState(TypedDict):
     messages: Annotated[list, add_messages]
     user_input: str = Field(default="")
     url: str
+    identifiers: dict # Optional product identifiers (e.g. {"gtin": ...}) used for catalogue lookups
     brand: str
     category: str
     short_description: str
     long_description: str
+    bill_of_materials: dict # {"components": [{"component", "material", "mass_kg", "recycled_content"}], "total_mass_kg", "assumptions"}, see agents/bill_of_materials.py
     material_description: str # A natural language description of the materials in the product
     product_image_urls: list[str]
+    page_tokens: dict # Token counts of the scraped page and of the context sent to page analysis ({"raw", "context", "saved"})
     weight_kg: float
-    planner: PhaseData
     materials: PhaseData
     manufacturing: PhaseData
     packaging: PhaseData
     transportation: PhaseData
     use: PhaseData
     eol: PhaseData
+    footprint: dict # Set by the summarizer: {"total", "by_phase", "missing", "partial"} (see api.graph.footprint)
+
+# The state page_details_phase reads. page_context (the page markdown page
+# analysis asked its questions of) is a private channel: it isn't in the graph
+# output, and page_details_phase clears it once the short description is asked
+class PageDetailsState(FootprintState):
+    page_context: str
@@ -0,0 +1,162 @@
+"""
+Compact agent transcripts.
+
+Phases store a compact transcript in FootprintState instead of the full list of
+LangChain message objects returned by their ReAct agent. Every record has the
+same fixed set of fields so state stays small when it is streamed and
+checkpointed. If TRANSCRIPT_STORE_DIR is set, the full transcripts are written
+to a side store as JSONL, one file per session, phase and run of the phase.
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional, TypedDict
+
+from langchain_core.messages import BaseMessage, message_to_dict
+
+DEFAULT_MAX_CONTENT_CHARS = 2000
+
+_ROLES = {"human": "human", "ai": "ai", "tool": "tool", "system": "system"}
+
+
+class ToolCallRecord(TypedDict):
+    name: str
+    args: Dict[str, Any]
+    id: str
+
+
+class TranscriptRecord(TypedDict):
+    role: str
+    content: str
+    tool_calls: List[ToolCallRecord]
+    tool_call_id: Optional[str]
+    name: Optional[str]
+
+
+def _truncate(text: str, max_chars: int) -> str:
+    return text if len(text) <= max_chars else text[:max_chars - 3] + "..."
+
+
+def _content_text(content: Any) -> str:
+    # Multi-part content (e.g. text + images) keeps only its text parts
+    if isinstance(content, list):
+        return "\n".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+    return "" if content is None else str(content)
+
+
+def compact_message(message: Any, max_content_chars: int = DEFAULT_MAX_CONTENT_CHARS) -> TranscriptRecord:
+    """Convert a LangChain message (or message dict) into a TranscriptRecord."""
+    if isinstance(message, BaseMessage):
+        role = _ROLES.get(message.type, message.type)
+        content = message.content
+        tool_calls = getattr(message, "tool_calls", None) or []
+        tool_call_id = getattr(message, "tool_call_id", None)
+        name = message.name
+    else:
+        role = message.get("role", "")
+        content = message.get("content")
+        tool_calls = message.get("tool_calls") or []
+        tool_call_id = message.get("tool_call_id")
+        name = message.get("name")
+
+    return {
+        "role": role,
+        "content": _truncate(_content_text(content), max_content_chars),
+        "tool_calls": [
+            {
+                "name": call.get("name", ""),
+                "args": {
+                    key: _truncate(value, max_content_chars) if isinstance(value, str) else value
+                    for key, value in (call.get("args") or {}).items()
+                },
+                "id": call.get("id") or "",
+            }
+            for call in tool_calls
+        ],
+        "tool_call_id": tool_call_id,
+        "name": name,
+    }
+
+
+def compact_messages(messages: List[Any], max_content_chars: Optional[int] = None) -> List[TranscriptRecord]:
+    """
+    Convert an agent's messages into compact transcript records.
+
+    Args:
+        messages: LangChain messages (or message dicts) from an agent response
+        max_content_chars: Content truncation length. Defaults to
+            TRANSCRIPT_MAX_CONTENT_CHARS or 2000.
+
+    Returns:
+        List of TranscriptRecord dicts
+    """
+    if max_content_chars is None:
+        max_content_chars = int(os.environ.get("TRANSCRIPT_MAX_CONTENT_CHARS", DEFAULT_MAX_CONTENT_CHARS))
+    return [compact_message(message, max_content_chars) for message in messages]
+
+
+def session_id(config: Optional[Dict[str, Any]]) -> str:
+    """The session (thread) id of a graph run."""
+    return ((config or {}).get("configurable") or {}).get("thread_id") or "default"
+
+
+def store_transcript(config: Optional[Dict[str, Any]], phase: str, messages: List[Any]) -> Optional[Path]:
+    """
+    Write a phase's full transcript to the side store, if one is configured.
+    Every run of a phase in a session gets its own file, <phase>.<run>.jsonl,
+    so re-running a phase keeps the earlier transcripts.
+
+    Returns:
+        The path written to, or None when TRANSCRIPT_STORE_DIR is not set
+    """
+    store_dir = os.environ.get("TRANSCRIPT_STORE_DIR")
+    if not store_dir:
+        return None
+
+    directory = Path(store_dir) / session_id(config)
+    directory.mkdir(parents=True, exist_ok=True)
+    run = len(_transcript_paths(directory, phase)) + 1
+    while True:
+        path = directory / f"{phase}.{run}.jsonl"
+        try:
+            # Exclusive creation, so concurrent runs of a phase don't share a file
+            f = open(path, "x")
+            break
+        except FileExistsError:
+            run += 1
+    with f:
+        for message in messages:
+            record = message_to_dict(message) if isinstance(message, BaseMessage) else message
+            f.write(json.dumps(record, default=str) + "\n")
+    return path
+
+
+def _transcript_paths(directory: Path, phase: str) -> List[Path]:
+    """A phase's transcript files in a session directory, oldest run first."""
+    runs = [(int(path.name.split(".")[-2]), path) for path in directory.glob(f"{phase}.*.jsonl")
+            if path.name.split(".")[-2].isdigit()]
+    return [path for _, path in sorted(runs)]
+
+
+def load_transcripts(session: str, phase: str) -> List[List[Dict[str, Any]]]:
+    """Read every stored run of a phase's full transcript back from the side store, oldest first."""
+    directory = Path(os.environ.get("TRANSCRIPT_STORE_DIR", "")) / session
+    transcripts = []
+    for path in _transcript_paths(directory, phase):
+        with open(path, "r") as f:
+            transcripts.append([json.loads(line) for line in f if line.strip()])
+    return transcripts
+
+
+def load_transcript(session: str, phase: str) -> List[Dict[str, Any]]:
+    """
+    Read the latest run of a phase's full transcript back from the side store.
+
+    Raises:
+        FileNotFoundError: If no transcript of the phase was stored in the session
+    """
+    transcripts = load_transcripts(session, phase)
+    if not transcripts:
+        raise FileNotFoundError(f"No {phase} transcript stored for session {session}")
+    return transcripts[-1]
@@ -1,9 +1,11 @@
 from pydantic import BaseModel, Field
-from langchain_openai import ChatOpenAI
+from llm.models import get_chat_model
+from langchain_core.runnables import RunnableConfig
 from langgraph.prebuilt import create_react_agent
-from tools.calculator.calculator import calculator
-from tools.emissions_factors.emissions_factors import emissions_factor_finder_tool
+from tools.calculator.calculator import calculator, batch_calculator
+from tools.emissions_factors.emissions_factors import emissions_factor_finder_tool, emissions_factors_batch_finder_tool
 from .state import FootprintState
+from .transcript import compact_messages, store_transcript
 import os
 import logging
 import yaml
@@ -23,14 +25,14 @@ with open(_PROMPTS_FILE, 'r') as f:
 use_agent_prompt_text = _prompts_data['use_agent_prompt']
 
 use_agent = create_react_agent(
-    model=ChatOpenAI(model_name="gpt-4.1-2025-04-14"),
-    tools=[emissions_factor_finder_tool, calculator],
+    model=get_chat_model(route="agents.use"),
+    tools=[emissions_factor_finder_tool, emissions_factors_batch_finder_tool, calculator, batch_calculator],
     prompt=use_agent_prompt_text,
     response_format=UseResponse,
     name="use_agent"
 )
 
-async def use_phase(state: FootprintState):
+async def use_phase(state: FootprintState, config: RunnableConfig):
     input = f"""Brand: {state["brand"]}\nCategory: {state["category"]}\nDescription: {state["long_description"]}"""
     response = await use_agent.ainvoke({
         "messages": [{"role": "user", "content": input}]
@@ -46,9 +48,10 @@ async def use_phase(state: FootprintState):
         "use": {
             "carbon": response["structured_response"].carbon, 
             "summary": response["structured_response"].summary, 
-            "messages": response["messages"]
+            "messages": compact_messages(response["messages"])
         }
     }
+    store_transcript(config, "use", response["messages"])
     
     logger.info(f"Use Phase Result has {len(result['use']['messages'])} messages")
     return result
@@ -0,0 +1,115 @@
+"""
+Admission control for interactive analyses.
+
+Each analysis runs six agents and dozens of LLM calls, so a burst of
+WebSocket sessions can exhaust the LLM quota and the process. At most
+max_concurrent analyses run at once; further sessions wait in a FIFO queue
+and are told their position as it changes. When max_queued sessions are
+already waiting, new sessions are shed instead of queued.
+"""
+
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+
+class AdmissionRejected(Exception):
+    """Raised when the queue is full and a session is shed."""
+
+
+class _Waiter:
+    def __init__(self):
+        self.admitted = asyncio.get_running_loop().create_future()
+        self.moved = asyncio.Event()
+
+
+class AdmissionController:
+    def __init__(self, max_concurrent: int, max_queued: int):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self._running = 0
+        self._waiters: Deque[_Waiter] = deque()
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self._waited = 0
+        self._total_wait = 0.0
+
+    async def acquire(self, on_position: Optional[Callable[[int], Awaitable[Any]]] = None) -> None:
+        """
+        Wait for a slot to run an analysis. Slots are handed out in arrival order.
+
+        Args:
+            on_position: Called with the 1-based queue position when the session
+                is queued and whenever its position changes
+
+        Raises:
+            AdmissionRejected: If the queue is full
+        """
+        if self._running < self.max_concurrent and not self._waiters:
+            self._running += 1
+            self.admitted += 1
+            return
+        if len(self._waiters) >= self.max_queued:
+            self.rejected += 1
+            raise AdmissionRejected(f"{self._running} analyses running and {len(self._waiters)} queued")
+
+        waiter = _Waiter()
+        self._waiters.append(waiter)
+        self.queued += 1
+        started = time.monotonic()
+        try:
+            while not waiter.admitted.done():
+                waiter.moved.clear()
+                if on_position is not None:
+                    await on_position(self._waiters.index(waiter) + 1)
+                # Wake up when admitted or when someone ahead leaves the queue
+                moved = asyncio.create_task(waiter.moved.wait())
+                try:
+                    await asyncio.wait({waiter.admitted, moved}, return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    moved.cancel()
+        except BaseException:
+            if waiter.admitted.done():
+                # The slot was handed over just as the session went away
+                self.release()
+            else:
+                self._waiters.remove(waiter)
+                self._notify_moved()
+            raise
+        self._total_wait += time.monotonic() - started
+        self._waited += 1
+        self.admitted += 1
+
+    def release(self) -> None:
+        """Free a slot, handing it straight to the first waiting session."""
+        if self._waiters:
+            # The slot passes to the waiter, so the running count is unchanged
+            self._waiters.popleft().admitted.set_result(None)
+            self._notify_moved()
+        else:
+            self._running -= 1
+
+    def _notify_moved(self) -> None:
+        for waiter in self._waiters:
+            waiter.moved.set()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queued": self.max_queued,
+            "running": self._running,
+            "waiting": len(self._waiters),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "mean_wait_seconds": self._total_wait / self._waited if self._waited else 0.0,
+        }
+
+
+admission = AdmissionController(
+    max_concurrent=int(os.environ.get("MAX_CONCURRENT_ANALYSES", 8)),
+    max_queued=int(os.environ.get("MAX_QUEUED_ANALYSES", 32)),
+)
@@ -0,0 +1,180 @@
+"""
+Multi-product comparison sessions.
+
+A comparison analyses several product URLs concurrently in one WebSocket
+session. Every message about a product is prefixed with "Product({n}) " (n is
+the product's position in the request, from 1), so phase results of the
+products arrive interleaved, and a side-by-side "Comparison: {json}" summary
+is sent once all of them have finished.
+
+The analyses share the process-wide scrape, LLM and emissions factor
+single-flight pools, and a session factor cache, so a factor found for one
+product (e.g. "aluminum extrusion" for the first office chair) is reused by
+the others instead of being looked up again.
+"""
+
+import asyncio
+import json
+import os
+import uuid
+from typing import Any, Dict, List, Optional
+
+from agents.page_analysis import trim_url
+from agents.priors import record_analysis
+from api.graph import DeadlineStream, LIFECYCLE_PHASES, analysis_result, footprint, footprint_summary, process_phase_update, process_summarizer_update, send_partial_footprint, send_prior_estimate, send_prior_outlier, setup_graph
+from llm.cancellation import enter_child_scope
+from llm.tracing import annotate, traced
+from tools.emissions_factors.emissions_factors import FactorCache, ef_session_cache
+
+
+class ProductWriter:
+    """Prefixes every message sent through it with the product it is about."""
+
+    def __init__(self, websocket: Any, product: int):
+        self.websocket = websocket
+        self.product = product
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.websocket, name)
+
+    async def send_text(self, text: str) -> None:
+        await self.websocket.send_text(f"Product({self.product}) {text}")
+
+
+def validate_urls(urls: Any) -> List[str]:
+    """
+    Raises:
+        ValueError: If urls is not a list of 2 to MAX_COMPARISON_PRODUCTS distinct URLs
+    """
+    max_products = int(os.environ.get("MAX_COMPARISON_PRODUCTS", 4))
+    if not isinstance(urls, list) or not all(isinstance(url, str) and url for url in urls):
+        raise ValueError("urls must be a list of product URLs")
+    if not 2 <= len(urls) <= max_products:
+        raise ValueError(f"A comparison takes 2 to {max_products} product URLs, got {len(urls)}")
+    if len({trim_url(url) for url in urls}) != len(urls):
+        raise ValueError("The product URLs of a comparison must be distinct")
+    return urls
+
+
+async def send_page_analysis(websocket: Any, update: Dict[str, Any]) -> None:
+    """Send the page analysis fields in a node update."""
+    for field, message_type in [("brand", "PageAnalysisBrand"), ("category", "PageAnalysisCategory"),
+                                ("short_description", "PageAnalysisShortDescription"),
+                                ("long_description", "PageAnalysisLongDescription")]:
+        if field in update:
+            await websocket.send_text(f"{message_type}: {update[field]}")
+    if isinstance(update.get("product_image_urls"), list):
+        await websocket.send_text(f"PageAnalysisImageUrls: {json.dumps(update['product_image_urls'])}")
+
+
+@traced("product", "product")
+async def analyse_product(websocket: Any, url: str, phases: List[str], deadline: Optional[float]) -> Dict[str, Any]:
+    """Run one product's analysis, streaming its updates, and return its result."""
+    annotate(url=url)
+    graph = setup_graph(phases=phases)
+    initial_state = {
+        "url": url,
+        "user_input": f"Analyze product from URL: {url}",
+        "messages": [("human", f"Analyze carbon footprint for product at URL: {url}")]
+    }
+    stream = DeadlineStream(
+        graph.astream(initial_state, {"configurable": {"thread_id": f"comparison-{uuid.uuid4().hex}"}}, stream_mode="updates"),
+        deadline
+    )
+    await websocket.send_text(f"SystemMessage: Starting carbon footprint analysis for URL: {url}")
+
+    state = dict(initial_state)
+    phase_results = {}
+    async for update in stream:
+        for node, value in update.items():
+            if not isinstance(value, dict):
+                continue
+            state.update({key: item for key, item in value.items() if key != "messages"})
+            phase = node.replace("_phase", "")
+            if node in ("page_analysis_phase", "page_details_phase"):
+                await send_page_analysis(websocket, value)
+                if node == "page_analysis_phase":
+                    await send_prior_estimate(websocket, value.get("category"))
+            elif phase in LIFECYCLE_PHASES and isinstance(value.get(phase), dict):
+                await process_phase_update(websocket, phase, value[phase])
+                phase_results[phase] = value[phase]
+                await send_partial_footprint(websocket, footprint(phase_results))
+                await send_prior_outlier(websocket, state.get("category"), phase, value[phase].get("carbon"))
+            elif node == "summarizer":
+                await process_summarizer_update(websocket, value)
+
+    if stream.expired:
+        result = footprint(phase_results, partial=True)
+        state["footprint"] = result
+        await process_summarizer_update(websocket, {
+            "footprint": result,
+            "messages": [{"role": "ai", "content": footprint_summary(result)}]
+        })
+    record_analysis(state.get("category"), phase_results, complete=not stream.expired and phases == LIFECYCLE_PHASES)
+    return analysis_result(state)
+
+
+def comparison_summary(urls: List[str], results: List[Any]) -> Dict[str, Any]:
+    """
+    Side-by-side summary of the products' results.
+
+    Returns:
+        {"products": [...], "ranking": product numbers from lowest to highest
+        total, "by_phase": {phase: {product: carbon}}}
+    """
+    products = []
+    for product, (url, result) in enumerate(zip(urls, results), start=1):
+        if isinstance(result, BaseException):
+            products.append({"product": product, "url": url, "error": str(result)})
+            continue
+        products.append({
+            "product": product,
+            "url": url,
+            "brand": result.get("brand"),
+            "category": result.get("category"),
+            "total": result["carbon_total"],
+            "by_phase": result["footprint"]["by_phase"],
+            "missing": result["footprint"]["missing"],
+            "partial": result["footprint"]["partial"],
+        })
+
+    analysed = [p for p in products if "error" not in p]
+    return {
+        "products": products,
+        "ranking": [p["product"] for p in sorted(analysed, key=lambda p: p["total"])],
+        "by_phase": {
+            phase: {p["product"]: p["by_phase"][phase] for p in analysed if phase in p["by_phase"]}
+            for phase in LIFECYCLE_PHASES if any(phase in p["by_phase"] for p in analysed)
+        },
+    }
+
+
+async def run_comparison(websocket: Any, urls: List[str], phases: List[str], deadline: Optional[float]) -> Dict[str, Any]:
+    """
+    Analyse the products concurrently, streaming their updates, then send
+    "Comparison: {json}" (see comparison_summary).
+
+    A product whose analysis fails is reported with "Product({n}) ErrorMessage: ..."
+    and listed with its error in the summary; the other analyses carry on.
+    Each analysis runs in a child of the session's cancel scope.
+    """
+    cache = FactorCache()
+    ef_session_cache.set(cache)
+
+    async def analyse(product: int, url: str) -> Dict[str, Any]:
+        # Each product has its own scope, so one product reaching the deadline
+        # doesn't stop LLM calls of the others (a disconnect still stops all)
+        enter_child_scope()
+        writer = ProductWriter(websocket, product)
+        try:
+            return await analyse_product(writer, url, phases, deadline)
+        except Exception as e:
+            print(f"Comparison: analysis of {url} failed: {e}")
+            await writer.send_text(f"ErrorMessage: {str(e)}")
+            raise
+
+    results = await asyncio.gather(*[analyse(product, url) for product, url in enumerate(urls, start=1)], return_exceptions=True)
+    summary = comparison_summary(urls, results)
+    summary["shared_factor_hits"] = cache.hits
+    await websocket.send_text(f"Comparison: {json.dumps(summary)}")
+    return summary
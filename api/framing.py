@@ -0,0 +1,133 @@
+"""
+WebSocket message framing.
+
+The streaming helpers write text frames such as "PhaseCarbon(eol): 0.75" or
+"AgentObs(eol): {json}". Clients choose a protocol with the WebSocket
+subprotocol handshake (Sec-WebSocket-Protocol):
+
+- "footprint.text.v1" (or no subprotocol): one text frame per message, as before.
+- "footprint.msgpack.v1": messages become typed frames
+  ({"type": "PhaseCarbon", "phase": "eol", "data": 0.75}), with JSON and
+  numeric payloads decoded, and are sent in batched binary msgpack envelopes
+  ({"frames": [...]}). Messages about one product of a comparison
+  ("Product(2) PhaseCarbon(eol): 0.75") carry it as "product": 2.
+
+Compression is negotiated separately by the server: uvicorn enables
+permessage-deflate by default (--ws-per-message-deflate), which compresses
+either protocol for clients that offer it.
+"""
+
+import asyncio
+import json
+import os
+import re
+from typing import Any, Dict, List, Optional
+
+import ormsgpack
+
+TEXT_PROTOCOL = "footprint.text.v1"
+MSGPACK_PROTOCOL = "footprint.msgpack.v1"
+
+# Message types whose payload is JSON or a number
+_JSON_TYPES = {"AgentTool", "AgentObs", "PartialFootprint", "Footprint", "PageAnalysisImageUrls", "Comparison", "Prior", "PriorOutlier"}
+_NUMERIC_TYPES = {"PhaseCarbon", "CarbonFootprint", "QueuePosition", "ServerBusy"}
+_PRODUCT_REGEX = re.compile(r"^Product\((\d+)\) (.*)$", re.DOTALL)
+_MESSAGE_REGEX = re.compile(r"^(\w+)(?:\((\w+)\))?: (.*)$", re.DOTALL)
+
+
+def parse_message(text: str) -> Dict[str, Any]:
+    """Turn a text protocol message into a typed frame."""
+    product = _PRODUCT_REGEX.match(text)
+    if product:
+        return {**parse_message(product.group(2)), "product": int(product.group(1))}
+    match = _MESSAGE_REGEX.match(text)
+    if not match:
+        # Bare messages such as "AnalysisComplete"
+        return {"type": text}
+    message_type, phase, payload = match.groups()
+    data: Any = payload
+    try:
+        if message_type in _JSON_TYPES:
+            data = json.loads(payload)
+        elif message_type in _NUMERIC_TYPES:
+            data = float(payload) if re.search(r"[.eE]", payload) else int(payload)
+    except ValueError:
+        pass
+    frame = {"type": message_type, "data": data}
+    if phase:
+        frame["phase"] = phase
+    return frame
+
+
+def decode_envelope(data: bytes) -> List[Dict[str, Any]]:
+    """Decode a binary envelope into its frames (for clients and tests)."""
+    return ormsgpack.unpackb(data)["frames"]
+
+
+class FrameWriter:
+    """
+    Wraps a WebSocket and sends messages in the negotiated protocol.
+
+    It exposes send_text, so it can be passed anywhere the streaming helpers
+    expect a WebSocket; all other attributes are those of the WebSocket.
+    In msgpack mode frames are buffered and flushed as one envelope when
+    max_batch frames are waiting or flush_interval seconds after the first.
+    """
+
+    def __init__(self, websocket: Any, protocol: str = TEXT_PROTOCOL,
+                 max_batch: int = 32, flush_interval: float = 0.05):
+        self.websocket = websocket
+        self.protocol = protocol
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self._frames: List[Dict[str, Any]] = []
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.websocket, name)
+
+    async def send_text(self, text: str) -> None:
+        if self.protocol != MSGPACK_PROTOCOL:
+            await self.websocket.send_text(text)
+            return
+        self._frames.append(parse_message(text))
+        if len(self._frames) >= self.max_batch:
+            await self.flush()
+        elif self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.flush_interval)
+        self._flush_task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            # The client has gone; the endpoint notices on its next send
+            print(f"WebSocket: Could not flush frames: {e}")
+
+    async def flush(self) -> None:
+        """Send any buffered frames now."""
+        if self._flush_task is not None and self._flush_task is not asyncio.current_task():
+            self._flush_task.cancel()
+            self._flush_task = None
+        if not self._frames:
+            return
+        frames, self._frames = self._frames, []
+        await self.websocket.send_bytes(ormsgpack.packb({"frames": frames}))
+
+    async def close(self, *args: Any, **kwargs: Any) -> None:
+        await self.flush()
+        await self.websocket.close(*args, **kwargs)
+
+
+async def accept(websocket: Any) -> FrameWriter:
+    """Accept a WebSocket, negotiating the message protocol from the requested subprotocols."""
+    requested = websocket.scope.get("subprotocols") or []
+    protocol = next((p for p in requested if p in (MSGPACK_PROTOCOL, TEXT_PROTOCOL)), None)
+    await websocket.accept(subprotocol=protocol)
+    return FrameWriter(
+        websocket,
+        protocol or TEXT_PROTOCOL,
+        max_batch=int(os.environ.get("WS_BATCH_MAX_FRAMES", 32)),
+        flush_interval=int(os.environ.get("WS_BATCH_INTERVAL_MS", 50)) / 1000,
+    )
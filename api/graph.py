@@ -1,18 +1,23 @@
 # Standard library imports
 import asyncio
+import functools
 import json
 import os
 import re
-from typing import Dict, Any, Union, List
+from typing import Dict, Any, Union, List, Optional
 
 # Third-party imports
-from langchain_openai import ChatOpenAI
 from langgraph.graph import StateGraph, START, END
 
 # Local application imports (absolute imports from project root)
-from agents.state import FootprintState
-from agents.page_analysis import page_analysis_phase # Use the function from agents.page_analysis
-from agents.planner import planner_phase
+from llm.cancellation import AnalysisCancelled, cancellation_metrics, current_scope
+from llm.models import get_chat_model
+from llm.tracing import traced
+from api.memory import memory_profiler
+from agents.state import FootprintState, PageDetailsState
+from agents.page_analysis import page_analysis_phase, page_details_phase
+from agents.priors import prior_check, prior_estimate
+from agents.bill_of_materials import bill_of_materials_phase
 from agents.eol import eol_phase
 from agents.materials import materials_phase
 from agents.manufacturing import manufacturing_phase
@@ -23,24 +28,85 @@ from agents.use import use_phase
 # but load_environment is called in the root main.py
 
 # --- LangGraph Setup ---
-# The page_analysis_phase is now imported directly from agents.page_analysis
-# and will be used in graph_builder.add_node("page_analysis_phase", page_analysis_phase)
+# page_analysis_phase extracts the fields the lifecycle agents need, then
+# bill_of_materials_phase and page_details_phase (the remaining page fields)
+# run in parallel, and the agents start once the bill of materials is ready
 
-def setup_graph() -> Any:
+# Lifecycle phases in display order, and the node that computes each of them
+LIFECYCLE_PHASES = ["materials", "manufacturing", "packaging", "transportation", "use", "eol"]
+PHASE_NODES = {
+    "materials": materials_phase,
+    "manufacturing": manufacturing_phase,
+    "packaging": packaging_phase,
+    "transportation": transportation_phase,
+    "use": use_phase,
+    "eol": eol_phase,
+}
+
+# Phases whose agents use the shared bill of materials
+BILL_OF_MATERIALS_PHASES = ["materials", "manufacturing", "packaging", "eol"]
+
+# Fields produced by page analysis (and the bill of materials) that are needed
+# to run lifecycle phases without scraping the product page again
+PAGE_ANALYSIS_FIELDS = ["url", "brand", "category", "short_description", "long_description", "product_image_urls", "bill_of_materials"]
+
+def validate_phases(phases: Optional[List[str]]) -> List[str]:
+    """
+    Validate a phase selection, preserving the canonical phase order.
+    
+    Args:
+        phases: Lifecycle phase names (e.g. ["packaging"]), or None for all phases
+        
+    Returns:
+        The selected phases in LIFECYCLE_PHASES order
+    """
+    if phases is None:
+        return list(LIFECYCLE_PHASES)
+    unknown = [phase for phase in phases if phase not in PHASE_NODES]
+    if unknown:
+        raise ValueError(f"Unknown lifecycle phases: {unknown}. Expected a subset of {LIFECYCLE_PHASES}")
+    if not phases:
+        raise ValueError("At least one lifecycle phase must be selected")
+    return [phase for phase in LIFECYCLE_PHASES if phase in phases]
+
+def track_abandoned(name: str, node: Any) -> Any:
+    """Wrap a graph node so that being cancelled part-way is counted as abandoned work."""
+    @functools.wraps(node)
+    async def tracked(state: FootprintState, *args: Any, **kwargs: Any) -> Dict[str, Any]:
+        try:
+            return await node(state, *args, **kwargs)
+        except (asyncio.CancelledError, AnalysisCancelled):
+            cancellation_metrics.record_node_abandoned(name)
+            raise
+    return tracked
+
+def instrument_node(name: str, node: Any) -> Any:
+    """Wrap a graph node with the abandoned-work and (opt-in) memory accounting, and trace it."""
+    return track_abandoned(name, memory_profiler.profile_node(name, traced(name, "node")(node)))
+
+def setup_graph(phases: Optional[List[str]] = None, from_page_analysis: bool = False) -> Any:
     """
     Initialize and configure the LangGraph workflow.
     
     This creates a directed graph of agents where each agent specializes in 
     analyzing a different phase of the product lifecycle.
     
+    Args:
+        phases: Lifecycle phases to run. Defaults to all of them.
+        from_page_analysis: If True, the graph starts directly at the lifecycle
+            phases and expects the initial state to hold a stored page-analysis
+            state (see PAGE_ANALYSIS_FIELDS) instead of scraping the URL again.
+    
     Returns:
         Compiled LangGraph instance ready for execution
     """
+    phases = validate_phases(phases)
+
     # Get API key from environment
     openai_api_key = os.environ.get("OPENAI_API_KEY")
     
     # Configure LLM
-    model = ChatOpenAI(
+    model = get_chat_model(
         model_name="gpt-4o", 
         temperature=0,
         openai_api_key=openai_api_key
@@ -54,50 +120,182 @@ def setup_graph() -> Any:
     # Initialize the workflow graph
     graph_builder = StateGraph(FootprintState)
     
-    # Add page analysis node
-    graph_builder.add_node("page_analysis_phase", page_analysis_phase)
-    graph_builder.add_edge(START, "page_analysis_phase") # Start with page analysis
+    # Add the selected agent nodes to the graph
+    phase_nodes = [f"{phase}_phase" for phase in phases]
+    for phase in phases:
+        graph_builder.add_node(f"{phase}_phase", instrument_node(f"{phase}_phase", PHASE_NODES[phase]))
 
-    # Add planner node to the graph using the imported planner_phase
-    graph_builder.add_node("planner_phase", planner_phase)
-    graph_builder.add_edge("page_analysis_phase", "planner_phase") # Planner runs after page analysis
-    
-    # Add all agent nodes to the graph
-    graph_builder.add_node("materials_phase", materials_phase)
-    graph_builder.add_node("manufacturing_phase", manufacturing_phase) # Uses imported manufacturing_phase
-    graph_builder.add_node("packaging_phase", packaging_phase)
-    graph_builder.add_node("transportation_phase", transportation_phase)
-    graph_builder.add_node("use_phase", use_phase)
-    graph_builder.add_node("eol_phase", eol_phase)
-    
-    # Connect planner_phase to all analysis phases
-    phases = ["materials_phase", "manufacturing_phase", "packaging_phase", "transportation_phase", "use_phase", "eol_phase"]
+    if from_page_analysis:
+        # Page analysis results are already in the initial state
+        inputs_node = START
+        summarizer_inputs = list(phase_nodes)
+    else:
+        # Start with page analysis; the lifecycle agents start as soon as it
+        # has the brand, category and long description
+        graph_builder.add_node("page_analysis_phase", instrument_node("page_analysis_phase", page_analysis_phase))
+        graph_builder.add_edge(START, "page_analysis_phase")
+        graph_builder.add_node("page_details_phase", instrument_node("page_details_phase", page_details_phase), input=PageDetailsState)
+        inputs_node = "page_analysis_phase"
+        summarizer_inputs = phase_nodes + ["page_details_phase"]
+
+    # The bill of materials is estimated once and shared by the phases that need it
+    if any(phase in BILL_OF_MATERIALS_PHASES for phase in phases):
+        graph_builder.add_node("bill_of_materials_phase", instrument_node("bill_of_materials_phase", bill_of_materials_phase))
+        graph_builder.add_edge(inputs_node, "bill_of_materials_phase")
+    # LangGraph runs nodes in supersteps, so agents started alongside the bill of
+    # materials would hold back the ones waiting for it; all agents start together
+    # once it is ready instead
+    agents_source = "bill_of_materials_phase" if any(phase in BILL_OF_MATERIALS_PHASES for phase in phases) else inputs_node
     for phase in phases:
-        graph_builder.add_edge("planner_phase", phase)
+        graph_builder.add_edge(agents_source, f"{phase}_phase")
+    if not from_page_analysis:
+        # The remaining page details start with the agents, not in the bill of
+        # materials' superstep, where the agents would wait for them too
+        graph_builder.add_edge(agents_source, "page_details_phase")
     
     # Define summarizer node to calculate total footprint
     async def summarizer(state: FootprintState) -> Dict[str, Any]:
         """
         Final node that aggregates results from all lifecycle phases 
         and calculates the total carbon footprint.
+        
+        Phases that were not run in this graph keep the results they had in
+        the initial state, so totals mix stored and fresh phase results.
         """
-        # Sum up carbon values from all phases
-        total_carbon = 0
-        for phase in ["materials", "manufacturing", "packaging", "transportation", "use", "eol"]:
-            if phase in state and "carbon" in state[phase]:
-                total_carbon += state[phase]["carbon"]
-                
-        summary = f"Total carbon footprint: {total_carbon} kg CO2e"
-        return {"messages": [{"role": "ai", "content": summary}]}
+        result = footprint(state)
+        return {"footprint": result, "messages": [{"role": "ai", "content": footprint_summary(result)}]}
     
     # Connect all phases to the summarizer, and summarizer to end
     graph_builder.add_node("summarizer", summarizer)
-    graph_builder.add_edge(phases, "summarizer")
+    graph_builder.add_edge(summarizer_inputs, "summarizer")
     graph_builder.add_edge("summarizer", END)
     
     # Compile and return the workflow graph
     return graph_builder.compile()
 
+def footprint(state: Dict[str, Any], partial: bool = False) -> Dict[str, Any]:
+    """
+    Structured carbon footprint of the lifecycle phases that have results.
+    
+    Args:
+        state: Graph state, or any dict of phase results (e.g. {"materials": {"carbon": 1.2}})
+        partial: Whether the analysis was cut short (e.g. by a deadline)
+        
+    Returns:
+        {"total", "by_phase", "missing", "partial"}, where missing lists the
+        lifecycle phases without a result
+    """
+    by_phase = {
+        phase: state[phase]["carbon"] for phase in LIFECYCLE_PHASES
+        if isinstance(state.get(phase), dict) and state[phase].get("carbon") is not None
+    }
+    return {
+        "total": sum(by_phase.values()),
+        "by_phase": by_phase,
+        "missing": [phase for phase in LIFECYCLE_PHASES if phase not in by_phase],
+        "partial": partial,
+    }
+
+def footprint_summary(result: Dict[str, Any]) -> str:
+    """Human-readable summary of a footprint."""
+    summary = f"Total carbon footprint: {result['total']} kg CO2e"
+    if result["partial"]:
+        summary += f" (partial result, missing phases: {', '.join(result['missing']) or 'none'})"
+    return summary
+
+def analysis_result(state: Dict[str, Any]) -> Dict[str, Any]:
+    """The serialisable result of a finished analysis: page analysis fields, per-phase results and the footprint."""
+    result = state.get("footprint") or footprint(state)
+    return {
+        **{field: state[field] for field in PAGE_ANALYSIS_FIELDS if field in state},
+        "phases": {phase: {"carbon": state[phase]["carbon"], "summary": state[phase].get("summary", "")}
+                   for phase in result["by_phase"]},
+        "carbon_total": result["total"],
+        "footprint": result,
+    }
+
+def analysis_deadline(requested: Optional[float] = None) -> Optional[float]:
+    """The overall analysis deadline in seconds: the requested one, else ANALYSIS_DEADLINE_SECONDS, else none."""
+    deadline = requested if requested is not None else os.environ.get("ANALYSIS_DEADLINE_SECONDS")
+    return float(deadline) if deadline else None
+
+class DeadlineStream:
+    """
+    Wraps a graph stream so that iteration stops once a deadline has passed.
+    
+    The underlying stream (and with it the running graph) is closed at the
+    deadline, and expired is set so the caller can emit a partial footprint.
+    The current cancel scope is cancelled too, so work in executor threads
+    stops starting LLM calls.
+    """
+
+    def __init__(self, stream: Any, timeout: Optional[float]):
+        self._stream = stream
+        self._deadline = None if timeout is None else asyncio.get_running_loop().time() + timeout
+        self.expired = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._deadline is None:
+            return await self._stream.__anext__()
+        remaining = self._deadline - asyncio.get_running_loop().time()
+        try:
+            return await asyncio.wait_for(self._stream.__anext__(), max(remaining, 0))
+        except asyncio.TimeoutError:
+            self.expired = True
+            scope = current_scope()
+            if scope is not None:
+                scope.cancel("deadline")
+            await self._stream.aclose()
+            raise StopAsyncIteration
+
+def stored_state(state: Dict[str, Any], keep_phases: bool = True) -> FootprintState:
+    """
+    Build the initial state for a re-run from a previously completed analysis.
+    
+    Args:
+        state: A final graph state (or any dict holding PAGE_ANALYSIS_FIELDS and
+            optionally stored phase results)
+        keep_phases: Whether to carry over stored lifecycle phase results
+        
+    Returns:
+        Initial state for a graph built with from_page_analysis=True
+    """
+    missing = [field for field in ["brand", "category", "long_description"] if not state.get(field)]
+    if missing:
+        raise ValueError(f"Stored page-analysis state is missing required fields: {missing}")
+
+    initial_state = {field: state[field] for field in PAGE_ANALYSIS_FIELDS if field in state}
+    if keep_phases:
+        for phase in LIFECYCLE_PHASES:
+            if isinstance(state.get(phase), dict) and "carbon" in state[phase]:
+                initial_state[phase] = {
+                    "carbon": state[phase]["carbon"],
+                    "summary": state[phase].get("summary", ""),
+                    "messages": state[phase].get("messages", []),
+                }
+    return initial_state
+
+async def rerun_phases(state: Dict[str, Any], phases: List[str], config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Re-run a subset of lifecycle phases against a stored analysis.
+    
+    Scraping and page analysis are skipped; phases that are not selected keep
+    their stored results and are included in the recomputed total.
+    
+    Args:
+        state: A previously completed analysis state (see stored_state)
+        phases: Lifecycle phases to recompute
+        config: Optional LangGraph run config
+        
+    Returns:
+        The final graph state
+    """
+    graph = setup_graph(phases=phases, from_page_analysis=True)
+    return await graph.ainvoke(stored_state(state), config or {})
+
 # --- WebSocket Streaming Helpers ---
 
 async def send_agent_messages(websocket: Any, phase_key: str, messages: List[Dict[str, Any]]) -> None: # Changed WebSocket type to Any for now
@@ -245,6 +443,44 @@ async def process_phase_update(websocket: Any, phase_key: str, data: Dict[str, A
         await websocket.send_text(f"PhaseSummary({phase_key}): {data['summary']}")
         await asyncio.sleep(0.1)
 
+async def send_partial_footprint(websocket: Any, result: Dict[str, Any]) -> None:
+    """
+    Send the running footprint after a phase finishes.
+    
+    Standardized message format:
+    - "PartialFootprint: {json}" - {"total", "by_phase", "missing", "partial"}
+    """
+    await websocket.send_text(f"PartialFootprint: {json.dumps(result)}")
+
+async def send_prior_estimate(websocket: Any, category: Optional[str]) -> bool:
+    """
+    Send the category prior (see agents/priors.py) as a provisional estimate,
+    if the prior index knows the category.
+    
+    Standardized message format:
+    - "Prior: {json}" - {"category", "matched", "by_phase", "total", "reference"},
+      each estimate with a 90% range ("estimate", "low", "high", "samples")
+    
+    Returns:
+        Whether an estimate was sent
+    """
+    estimate = prior_estimate(category)
+    if estimate is None:
+        return False
+    await websocket.send_text(f"Prior: {json.dumps(estimate)}")
+    return True
+
+async def send_prior_outlier(websocket: Any, category: Optional[str], phase_key: str, carbon: Optional[float]) -> None:
+    """
+    Flag a phase result far outside its category prior.
+    
+    Standardized message format:
+    - "PriorOutlier({phase_key}): {json}" - {"phase", "value", "expected", "low", "high", "z", "samples", "category"}
+    """
+    outlier = prior_check(category, phase_key, carbon)
+    if outlier is not None:
+        await websocket.send_text(f"PriorOutlier({phase_key}): {json.dumps(outlier)}")
+
 async def process_summarizer_update(websocket: Any, data: Dict[str, Any]) -> None: # Changed WebSocket type to Any
     """
     Process the final summary data and send formatted results to client.
@@ -253,6 +489,7 @@ async def process_summarizer_update(websocket: Any, data: Dict[str, Any]) -> Non
     - "SystemMessage: {content}" - System informational messages
     - "FinalSummary: {content}" - Final analysis summary
     - "CarbonFootprint: {value}" - Specific carbon footprint value
+    - "Footprint: {json}" - Structured footprint ({"total", "by_phase", "missing", "partial"})
     
     Args:
         websocket: The active WebSocket connection (type Any to avoid FastAPI dependency here)
@@ -260,6 +497,14 @@ async def process_summarizer_update(websocket: Any, data: Dict[str, Any]) -> Non
     """
     print("Processing final summary")
     await websocket.send_text("SystemMessage: Generating final carbon footprint summary...")
+
+    # The summarizer reports a structured footprint
+    if isinstance(data.get("footprint"), dict):
+        result = data["footprint"]
+        await websocket.send_text(f"FinalSummary: {footprint_summary(result)}")
+        await websocket.send_text(f"CarbonFootprint: {result['total']}")
+        await websocket.send_text(f"Footprint: {json.dumps(result)}")
+        return
     
     # Extract summary from messages
     if "messages" in data:
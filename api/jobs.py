@@ -0,0 +1,265 @@
+"""
+Asynchronous analysis jobs.
+
+Jobs are submitted over REST, recorded in a persistent SQLite job table and
+run by an in-process pool of workers with bounded concurrency, so clients can
+submit many products and poll for results instead of holding a WebSocket open
+for the whole analysis. Jobs that were queued or running when the server
+stopped are queued again on the next start.
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel, Field
+
+from agents.priors import prior_check, record_analysis
+from llm.cancellation import enter_scope
+from llm.tracing import annotate, trace_session
+from api.memory import memory_profiler
+from api.graph import LIFECYCLE_PHASES, DeadlineStream, analysis_deadline, analysis_result, footprint, setup_graph, stored_state, validate_phases
+
+JOB_STATUSES = ["queued", "running", "succeeded", "failed"]
+
+
+class JobRequest(BaseModel):
+    url: Optional[str] = Field(default=None, description="Product page URL")
+    phases: Optional[List[str]] = Field(default=None, description="Lifecycle phases to run (defaults to all)")
+    state: Optional[Dict[str, Any]] = Field(default=None, description="A stored analysis state; page analysis is skipped")
+    identifiers: Optional[Dict[str, str]] = Field(default=None, description="Product identifiers used for catalogue lookups")
+    deadline: Optional[float] = Field(default=None, description="Seconds after which a partial footprint of the finished phases is returned")
+
+
+class BulkJobRequest(BaseModel):
+    jobs: List[JobRequest]
+
+
+class JobStore:
+    """The persistent job table."""
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        with self._lock, self._db:
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    request TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL
+                )
+            """)
+            self._db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+
+    def insert(self, requests: List[Dict[str, Any]]) -> List[str]:
+        now = time.time()
+        job_ids = [uuid.uuid4().hex for _ in requests]
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT INTO jobs (id, status, request, created_at) VALUES (?, 'queued', ?, ?)",
+                [(job_id, json.dumps(request), now) for job_id, request in zip(job_ids, requests)]
+            )
+        return job_ids
+
+    def update(self, job_id: str, **fields: Any) -> None:
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock, self._db:
+            self._db.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._job(row) if row else None
+
+    def list(self, status: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        query = "SELECT * FROM jobs" + (" WHERE status = ?" if status else "") + " ORDER BY created_at DESC LIMIT ?"
+        with self._lock:
+            rows = self._db.execute(query, (status, limit) if status else (limit,)).fetchall()
+        return [self._job(row) for row in rows]
+
+    def unfinished(self) -> List[str]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id FROM jobs WHERE status IN ('queued', 'running') ORDER BY created_at"
+            ).fetchall()
+        return [row["id"] for row in rows]
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: 0 for status in JOB_STATUSES} | {row[0]: row[1] for row in rows}
+
+    @staticmethod
+    def _job(row: sqlite3.Row) -> Dict[str, Any]:
+        job = dict(row)
+        job["request"] = json.loads(job["request"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+
+class JobManager:
+    """Queues jobs and runs them on a fixed number of worker tasks."""
+
+    def __init__(self, path: str, workers: int = 4):
+        # The job table is opened by start(), so importing the app creates no file
+        self.path = path
+        self.store: Optional[JobStore] = None
+        self.workers = workers
+        self._queue: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self) -> None:
+        if self.store is None:
+            self.store = JobStore(self.path)
+        self._queue = asyncio.Queue()
+        self._loop = asyncio.get_running_loop()
+        # Jobs interrupted by a restart run again from the start
+        unfinished = self.store.unfinished()
+        for job_id in unfinished:
+            self.store.update(job_id, status="queued", started_at=None)
+            self._queue.put_nowait(job_id)
+        if unfinished:
+            print(f"Jobs: re-queued {len(unfinished)} unfinished jobs")
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, requests: List[JobRequest]) -> List[Dict[str, Any]]:
+        """
+        Validate and queue analysis requests. May be called from any thread (the
+        REST endpoints run in FastAPI's threadpool).
+
+        Raises:
+            ValueError: If a request has no URL, unknown phases or an incomplete stored state
+            RuntimeError: If the job manager has not been started
+        """
+        self._require_started()
+        validated = []
+        for request in requests:
+            url = request.url or (request.state or {}).get("url")
+            if not url:
+                raise ValueError("Product URL was not provided.")
+            validate_phases(request.phases)
+            analysis_deadline(request.deadline)
+            if request.state:
+                stored_state(request.state)
+            validated.append(request.model_dump(exclude_none=True) | {"url": url})
+
+        job_ids = self.store.insert(validated)
+        # asyncio.Queue isn't thread-safe, so the jobs are handed to the event loop
+        for job_id in job_ids:
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, job_id)
+        return [self.store.get(job_id) for job_id in job_ids]
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        self._require_started()
+        return self.store.get(job_id)
+
+    def list(self, status: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        self._require_started()
+        return self.store.list(status, limit)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "by_status": self.store.counts() if self.store else {},
+        }
+
+    def _require_started(self) -> None:
+        if self.store is None or self._loop is None:
+            raise RuntimeError("The job manager has not been started")
+
+    async def _worker(self, worker_id: int) -> None:
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except Exception as e:
+                # Errors outside the analysis itself (building the result, recording priors,
+                # the job table) fail the job but not the worker
+                print(f"Jobs: {job_id} failed: {e}")
+                try:
+                    self.store.update(job_id, status="failed", error=str(e), finished_at=time.time())
+                except Exception as update_error:
+                    print(f"Jobs: could not mark {job_id} failed: {update_error}")
+            finally:
+                self._queue.task_done()
+
+    @memory_profiler.profile_session("job")
+    @trace_session("job")
+    async def _run(self, job_id: str) -> None:
+        job = self.store.get(job_id)
+        if job is None or job["status"] != "queued":
+            return
+        request = job["request"]
+        memory_profiler.annotate(job=job_id, url=request["url"])
+        annotate(job=job_id, url=request["url"])
+        self.store.update(job_id, status="running", started_at=time.time())
+        print(f"Jobs: running {job_id} for {request['url']}")
+
+        try:
+            # A deadline also stops tool calls running in executor threads
+            enter_scope()
+            phases = validate_phases(request.get("phases"))
+            graph = setup_graph(phases=phases, from_page_analysis="state" in request)
+            initial_state = {
+                "url": request["url"],
+                "user_input": f"Analyze product from URL: {request['url']}",
+                "messages": [("human", f"Analyze carbon footprint for product at URL: {request['url']}")]
+            }
+            if request.get("identifiers"):
+                initial_state["identifiers"] = request["identifiers"]
+            if "state" in request:
+                initial_state.update(stored_state(request["state"]))
+            stream = DeadlineStream(
+                graph.astream(initial_state, {"configurable": {"thread_id": f"job-{job_id}"}}, stream_mode="updates"),
+                analysis_deadline(request.get("deadline"))
+            )
+            # Collect node updates as each node finishes, so a deadline keeps the phases done so far
+            state = dict(initial_state)
+            async for update in stream:
+                for node_update in update.values():
+                    if isinstance(node_update, dict):
+                        state.update({key: value for key, value in node_update.items() if key != "messages"})
+            if stream.expired:
+                print(f"Jobs: {job_id} reached its deadline, returning a partial footprint")
+                state = {**state, "footprint": footprint(state, partial=True)}
+        except asyncio.CancelledError:
+            # Left as running, so it is re-queued on the next start
+            raise
+        except Exception as e:
+            print(f"Jobs: {job_id} failed: {e}")
+            self.store.update(job_id, status="failed", error=str(e), finished_at=time.time())
+            return
+
+        result = analysis_result(state)
+        # Flag phases far outside their category prior, then add this analysis to the priors
+        fresh = {phase: state[phase] for phase in phases if isinstance(state.get(phase), dict)}
+        result["prior_outliers"] = [outlier for phase, value in fresh.items()
+                                    if (outlier := prior_check(state.get("category"), phase, value.get("carbon")))]
+        record_analysis(state.get("category"), fresh, complete=not result["footprint"].get("partial") and phases == LIFECYCLE_PHASES)
+        self.store.update(job_id, status="succeeded", result=json.dumps(result), finished_at=time.time())
+        print(f"Jobs: {job_id} succeeded")
+
+
+job_manager = JobManager(
+    path=os.environ.get("JOBS_DB_PATH", "jobs.db"),
+    workers=int(os.environ.get("JOB_WORKERS", 4)),
+)
@@ -0,0 +1,83 @@
+"""
+Event loop lag and process CPU monitoring.
+
+A background task sleeps for a fixed interval and records how late it wakes
+up. The lateness is the time the event loop spent running other callbacks
+(blocking calls, long synchronous sections) while timers were due, which is
+what every WebSocket frame waits on. CPU use of the process is sampled on the
+same ticks. Both are kept over a rolling window and reported in /metrics.
+
+Configured with environment variables:
+- LOOP_MONITOR_INTERVAL_MS: Sampling interval (default 100, 0 disables).
+- LOOP_MONITOR_WINDOW: Samples kept for the reported statistics (default 600).
+"""
+
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+
+def _percentile(values: list, percentile: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percentile / 100))]
+
+
+class LoopMonitor:
+    def __init__(self, interval: float = 0.1, window: int = 600):
+        self.interval = interval
+        self._lags: deque = deque(maxlen=window)
+        self._cpu: deque = deque(maxlen=window)
+        self._task: Optional[asyncio.Task] = None
+        self.max_lag = 0.0
+
+    def start(self) -> None:
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        wall, cpu = time.perf_counter(), time.process_time()
+        while True:
+            await asyncio.sleep(self.interval)
+            now_wall, now_cpu = time.perf_counter(), time.process_time()
+            elapsed = now_wall - wall
+            lag = max(0.0, elapsed - self.interval)
+            self._lags.append(lag)
+            self._cpu.append((now_cpu - cpu) / elapsed if elapsed > 0 else 0.0)
+            self.max_lag = max(self.max_lag, lag)
+            wall, cpu = now_wall, now_cpu
+
+    def stats(self) -> Dict[str, Any]:
+        """Lag percentiles (ms) and mean CPU use (% of one core) over the window."""
+        if not self._lags:
+            return {"enabled": self._task is not None, "samples": 0}
+        lags = list(self._lags)
+        return {
+            "enabled": True,
+            "samples": len(lags),
+            "interval_ms": self.interval * 1000,
+            "lag_ms": {
+                "mean": round(sum(lags) / len(lags) * 1000, 2),
+                "p50": round(_percentile(lags, 50) * 1000, 2),
+                "p99": round(_percentile(lags, 99) * 1000, 2),
+                "max": round(max(lags) * 1000, 2),
+                "max_since_start": round(self.max_lag * 1000, 2),
+            },
+            "cpu_percent": round(sum(self._cpu) / len(self._cpu) * 100, 1),
+        }
+
+
+loop_monitor = LoopMonitor(
+    interval=int(os.environ.get("LOOP_MONITOR_INTERVAL_MS", 100)) / 1000,
+    window=int(os.environ.get("LOOP_MONITOR_WINDOW", 600)),
+)
@@ -0,0 +1,206 @@
+"""
+Opt-in memory profiling of analysis sessions.
+
+Enabled with MEMORY_PROFILING=1, which starts tracemalloc when the server
+starts. WebSocket sessions and jobs (all of them, or a sample) are then
+profiled:
+
+- peak: the most traced memory above the session's starting point,
+- retained: traced memory still held after the session has returned and a
+  garbage collection has run (a steady rise across sessions points to a leak),
+- retained_by_type: the object types whose live counts grew over the session,
+- top_retained: the source lines holding the most retained memory,
+- by_node: memory each graph node left allocated when it finished.
+
+tracemalloc and the garbage collector see the whole process, so figures are
+exact for sessions that ran alone and approximate for sessions that
+overlapped with others (flagged with "overlapped"). by_node is always
+approximate: it is the change in traced memory over the node's run, which
+includes what nodes running alongside it (the lifecycle agents run in
+parallel) allocated or freed meanwhile. Use top_retained to attribute
+memory to source lines.
+
+Profiling slows sessions down noticeably (each profiled session runs a
+garbage collection, takes tracemalloc snapshots and counts live objects when
+it starts and ends), so it is meant for chasing leaks and bloat, not to stay
+on. To keep it on under load, profile a sample of the sessions. GET
+/debug/memory reports the top allocators and recent sessions.
+
+Configured with environment variables:
+- MEMORY_PROFILING: Set to 1 to enable profiling.
+- MEMORY_PROFILING_FRAMES: Stack frames stored per allocation (default 10).
+- MEMORY_PROFILING_SESSIONS: Recent session profiles kept (default 50).
+- MEMORY_PROFILING_SAMPLE_RATE: Fraction of sessions profiled (default 1).
+"""
+
+import functools
+import gc
+import os
+import random
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter, deque
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+_current_profile: ContextVar[Optional[Dict[str, Any]]] = ContextVar("memory_profile", default=None)
+
+
+def _type_counts() -> Counter:
+    return Counter(type(obj).__name__ for obj in gc.get_objects())
+
+
+def _top_stats(stats: List[Any], limit: int) -> List[Dict[str, Any]]:
+    return [{
+        "location": str(stat.traceback[0]) if stat.traceback else "?",
+        "size_kb": round(stat.size / 1024, 1),
+        "count": stat.count,
+        **({"size_diff_kb": round(stat.size_diff / 1024, 1)} if hasattr(stat, "size_diff") else {}),
+    } for stat in stats[:limit]]
+
+
+class MemoryProfiler:
+    def __init__(self, enabled: bool = False, frames: int = 10, history: int = 50, sample_rate: float = 1.0):
+        self.enabled = enabled
+        self.frames = frames
+        self.sample_rate = sample_rate
+        self.sessions: deque = deque(maxlen=history)
+        self._lock = threading.Lock()
+        self._active: Dict[str, Dict[str, Any]] = {}
+        self._unprofiled = 0 # Sessions running without a profile (not sampled)
+
+    def start(self) -> None:
+        if self.enabled and not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            print(f"Memory profiling enabled ({self.frames} frames per allocation)")
+
+    def profile_session(self, kind: str):
+        """Decorator profiling each call of an async session function (a WebSocket endpoint, a job run)."""
+        def decorator(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args: Any, **kwargs: Any) -> Any:
+                if not (self.enabled and tracemalloc.is_tracing()):
+                    return await fn(*args, **kwargs)
+                if random.random() >= self.sample_rate:
+                    # Still traced, so sessions profiled meanwhile are flagged as overlapped
+                    with self._lock:
+                        self._unprofiled += 1
+                        for other in self._active.values():
+                            other["overlapped"] = True
+                    try:
+                        return await fn(*args, **kwargs)
+                    finally:
+                        with self._lock:
+                            self._unprofiled -= 1
+                profile = self._begin(kind)
+                token = _current_profile.set(profile)
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    _current_profile.reset(token)
+                    self._end(profile)
+            return wrapper
+        return decorator
+
+    def annotate(self, **fields: Any) -> None:
+        """Add fields (e.g. the product URL) to the current session's profile."""
+        profile = _current_profile.get()
+        if profile is not None:
+            profile.update(fields)
+
+    def profile_node(self, name: str, node: Any) -> Any:
+        """
+        Wrap a graph node to record the memory it leaves allocated, if profiling
+        is on. The figure is approximate, as it includes allocations by nodes
+        running alongside it.
+        """
+        if not self.enabled:
+            return node
+
+        @functools.wraps(node)
+        async def profiled(state: Any, *args: Any, **kwargs: Any) -> Any:
+            profile = _current_profile.get()
+            if profile is None:
+                return await node(state, *args, **kwargs)
+            before = tracemalloc.get_traced_memory()[0]
+            try:
+                return await node(state, *args, **kwargs)
+            finally:
+                delta = tracemalloc.get_traced_memory()[0] - before
+                profile["by_node"][name] = profile["by_node"].get(name, 0) + delta
+        return profiled
+
+    def _begin(self, kind: str) -> Dict[str, Any]:
+        gc.collect()
+        with self._lock:
+            overlapped = bool(self._active) or self._unprofiled > 0
+            if not overlapped:
+                tracemalloc.reset_peak()
+            profile = {
+                "session": uuid.uuid4().hex,
+                "kind": kind,
+                "started_at": time.time(),
+                "overlapped": overlapped,
+                "by_node": {},
+                "_start": tracemalloc.get_traced_memory()[0],
+                "_snapshot": tracemalloc.take_snapshot(),
+                "_types": _type_counts(),
+            }
+            for other in self._active.values():
+                other["overlapped"] = True
+            self._active[profile["session"]] = profile
+        return profile
+
+    def _end(self, profile: Dict[str, Any]) -> None:
+        gc.collect()
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+        retained_types = _type_counts() - profile.pop("_types")
+        diff = snapshot.compare_to(profile.pop("_snapshot"), "lineno")
+        start = profile.pop("_start")
+        with self._lock:
+            self._active.pop(profile["session"], None)
+        profile.update({
+            "duration": time.time() - profile["started_at"],
+            "peak_kb": round((peak - start) / 1024, 1),
+            "retained_kb": round((current - start) / 1024, 1),
+            "retained_by_type": dict(retained_types.most_common(15)),
+            "top_retained": _top_stats([stat for stat in diff if stat.size_diff > 0], 10),
+            "by_node": {name: round(size / 1024, 1) for name, size in profile["by_node"].items()},
+        })
+        self.sessions.append(profile)
+        print(f"Memory: {profile['kind']} session {profile['session']} peak {profile['peak_kb']} KB, retained {profile['retained_kb']} KB")
+
+    def report(self, limit: int = 20, group_by: str = "lineno", types: bool = False) -> Dict[str, Any]:
+        """
+        Top allocators of the traced memory, grouped by "lineno", "filename" or
+        "traceback", and the recent session profiles. With types, the live
+        object counts by type are included too (slow on large heaps).
+        """
+        current, peak = tracemalloc.get_traced_memory()
+        stats = tracemalloc.take_snapshot().statistics(group_by)
+        report = {
+            "traced_kb": round(current / 1024, 1),
+            "peak_kb": round(peak / 1024, 1),
+            "top_allocators": _top_stats(stats, limit),
+            "active_sessions": len(self._active),
+            "sessions": list(self.sessions)[-limit:],
+        }
+        if group_by == "traceback":
+            report["top_allocators"] = [
+                {**entry, "traceback": stat.traceback.format()}
+                for entry, stat in zip(report["top_allocators"], stats)
+            ]
+        if types:
+            report["objects_by_type"] = dict(_type_counts().most_common(limit))
+        return report
+
+
+memory_profiler = MemoryProfiler(
+    enabled=os.environ.get("MEMORY_PROFILING", "0") == "1",
+    frames=int(os.environ.get("MEMORY_PROFILING_FRAMES", 10)),
+    history=int(os.environ.get("MEMORY_PROFILING_SESSIONS", 50)),
+    sample_rate=float(os.environ.get("MEMORY_PROFILING_SAMPLE_RATE", 1)),
+)
@@ -8,10 +8,13 @@ with multiple runs per product to generate a robust dataset of carbon footprint
 
 import asyncio
 import json
+import math
 import os
 import time
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 import matplotlib.pyplot as plt
 from dotenv import load_dotenv
 
@@ -22,8 +25,8 @@ load_dotenv(dotenv_path='.env.local')
 os.environ['LANGCHAIN_PROJECT'] = 'batch-product-analysis'
 
 # Import the graph setup function from api.graph
-from api.graph import setup_graph
-from state import FootprintState
+from api.graph import setup_graph, stored_state, LIFECYCLE_PHASES, PAGE_ANALYSIS_FIELDS
+from agents.state import FootprintState
 
 # Define a list of product URLs to analyze
 product_urls = [
@@ -40,13 +43,24 @@ product_urls = [
 ]
 
 
-async def run_single_analysis(product_url: str, run_id: int) -> Dict[str, Any]:
+# How a run was sampled: a fixed number of full runs per product, a re-run of
+# some phases of a stored result, or a run of adaptive sampling
+RUN_MODES = ["fixed", "rerun", "adaptive"]
+
+
+async def run_single_analysis(product_url: str, run_id: int, phases: Optional[List[str]] = None,
+                              stored: Optional[Dict[str, Any]] = None, mode: str = "fixed") -> Dict[str, Any]:
     """
     Run a single analysis for a product URL with a unique run ID.
     
     Args:
         product_url: The URL of the product to analyze
         run_id: Unique identifier for this run
+        phases: Lifecycle phases to run (defaults to all)
+        stored: A stored result from an earlier run. When given, scraping and
+            page analysis are skipped and phases that are not re-run keep their
+            stored values.
+        mode: How the run was sampled (see RUN_MODES), stored with the result
         
     Returns:
         Dictionary with analysis results
@@ -54,7 +68,7 @@ async def run_single_analysis(product_url: str, run_id: int) -> Dict[str, Any]:
     try:
         print(f"Starting analysis for {product_url} (run {run_id})")
         # Set up graph for this run
-        graph = setup_graph()
+        graph = setup_graph(phases=phases, from_page_analysis=stored is not None)
         
         # Create unique thread ID for this run
         config = {"configurable": {"thread_id": f"batch-run-{run_id}-{int(time.time())}"}} 
@@ -65,6 +79,8 @@ async def run_single_analysis(product_url: str, run_id: int) -> Dict[str, Any]:
             "user_input": f"Analyze product from URL: {product_url}",
             "messages": [("human", f"Analyze carbon footprint for product at URL: {product_url}")]
         }
+        if stored is not None:
+            initial_state.update(stored_state(stored_result_state(stored)))
         
         # Run the graph
         result = await graph.ainvoke(
@@ -74,12 +90,14 @@ async def run_single_analysis(product_url: str, run_id: int) -> Dict[str, Any]:
         
         # Extract key information from result
         carbon_footprints = {}
+        phase_summaries = {}
         total_carbon = 0
         
-        for phase in ["materials", "manufacturing", "packaging", "transportation", "use", "eol"]:
+        for phase in LIFECYCLE_PHASES:
             if phase in result and "carbon" in result[phase]:
                 carbon_value = result[phase]["carbon"]
                 carbon_footprints[phase] = carbon_value
+                phase_summaries[phase] = result[phase].get("summary", "")
                 if isinstance(carbon_value, (int, float)):
                     total_carbon += carbon_value
         
@@ -90,8 +108,12 @@ async def run_single_analysis(product_url: str, run_id: int) -> Dict[str, Any]:
             "brand": result.get("brand", "Unknown"),
             "category": result.get("category", "Unknown"),
             "description": result.get("short_description", "Unknown"),
+            "page_analysis": {field: result[field] for field in PAGE_ANALYSIS_FIELDS if field in result},
             "carbon_total": total_carbon,
             "carbon_by_phase": carbon_footprints,
+            "summary_by_phase": phase_summaries,
+            "rerun_phases": phases if stored is not None else None,
+            "mode": mode,
             "timestamp": time.time(),
             "success": True
         }
@@ -107,10 +129,28 @@ async def run_single_analysis(product_url: str, run_id: int) -> Dict[str, Any]:
             "run_id": run_id,
             "success": False,
             "error": str(e),
+            "mode": mode,
             "timestamp": time.time()
         }
 
 
+def stored_result_state(result: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Convert a stored batch result back into an analysis state.
+    
+    Args:
+        result: A successful result produced by run_single_analysis
+        
+    Returns:
+        State dict with page-analysis fields and stored phase results
+    """
+    state = dict(result.get("page_analysis") or {})
+    summaries = result.get("summary_by_phase") or {}
+    for phase, carbon in (result.get("carbon_by_phase") or {}).items():
+        state[phase] = {"carbon": carbon, "summary": summaries.get(phase, ""), "messages": []}
+    return state
+
+
 async def batch_process(urls: List[str], runs_per_url: int = 10, max_concurrent: int = 2) -> List[Dict[str, Any]]:
     """
     Process multiple product URLs with multiple runs each.
@@ -150,6 +190,244 @@ async def batch_process(urls: List[str], runs_per_url: int = 10, max_concurrent:
     return all_results
 
 
+async def rerun_batch_process(stored_results: List[Dict[str, Any]], phases: List[str], max_concurrent: int = 2) -> List[Dict[str, Any]]:
+    """
+    Re-run a subset of lifecycle phases for every stored result.
+    
+    The stored page-analysis state of each result is reused, so no product page
+    is scraped again, and totals are recomputed from the stored values of the
+    phases that are not re-run.
+    
+    Args:
+        stored_results: Results from an earlier batch (see load_results)
+        phases: Lifecycle phases to re-run (e.g. ["packaging"])
+        max_concurrent: Maximum number of concurrent runs
+        
+    Returns:
+        List of dictionaries with results from all re-runs
+    """
+    rerunnable = [r for r in stored_results if r.get("success", False) and r.get("page_analysis")]
+    skipped = len(stored_results) - len(rerunnable)
+    if skipped:
+        print(f"Skipping {skipped} stored results without a successful page analysis")
+
+    all_results = []
+    total_tasks = len(rerunnable)
+    print(f"Re-running phases {phases} for {total_tasks} stored results...")
+
+    for i in range(0, total_tasks, max_concurrent):
+        batch = rerunnable[i:i+max_concurrent]
+        tasks = [run_single_analysis(r["product_url"], r["run_id"], phases=phases, stored=r, mode="rerun")
+                 for r in batch]
+        batch_results = await asyncio.gather(*tasks)
+        all_results.extend(batch_results)
+        print(f"Completed {min(i+max_concurrent, total_tasks)}/{total_tasks} tasks")
+
+        # Save incremental results to avoid losing data on error
+        save_results(all_results, "results/interim_results.json")
+
+    return all_results
+
+
+# Two-sided 95% Student's t critical values by degrees of freedom (normal beyond 30)
+_T_CRITICAL_95 = {1: 12.706, 2: 4.303, 3: 3.182, 4: 2.776, 5: 2.571, 6: 2.447, 7: 2.365, 8: 2.306, 9: 2.262,
+                  10: 2.228, 12: 2.179, 15: 2.131, 20: 2.086, 25: 2.060, 30: 2.042}
+
+
+def t_critical_95(df: int) -> float:
+    """Conservative two-sided 95% t critical value for df degrees of freedom."""
+    if df > 30:
+        return 1.96
+    return _T_CRITICAL_95[max(k for k in _T_CRITICAL_95 if k <= df)]
+
+
+class RunningStats:
+    """
+    Incrementally updated mean and variance (Welford's algorithm).
+    """
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def add(self, value: float):
+        self.n += 1
+        delta = value - self.mean
+        self.mean += delta / self.n
+        self._m2 += delta * (value - self.mean)
+
+    @property
+    def variance(self) -> float:
+        return self._m2 / (self.n - 1) if self.n > 1 else float('nan')
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.variance) if self.n > 1 else float('nan')
+
+    @property
+    def cv(self) -> float:
+        """Coefficient of variation in percent."""
+        return self.std / self.mean * 100 if self.mean > 0 else float('nan')
+
+    @property
+    def ci_half_width(self) -> float:
+        """Half width of the 95% confidence interval of the mean."""
+        return t_critical_95(self.n - 1) * self.std / math.sqrt(self.n) if self.n > 1 else float('inf')
+
+    def converged(self, rel_precision: float, min_runs: int) -> bool:
+        """Whether the confidence interval is within rel_precision of the mean."""
+        if self.n < min_runs:
+            return False
+        # A phase that is always (near) zero has converged once its spread is zero too
+        return self.ci_half_width <= rel_precision * abs(self.mean) or self.std == 0
+
+
+async def adaptive_product_analysis(product_url: str, run_id: int, semaphore: asyncio.Semaphore,
+                                    min_runs: int = 3, max_runs: int = 10, wave_size: int = 2,
+                                    rel_precision: float = 0.1) -> Dict[str, Any]:
+    """
+    Sample one product until every phase's estimate has converged.
+    
+    A full analysis runs first. Its page-analysis state is then reused and only
+    the phases whose 95% confidence interval is still wider than rel_precision
+    of their mean are re-run, wave_size runs at a time, until they converge or
+    max_runs runs have been attempted (runs that don't return a phase count
+    against its budget too).
+    
+    Args:
+        product_url: The URL of the product to analyze
+        run_id: First run ID for this product; subsequent runs count up from it
+        semaphore: Limits the number of analyses running at once across products
+        min_runs: Minimum number of samples per phase
+        max_runs: Maximum number of samples per phase
+        wave_size: Number of concurrent runs per wave
+        rel_precision: Target 95% CI half width relative to the mean (e.g. 0.1 for +/-10%)
+        
+    Returns:
+        Dictionary with all run results and the running statistics per phase
+    """
+    async with semaphore:
+        first = await run_single_analysis(product_url, run_id, mode="adaptive")
+    runs = [first]
+    if not first.get("success", False):
+        return {"product_url": product_url, "runs": runs, "stats": {}}
+
+    stats = {phase: RunningStats() for phase in LIFECYCLE_PHASES}
+    for phase, value in first["carbon_by_phase"].items():
+        stats[phase].add(value)
+    # Runs attempted per phase, including those that didn't return it (e.g. its
+    # agent failed), so a phase that keeps failing still reaches max_runs
+    attempts = {phase: 1 for phase in LIFECYCLE_PHASES}
+
+    async def run(i: int, phases: List[str]) -> Dict[str, Any]:
+        async with semaphore:
+            return await run_single_analysis(product_url, i, phases=phases, stored=first, mode="adaptive")
+
+    next_run_id = run_id + 1
+    while True:
+        active = [phase for phase in LIFECYCLE_PHASES
+                  if not stats[phase].converged(rel_precision, min_runs) and attempts[phase] < max_runs]
+        if not active:
+            break
+        # Don't sample past max_runs for the phase closest to its budget
+        size = min(wave_size, max_runs - max(attempts[phase] for phase in active))
+        wave = await asyncio.gather(*[run(next_run_id + i, active) for i in range(size)])
+        next_run_id += size
+        runs.extend(wave)
+
+        for phase in active:
+            attempts[phase] += size
+        successful = [r for r in wave if r.get("success", False)]
+        if not successful:
+            print(f"Stopping sampling for {product_url}: a whole wave failed")
+            break
+        for result in successful:
+            for phase in active:
+                if phase in result["carbon_by_phase"]:
+                    stats[phase].add(result["carbon_by_phase"][phase])
+        print(f"{product_url}: sampled {active}, remaining unconverged "
+              f"{[p for p in active if not stats[p].converged(rel_precision, min_runs)]}")
+
+    return {"product_url": product_url, "runs": runs, "stats": stats}
+
+
+async def adaptive_batch_process(urls: List[str], min_runs: int = 3, max_runs: int = 10, wave_size: int = 2,
+                                 rel_precision: float = 0.1, max_concurrent: int = 2):
+    """
+    Process multiple product URLs, sampling each only until its estimates converge.
+    
+    Unlike batch_process, which runs a fixed number of full analyses per URL,
+    stable products finish after min_runs while noisy phases get up to max_runs.
+    
+    Args:
+        urls: List of product URLs to analyze
+        min_runs: Minimum number of samples per phase
+        max_runs: Maximum number of samples per phase
+        wave_size: Number of concurrent runs per wave per product
+        rel_precision: Target 95% CI half width relative to the mean
+        max_concurrent: Maximum number of concurrent runs across all products
+        
+    Returns:
+        Tuple of (list of all run results, DataFrame with per-product, per-phase statistics)
+    """
+    semaphore = asyncio.Semaphore(max_concurrent)
+    products = await asyncio.gather(*[
+        adaptive_product_analysis(url, i * max_runs, semaphore, min_runs=min_runs, max_runs=max_runs,
+                                  wave_size=wave_size, rel_precision=rel_precision)
+        for i, url in enumerate(urls)
+    ])
+
+    all_results = [run for product in products for run in product["runs"]]
+    save_results(all_results, "results/interim_results.json")
+
+    rows = []
+    for product in products:
+        stats = product["stats"]
+        if not stats:
+            continue
+        for phase, phase_stats in stats.items():
+            rows.append({
+                "product_url": product["product_url"],
+                "phase": phase,
+                "runs": phase_stats.n,
+                "mean": phase_stats.mean,
+                "std": phase_stats.std,
+                "cv": phase_stats.cv,
+                "ci_half_width": phase_stats.ci_half_width,
+                "converged": phase_stats.converged(rel_precision, min_runs),
+            })
+        # Phases are sampled independently, so the total's variance is the sum of theirs
+        total_mean = sum(s.mean for s in stats.values())
+        total_std = math.sqrt(sum(s.variance for s in stats.values() if s.n > 1))
+        rows.append({
+            "product_url": product["product_url"],
+            "phase": "total",
+            "runs": max(s.n for s in stats.values()),
+            "mean": total_mean,
+            "std": total_std,
+            "cv": total_std / total_mean * 100 if total_mean > 0 else float('nan'),
+            "ci_half_width": float('nan'),
+            "converged": all(s.converged(rel_precision, min_runs) for s in stats.values()),
+        })
+
+    return all_results, pd.DataFrame(rows)
+
+
+def load_results(filename: str) -> List[Dict[str, Any]]:
+    """
+    Load results previously written by save_results.
+    
+    Args:
+        filename: Name of the JSON file to load
+        
+    Returns:
+        List of result dictionaries
+    """
+    with open(filename, 'r') as f:
+        return json.load(f)
+
+
 def save_results(results: List[Dict[str, Any]], filename: str):
     """
     Save results to a JSON file.
@@ -163,47 +441,154 @@ def save_results(results: List[Dict[str, Any]], filename: str):
     print(f"Results saved to {filename}")
 
 
-def analyze_results(results: List[Dict[str, Any]]):
+# Every batch file is written with the same schema, so that columns which are
+# all null in one batch (rerun_phases, error) don't get a different type there
+RESULTS_SCHEMA = pa.schema([
+    ("product_url", pa.string()),
+    ("run_id", pa.int64()),
+    ("brand", pa.string()),
+    ("category", pa.string()),
+    ("description", pa.string()),
+    ("page_analysis", pa.string()),
+    ("carbon_total", pa.float64()),
+    *[(f"{phase}_carbon", pa.float64()) for phase in LIFECYCLE_PHASES],
+    ("summary_by_phase", pa.string()),
+    ("rerun_phases", pa.string()),
+    ("mode", pa.string()),
+    ("timestamp", pa.float64()),
+    ("success", pa.bool_()),
+    ("error", pa.string()),
+    ("batch_id", pa.int64()),
+])
+
+
+def append_results_parquet(results: List[Dict[str, Any]], dataset: str, batch_id: int):
     """
-    Analyze the results and provide statistics.
+    Append a batch of results to a Parquet dataset (a directory with one file per batch).
+    
+    Phase values are stored as {phase}_carbon columns, and nested fields
+    (page_analysis, summary_by_phase, rerun_phases) as JSON strings, so the
+    dataset can be read back with load_results_parquet and fed to
+    analyze_results or re-runs. Every file has the columns of RESULTS_SCHEMA.
     
     Args:
         results: List of result dictionaries
+        dataset: Dataset directory, e.g. "results/batch_results.parquet"
+        batch_id: Identifier of this batch (e.g. its timestamp)
+    """
+    if not results:
+        return
+    df = results_frame(results, successful_only=False)
+    for column in ["page_analysis", "summary_by_phase", "rerun_phases"]:
+        if column in df:
+            df[column] = [json.dumps(value) if isinstance(value, (dict, list)) else None for value in df[column]]
+    df["batch_id"] = batch_id
+    df = df.reindex(columns=RESULTS_SCHEMA.names)
+    # Missing values are nulls of the column's type
+    df = df.astype(object).where(df.notna(), None)
+    table = pa.Table.from_pandas(df, schema=RESULTS_SCHEMA, preserve_index=False)
+    os.makedirs(dataset, exist_ok=True)
+    filename = os.path.join(dataset, f"batch_{batch_id}.parquet")
+    pq.write_table(table, filename)
+    print(f"Appended {len(df)} results to {filename}")
+
+
+def load_results_parquet(dataset: str) -> pd.DataFrame:
+    """
+    Load every batch appended to a Parquet dataset.
+    
+    Args:
+        dataset: Dataset directory written by append_results_parquet
         
     Returns:
-        DataFrame with analysis results
+        DataFrame with one row per run
     """
-    # Filter successful runs
-    successful_runs = [r for r in results if r.get("success", False)]
+    return pd.read_parquet(dataset)
+
+
+def results_frame(results: List[Dict[str, Any]], successful_only: bool = True) -> pd.DataFrame:
+    """
+    Flatten results into a DataFrame with a {phase}_carbon column per lifecycle phase.
     
-    if not successful_runs:
-        print("No successful runs to analyze")
-        return None, None
+    Args:
+        results: List of result dictionaries
+        successful_only: Whether to drop failed runs
+        
+    Returns:
+        DataFrame with one row per run
+    """
+    if successful_only:
+        results = [r for r in results if r.get("success", False)]
+    df = pd.DataFrame(results)
+    if df.empty:
+        return df
+    # Expand the per-phase dicts in one pass instead of one .apply per phase
+    by_phase = df["carbon_by_phase"] if "carbon_by_phase" in df else pd.Series([None] * len(df))
+    phases = pd.DataFrame([x if isinstance(x, dict) else {} for x in by_phase], index=df.index)
+    for phase in LIFECYCLE_PHASES:
+        df[f"{phase}_carbon"] = pd.to_numeric(phases[phase], errors="coerce") if phase in phases else float("nan")
+    return df
+
+
+def product_statistics(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Per-product mean, std, min, max, count and coefficient of variation of the
+    total and every phase, computed with a single grouped aggregation.
     
-    # Create dataframe
-    df = pd.DataFrame(successful_runs)
+    Args:
+        df: DataFrame from results_frame (or load_results_parquet)
+        
+    Returns:
+        DataFrame indexed by product_url with (component, statistic) columns,
+        where component is "total" or a phase, plus a "description" column
+    """
+    columns = {"carbon_total": "total", **{f"{phase}_carbon": phase for phase in LIFECYCLE_PHASES}}
+    stats = df.groupby("product_url")[list(columns)].agg(["mean", "std", "min", "max", "count"])
+    stats = stats.rename(columns=columns, level=0)
+    # CV = std / mean * 100%, undefined for non-positive means
+    means = stats.xs("mean", axis=1, level=1)
+    cv = (stats.xs("std", axis=1, level=1) / means.where(means > 0)) * 100
+    cv.columns = pd.MultiIndex.from_product([cv.columns, ["cv"]])
+    stats = pd.concat([stats, cv], axis=1)[[(c, s) for c in columns.values() for s in ["mean", "std", "min", "max", "count", "cv"]]]
+    first = df.groupby("product_url")[["brand", "category", "description"]].first()
+    first.columns = pd.MultiIndex.from_product([first.columns, [""]])
+    return pd.concat([first, stats], axis=1)
+
+
+def analyze_results(results, modes: Optional[List[str]] = None):
+    """
+    Analyze the results and provide statistics.
     
-    # Add columns for each phase's carbon footprint
-    for phase in ["materials", "manufacturing", "packaging", "transportation", "use", "eol"]:
-        df[f"{phase}_carbon"] = df["carbon_by_phase"].apply(
-            lambda x: x.get(phase, None) if isinstance(x, dict) else None
-        )
+    Args:
+        results: List of result dictionaries, or a DataFrame of runs (e.g.
+            from load_results_parquet)
+        modes: Only analyze runs sampled in these modes (see RUN_MODES), e.g.
+            ["fixed"] to leave out re-runs, whose phases partly repeat stored
+            values, and adaptive runs, whose number depends on their spread.
+            Defaults to all runs.
+        
+    Returns:
+        DataFrame of runs and per-product summary DataFrame
+    """
+    df = results if isinstance(results, pd.DataFrame) else results_frame(results)
+    if "success" in df:
+        df = df[df["success"].fillna(False).astype(bool)]
+    if modes is not None and not df.empty:
+        df = df[run_modes(df).isin(modes)]
     
-    # Group by product URL and calculate statistics
-    summary = df.groupby("product_url").agg({
-        "brand": "first",
-        "category": "first",
-        "description": "first",
-        "carbon_total": ["mean", "std", "min", "max", "count"],
-        "materials_carbon": ["mean", "std"],
-        "manufacturing_carbon": ["mean", "std"],
-        "packaging_carbon": ["mean", "std"],
-        "transportation_carbon": ["mean", "std"],
-        "use_carbon": ["mean", "std"],
-        "eol_carbon": ["mean", "std"]
-    })
+    if df.empty:
+        print("No successful runs to analyze")
+        return None, None
     
-    return df, summary
+    return df, product_statistics(df)
+
+
+def run_modes(df: pd.DataFrame) -> pd.Series:
+    """The sampling mode of every run; runs stored before modes were recorded are fixed runs or re-runs."""
+    legacy = pd.Series("fixed", index=df.index)
+    if "rerun_phases" in df:
+        legacy = legacy.where(df["rerun_phases"].isna(), "rerun")
+    return df["mode"].fillna(legacy) if "mode" in df else legacy
 
 
 def visualize_results(df, summary, timestamp):
@@ -212,7 +597,7 @@ def visualize_results(df, summary, timestamp):
     
     Args:
         df: DataFrame with all results
-        summary: Summary DataFrame with statistics
+        summary: Summary DataFrame with statistics (from analyze_results)
         timestamp: Timestamp for saving files
     """
     if df is None or df.empty:
@@ -227,8 +612,9 @@ def visualize_results(df, summary, timestamp):
     
     # Create a bar chart of average carbon footprints by product
     plt.subplot(2, 1, 1)
-    avg_carbon = df.groupby('product_url')['carbon_total'].mean().sort_values(ascending=False)
-    product_labels = [df[df['product_url'] == url]['description'].iloc[0] for url in avg_carbon.index]
+    summary = summary.sort_values(("total", "mean"), ascending=False)
+    avg_carbon = summary[("total", "mean")]
+    product_labels = summary[("description", "")].astype(str).tolist()
     
     # Truncate long product descriptions
     product_labels = [label[:30] + '...' if len(label) > 30 else label for label in product_labels]
@@ -241,14 +627,12 @@ def visualize_results(df, summary, timestamp):
     
     # Create a stacked bar chart of average carbon footprints by phase for each product
     plt.subplot(2, 1, 2)
-    phases = ['materials_carbon', 'manufacturing_carbon', 'packaging_carbon', 
-              'transportation_carbon', 'use_carbon', 'eol_carbon']
-    phase_avgs = df.groupby('product_url')[phases].mean()
+    phase_avgs = summary.xs("mean", axis=1, level=1)[LIFECYCLE_PHASES]
     
     bottom = None
-    for phase in phases:
+    for phase in LIFECYCLE_PHASES:
         plt.bar(range(len(phase_avgs.index)), phase_avgs[phase], bottom=bottom, 
-                label=phase.replace('_carbon', ''))
+                label=phase)
         if bottom is None:
             bottom = phase_avgs[phase].values
         else:
@@ -263,30 +647,10 @@ def visualize_results(df, summary, timestamp):
     plt.tight_layout()
     plt.savefig(f'results/carbon_footprint_analysis_{timestamp}.png', dpi=300, bbox_inches='tight')
     
-    # Create a consistency analysis chart
-    # Calculate coefficient of variation (CV) for each product and phase
-    # CV = std / mean * 100%
-    cv_data = {}
-    for url in df['product_url'].unique():
-        product_df = df[df['product_url'] == url]
-        cv_data[url] = {}
-        
-        # Calculate CV for total carbon
-        mean = product_df['carbon_total'].mean()
-        std = product_df['carbon_total'].std()
-        cv = (std / mean * 100) if mean > 0 else float('nan')
-        cv_data[url]['total'] = cv
-        
-        # Calculate CV for each phase
-        for phase in phases:
-            mean = product_df[phase].mean()
-            std = product_df[phase].std()
-            cv = (std / mean * 100) if mean > 0 else float('nan')
-            cv_data[url][phase] = cv
-    
-    # Create a DataFrame for visualization
-    cv_df = pd.DataFrame(cv_data).T
-    cv_df.index = [df[df['product_url'] == url]['description'].iloc[0] for url in cv_df.index]
+    # Create a consistency analysis chart from the coefficient of variation
+    # (CV = std / mean * 100%) of each product and phase
+    cv_df = summary.xs("cv", axis=1, level=1)
+    cv_df.index = summary[("description", "")].rename("description")
     
     # Save CV data to CSV
     cv_df.to_csv(f'results/consistency_analysis_{timestamp}.csv')
@@ -314,18 +678,64 @@ async def main():
     test_mode = True  # Set to False for full analysis
     runs_per_url = 2 if test_mode else 10
     max_concurrent = 2
+
+    # To re-run only some phases against an earlier batch (e.g. after tuning a
+    # prompt), set these to the phases and the batch results file to reuse.
+    rerun_phases = None  # e.g. ["packaging"]
+    stored_results_file = None  # e.g. "results/batch_results_1746800000.json"
+
+    # Every batch is also appended to this Parquet dataset. Set analyze_history
+    # to analyse all runs stored there instead of starting a new batch.
+    results_dataset = "results/batch_results.parquet"
+    analyze_history = False
+
+    # Adaptive mode samples each product until its phase estimates converge
+    # (95% CI within rel_precision of the mean) instead of a fixed runs_per_url
+    adaptive = False
+    min_runs = 3
+    rel_precision = 0.1
     
     timestamp = int(time.time())
+
+    if analyze_history:
+        # Re-runs and adaptive runs would skew the spread of fixed-run sampling
+        df, summary = analyze_results(load_results_parquet(results_dataset), modes=["fixed"])
+        if summary is not None:
+            print(f"\nSummary of {len(df)} stored runs:")
+            print(summary)
+            summary.to_csv(f"results/summary_{timestamp}.csv")
+        return
     
-    print(f"Starting batch analysis with {'TEST MODE' if test_mode else 'FULL MODE'}")
-    print(f"Processing {len(product_urls)} products with {runs_per_url} runs each ({len(product_urls) * runs_per_url} total runs)")
-    print(f"Using max concurrency of {max_concurrent}")
+    if adaptive:
+        print(f"Starting adaptive analysis of {len(product_urls)} products ({min_runs}-{runs_per_url} runs per phase, target +/-{rel_precision:.0%})")
+        print(f"Using max concurrency of {max_concurrent}")
+        results, ensemble_summary = await adaptive_batch_process(
+            product_urls, min_runs=min_runs, max_runs=runs_per_url, rel_precision=rel_precision, max_concurrent=max_concurrent
+        )
+        save_results(results, f"results/batch_results_{timestamp}.json")
+        append_results_parquet(results, results_dataset, batch_id=timestamp)
+        print("\nEnsemble summary:")
+        print(ensemble_summary)
+        ensemble_summary.to_csv(f"results/ensemble_summary_{timestamp}.csv", index=False)
+        # Re-runs mix stored and fresh phase values, so the fixed-run analysis below doesn't apply
+        print("\nBatch analysis complete!")
+        return
     
-    # Run the batch process
-    results = await batch_process(product_urls, runs_per_url=runs_per_url, max_concurrent=max_concurrent)
+    if rerun_phases:
+        print(f"Re-running phases {rerun_phases} from {stored_results_file}")
+        print(f"Using max concurrency of {max_concurrent}")
+        results = await rerun_batch_process(load_results(stored_results_file), rerun_phases, max_concurrent=max_concurrent)
+    else:
+        print(f"Starting batch analysis with {'TEST MODE' if test_mode else 'FULL MODE'}")
+        print(f"Processing {len(product_urls)} products with {runs_per_url} runs each ({len(product_urls) * runs_per_url} total runs)")
+        print(f"Using max concurrency of {max_concurrent}")
+        
+        # Run the batch process
+        results = await batch_process(product_urls, runs_per_url=runs_per_url, max_concurrent=max_concurrent)
     
     # Save final results
     save_results(results, f"results/batch_results_{timestamp}.json")
+    append_results_parquet(results, results_dataset, batch_id=timestamp)
     
     # Analyze results
     df, summary = analyze_results(results)
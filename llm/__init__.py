@@ -0,0 +1 @@
+# This file makes the 'llm' directory a Python package.
@@ -0,0 +1,214 @@
+"""
+Model tier benchmark.
+
+Runs a fixed product set once per routing profile and compares end-to-end
+latency, estimated LLM cost and result drift: how far each product's total
+and phase footprints move from those of the reference profile.
+
+Profiles are "configured" (llm/routing.yaml as it is) and "tier:<name>" (every
+route on one tier). Each profile runs in its own process, because models are
+chosen when the agents are imported.
+
+    python -m llm.benchmark --profiles configured tier:fast tier:strong --runs 2
+
+Products are read from a JSONL file of records with a "url" (analysed from
+scratch) or a stored page-analysis state (brand, category, long_description,
+...), which skips scraping and keeps page changes out of the drift.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+from llm.routing import model_cost
+
+DEFAULT_PRODUCTS = Path(__file__).parent.parent / "data" / "benchmark_products.jsonl"
+
+
+def load_products(path: str) -> List[Dict[str, Any]]:
+    with open(path, "r") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+async def run_product(product: Dict[str, Any], phases: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Analyse one product, recording latency, token usage and cost."""
+    from langchain_core.callbacks import get_usage_metadata_callback
+    from api.graph import footprint, setup_graph, stored_state
+
+    stored = product.get("brand") is not None
+    graph = setup_graph(phases=phases, from_page_analysis=stored)
+    initial_state = {
+        "url": product["url"],
+        "user_input": f"Analyze product from URL: {product['url']}",
+        "messages": [("human", f"Analyze carbon footprint for product at URL: {product['url']}")]
+    }
+    if stored:
+        initial_state.update(stored_state(product))
+
+    start = time.perf_counter()
+    error = None
+    state = {}
+    with get_usage_metadata_callback() as usage:
+        try:
+            state = await graph.ainvoke(initial_state, {"configurable": {"thread_id": f"benchmark-{uuid.uuid4().hex}"}})
+        except Exception as e:
+            error = str(e)
+    latency = time.perf_counter() - start
+
+    usage_by_model = {
+        model: {"input_tokens": u.get("input_tokens", 0), "output_tokens": u.get("output_tokens", 0)}
+        for model, u in usage.usage_metadata.items()
+    }
+    result = footprint(state) if not error else None
+    return {
+        "url": product["url"],
+        "latency": latency,
+        "usage": usage_by_model,
+        "cost": sum(model_cost(model, u["input_tokens"], u["output_tokens"]) or 0.0 for model, u in usage_by_model.items()),
+        "total": result["total"] if result else None,
+        "by_phase": result["by_phase"] if result else {},
+        "error": error,
+    }
+
+
+async def run_profile(products: List[Dict[str, Any]], runs: int, phases: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """Run every product runs times, one at a time so latencies are not skewed by each other."""
+    results = []
+    for run in range(runs):
+        for product in products:
+            result = await run_product(product, phases)
+            print(f"  run {run + 1}/{runs} {product['url'][:60]}: {result['latency']:.1f}s, ${result['cost']:.4f}"
+                  + (f", failed: {result['error']}" if result["error"] else f", {result['total']} kg CO2e"))
+            results.append({**result, "run": run})
+    return results
+
+
+def _relative_difference(value: Optional[float], reference: Optional[float]) -> Optional[float]:
+    if value is None or not reference:
+        return None
+    return abs(value - reference) / abs(reference)
+
+
+def compare_profiles(results: Dict[str, List[Dict[str, Any]]], reference: str) -> pd.DataFrame:
+    """
+    One row per profile: runs, failures, latency (mean, p50, max), mean cost per
+    run, and drift: mean and max relative difference of the products' mean
+    totals from the reference profile, and the mean over phases.
+    """
+    def product_means(runs: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        by_url: Dict[str, List[Dict[str, Any]]] = {}
+        for r in runs:
+            if not r["error"]:
+                by_url.setdefault(r["url"], []).append(r)
+        return {
+            url: {
+                "total": statistics.mean(r["total"] for r in product_runs),
+                "by_phase": {
+                    phase: statistics.mean(r["by_phase"][phase] for r in product_runs if phase in r["by_phase"])
+                    for phase in {phase for r in product_runs for phase in r["by_phase"]}
+                },
+            }
+            for url, product_runs in by_url.items()
+        }
+
+    reference_means = product_means(results[reference])
+    rows = []
+    for profile, runs in results.items():
+        latencies = [r["latency"] for r in runs]
+        means = product_means(runs)
+        total_drift = [
+            d for url, m in means.items() if url in reference_means
+            if (d := _relative_difference(m["total"], reference_means[url]["total"])) is not None
+        ]
+        phase_drift = [
+            d for url, m in means.items() if url in reference_means
+            for phase, value in m["by_phase"].items()
+            if (d := _relative_difference(value, reference_means[url]["by_phase"].get(phase))) is not None
+        ]
+        rows.append({
+            "profile": profile,
+            "runs": len(runs),
+            "failures": sum(1 for r in runs if r["error"]),
+            "latency_mean": statistics.mean(latencies) if latencies else None,
+            "latency_p50": statistics.median(latencies) if latencies else None,
+            "latency_max": max(latencies) if latencies else None,
+            "cost_per_run": statistics.mean(r["cost"] for r in runs) if runs else None,
+            "drift_total_mean": statistics.mean(total_drift) if total_drift else None,
+            "drift_total_max": max(total_drift) if total_drift else None,
+            "drift_phase_mean": statistics.mean(phase_drift) if phase_drift else None,
+        })
+    return pd.DataFrame(rows).set_index("profile")
+
+
+def _profile_env(profile: str) -> Dict[str, str]:
+    env = {k: v for k, v in os.environ.items() if k != "LLM_ROUTING_TIER"}
+    if profile.startswith("tier:"):
+        env["LLM_ROUTING_TIER"] = profile.split(":", 1)[1]
+    elif profile != "configured":
+        raise ValueError(f"Unknown profile {profile}. Use 'configured' or 'tier:<name>'")
+    return env
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare latency, cost and result drift of model routing profiles.")
+    parser.add_argument("--products", default=str(DEFAULT_PRODUCTS), help="JSONL file of products (urls or stored states)")
+    parser.add_argument("--profiles", nargs="+", default=["configured", "tier:fast", "tier:standard", "tier:strong"],
+                        help="'configured' and/or 'tier:<name>' profiles")
+    parser.add_argument("--reference", default=None, help="Profile drift is measured against (defaults to the last profile)")
+    parser.add_argument("--runs", type=int, default=1, help="Runs per product and profile")
+    parser.add_argument("--phases", nargs="+", default=None, help="Lifecycle phases to run (defaults to all)")
+    parser.add_argument("--output", default=f"results/model_benchmark_{int(time.time())}.json", help="Report file")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    products = load_products(args.products)
+
+    if args.worker:
+        # One profile, run in this process (the routing is set in the environment)
+        from dotenv import load_dotenv
+        load_dotenv(".env.local")
+        results = asyncio.run(run_profile(products, args.runs, args.phases))
+        with open(args.output, "w") as f:
+            json.dump(results, f)
+        return
+
+    reference = args.reference or args.profiles[-1]
+    if reference not in args.profiles:
+        parser.error(f"The reference profile {reference} must be one of the profiles")
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for profile in args.profiles:
+            print(f"Profile {profile}: {len(products)} products x {args.runs} runs")
+            out = os.path.join(tmp, "results.json")
+            command = [sys.executable, "-m", "llm.benchmark", "--worker", "--products", args.products,
+                       "--runs", str(args.runs), "--output", out]
+            if args.phases:
+                command += ["--phases", *args.phases]
+            subprocess.run(command, env=_profile_env(profile), check=True)
+            with open(out, "r") as f:
+                results[profile] = json.load(f)
+
+    comparison = compare_profiles(results, reference)
+    print(f"\nDrift is relative to {reference}")
+    print(comparison.to_string(float_format=lambda x: f"{x:.4f}"))
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump({"reference": reference, "comparison": comparison.reset_index().to_dict(orient="records"), "runs": results}, f, indent=2)
+    print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
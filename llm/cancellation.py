@@ -0,0 +1,132 @@
+"""
+Cooperative cancellation of analyses.
+
+An analysis runs inside a CancelScope. When the client disconnects or the
+deadline passes, the scope is cancelled along with the task driving the
+graph; LangGraph passes the cancellation on to the running nodes, agents and
+async tool calls. Work running in executor threads (the synchronous emissions
+factor tool and its LLM calls) can't be interrupted, so LLM calls check the
+scope before starting and raise AnalysisCancelled once it is cancelled.
+
+The scope is held in a context variable, which tasks and executor threads
+started by the graph inherit. A session running several analyses (a
+comparison) gives each one a child scope: cancelling the session cancels them
+all, while one analysis reaching its deadline leaves the others running.
+"""
+
+import threading
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+
+class AnalysisCancelled(Exception):
+    """The analysis this work belongs to was cancelled."""
+
+
+class CancelScope:
+    def __init__(self, parent: Optional["CancelScope"] = None):
+        self._event = threading.Event()
+        self.reason: Optional[str] = None
+        self.parent = parent
+
+    @property
+    def cancelled(self) -> bool:
+        """Whether this scope, or the scope it was started in, is cancelled."""
+        return self._event.is_set() or (self.parent is not None and self.parent.cancelled)
+
+    def cancel(self, reason: str) -> None:
+        """Cancel the scope; only the first reason is kept and counted."""
+        if self._event.is_set():
+            return
+        self.reason = reason
+        self._event.set()
+        cancellation_metrics.record_cancel(reason)
+
+    def check(self) -> None:
+        if self._event.is_set():
+            raise AnalysisCancelled(self.reason)
+        if self.parent is not None:
+            self.parent.check()
+
+
+_current_scope: ContextVar[Optional[CancelScope]] = ContextVar("cancel_scope", default=None)
+
+
+def enter_scope() -> CancelScope:
+    """Start a cancel scope for the analysis run by the current task."""
+    scope = CancelScope()
+    _current_scope.set(scope)
+    return scope
+
+
+def enter_child_scope() -> CancelScope:
+    """
+    Start a cancel scope for one of the analyses of the current scope (run by
+    the current task). It is cancelled along with the current scope, but
+    cancelling it leaves the current scope and its other children running.
+    """
+    scope = CancelScope(parent=_current_scope.get())
+    _current_scope.set(scope)
+    return scope
+
+
+def current_scope() -> Optional[CancelScope]:
+    return _current_scope.get()
+
+
+def check_cancelled() -> None:
+    """
+    Raises:
+        AnalysisCancelled: If the current analysis has been cancelled
+    """
+    scope = _current_scope.get()
+    if scope is not None:
+        scope.check()
+
+
+class CancellationMetrics:
+    """
+    Counts of cancelled analyses, the work they abandoned (graph nodes stopped
+    part-way, whose LLM calls so far were wasted) and the work they reclaimed
+    (LLM calls cancelled in flight or never started).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.analyses: Dict[str, int] = {}
+        self.nodes_abandoned: Dict[str, int] = {}
+        self.llm_calls_cancelled = 0
+        self.llm_calls_skipped = 0
+
+    def record_cancel(self, reason: str) -> None:
+        with self._lock:
+            self.analyses[reason] = self.analyses.get(reason, 0) + 1
+
+    def record_node_abandoned(self, node: str) -> None:
+        with self._lock:
+            self.nodes_abandoned[node] = self.nodes_abandoned.get(node, 0) + 1
+
+    def record_llm_call_cancelled(self) -> None:
+        with self._lock:
+            self.llm_calls_cancelled += 1
+
+    def record_llm_call_skipped(self) -> None:
+        with self._lock:
+            self.llm_calls_skipped += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "analyses_cancelled": dict(self.analyses),
+                "abandoned": {
+                    "nodes": sum(self.nodes_abandoned.values()),
+                    "by_node": dict(self.nodes_abandoned),
+                },
+                "reclaimed": {
+                    "llm_calls_cancelled": self.llm_calls_cancelled,
+                    "llm_calls_skipped": self.llm_calls_skipped,
+                },
+            }
+
+
+cancellation_metrics = CancellationMetrics()
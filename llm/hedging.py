@@ -0,0 +1,243 @@
+"""
+Request hedging for tail-latency LLM calls.
+
+A hedged call starts the request as usual. If it is still running once it has
+exceeded a configurable percentile of the recent latency distribution for that
+model, a duplicate request is sent and whichever succeeds first is kept (a
+failed attempt only fails the call once the other one has failed too).
+The fraction of calls that may be hedged is capped so a slow provider does not
+double our load.
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextvars import copy_context
+from typing import Any, Dict, Optional
+
+import numpy as np
+from langchain_openai import ChatOpenAI
+
+from llm.cancellation import cancellation_metrics, current_scope
+from llm.tracing import current_span, span
+
+# Duplicate requests made from synchronous code (e.g. the emissions factor
+# sources) are raced on this pool.
+_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="llm-hedge")
+
+
+class LatencyTracker:
+    """
+    Rolling latency distribution and hedging counters for a single model.
+    """
+
+    def __init__(self, window: int = 200):
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def record(self, latency: float) -> None:
+        with self._lock:
+            self._latencies.append(latency)
+
+    def threshold(self, percentile: float, min_samples: int) -> Optional[float]:
+        """Latency (in seconds) after which a call should be hedged, if known yet."""
+        with self._lock:
+            if len(self._latencies) < min_samples:
+                return None
+            return float(np.percentile(self._latencies, percentile))
+
+    def start_call(self) -> None:
+        with self._lock:
+            self.calls += 1
+
+    def try_hedge(self, max_rate: float) -> bool:
+        """Reserve a hedge if doing so keeps the hedge rate under max_rate."""
+        with self._lock:
+            if self.hedges + 1 > max_rate * self.calls:
+                return False
+            self.hedges += 1
+            return True
+
+    def record_hedge_win(self) -> None:
+        with self._lock:
+            self.hedge_wins += 1
+
+    def snapshot(self, percentile: float) -> Dict[str, Any]:
+        with self._lock:
+            latencies = list(self._latencies)
+            calls, hedges, wins = self.calls, self.hedges, self.hedge_wins
+        return {
+            "calls": calls,
+            "hedges": hedges,
+            "hedge_wins": wins,
+            "hedge_rate": hedges / calls if calls else 0.0,
+            "latency_p50": float(np.percentile(latencies, 50)) if latencies else None,
+            "latency_hedge_threshold": float(np.percentile(latencies, percentile)) if latencies else None,
+            "samples": len(latencies),
+        }
+
+
+_trackers: Dict[str, LatencyTracker] = {}
+_trackers_lock = threading.Lock()
+
+
+def get_tracker(model_name: str, window: int = 200) -> LatencyTracker:
+    with _trackers_lock:
+        if model_name not in _trackers:
+            _trackers[model_name] = LatencyTracker(window)
+        return _trackers[model_name]
+
+
+class HedgedChatOpenAI(ChatOpenAI):
+    """
+    ChatOpenAI that hedges slow requests.
+
+    Hedging is disabled when hedge_percentile is None. Because bind_tools and
+    with_structured_output wrap the same model instance, agents and structured
+    extractors built on top of this class are hedged too.
+    """
+
+    hedge_percentile: Optional[float] = None
+    hedge_max_rate: float = 0.05
+    hedge_min_samples: int = 20
+    hedge_window: int = 200
+
+    def _tracker(self) -> LatencyTracker:
+        return get_tracker(self.model_name, self.hedge_window)
+
+    def _timed_generate(self, messages, stop, run_manager, **kwargs):
+        start = time.perf_counter()
+        result = super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        self._tracker().record(time.perf_counter() - start)
+        return result
+
+    async def _timed_agenerate(self, messages, stop, run_manager, **kwargs):
+        start = time.perf_counter()
+        result = await super()._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        self._tracker().record(time.perf_counter() - start)
+        return result
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        self._check_cancelled()
+        with self._llm_span() as llm_span:
+            result = self._hedged_generate(messages, stop, run_manager, **kwargs)
+            self._record_usage(llm_span, result)
+            return result
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        self._check_cancelled()
+        try:
+            with self._llm_span() as llm_span:
+                result = await self._hedged_agenerate(messages, stop, run_manager, **kwargs)
+                self._record_usage(llm_span, result)
+                return result
+        except asyncio.CancelledError:
+            cancellation_metrics.record_llm_call_cancelled()
+            raise
+
+    def _llm_span(self):
+        # Successive calls under one span (an agent node) are its ReAct iterations
+        parent = current_span()
+        return span("llm", "llm", model=self.model_name, **({"iteration": parent.next_iteration()} if parent else {}))
+
+    @staticmethod
+    def _record_usage(llm_span, result) -> None:
+        if llm_span is None or not result.generations:
+            return
+        usage = getattr(result.generations[0].message, "usage_metadata", None) or {}
+        llm_span.set(input_tokens=usage.get("input_tokens"), output_tokens=usage.get("output_tokens"))
+
+    @staticmethod
+    def _check_cancelled() -> None:
+        # Calls made for a cancelled analysis (e.g. from executor threads, which
+        # can't be interrupted) are not started
+        scope = current_scope()
+        if scope is not None and scope.cancelled:
+            cancellation_metrics.record_llm_call_skipped()
+            scope.check()
+
+    def _hedged_generate(self, messages, stop, run_manager, **kwargs):
+        tracker = self._tracker()
+        tracker.start_call()
+        threshold = None
+        if self.hedge_percentile is not None:
+            threshold = tracker.threshold(self.hedge_percentile, self.hedge_min_samples)
+        if threshold is None:
+            return self._timed_generate(messages, stop, run_manager, **kwargs)
+
+        primary = _executor.submit(copy_context().run, self._timed_generate, messages, stop, run_manager, **kwargs)
+        done, _ = wait([primary], timeout=threshold)
+        if done or not tracker.try_hedge(self.hedge_max_rate):
+            return primary.result()
+
+        # The duplicate does not report to the run manager so callbacks only see one generation
+        hedge = _executor.submit(copy_context().run, self._timed_generate, messages, stop, None, **kwargs)
+        # The first attempt to succeed wins; a failure only counts once both have failed.
+        # The loser can't be interrupted, so it records its own latency when it finishes
+        pending, winner = {primary, hedge}, None
+        while pending and winner is None:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            winner = next((f for f in (primary, hedge) if f in done and f.exception() is None), None)
+        if winner is None:
+            # Both failed: raise the error the call would have had without hedging
+            return primary.result()
+        if winner is hedge:
+            tracker.record_hedge_win()
+        return winner.result()
+
+    async def _hedged_agenerate(self, messages, stop, run_manager, **kwargs):
+        tracker = self._tracker()
+        tracker.start_call()
+        threshold = None
+        if self.hedge_percentile is not None:
+            threshold = tracker.threshold(self.hedge_percentile, self.hedge_min_samples)
+        if threshold is None:
+            return await self._timed_agenerate(messages, stop, run_manager, **kwargs)
+
+        started = {}
+        primary = asyncio.ensure_future(self._timed_agenerate(messages, stop, run_manager, **kwargs))
+        started[primary] = time.perf_counter()
+        try:
+            done, _ = await asyncio.wait([primary], timeout=threshold)
+        except asyncio.CancelledError:
+            primary.cancel()
+            raise
+        if done or not tracker.try_hedge(self.hedge_max_rate):
+            return await primary
+
+        hedge = asyncio.ensure_future(self._timed_agenerate(messages, stop, None, **kwargs))
+        started[hedge] = time.perf_counter()
+        # The first attempt to succeed wins; a failure only counts once both have failed
+        pending, winner = {primary, hedge}, None
+        try:
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((t for t in (primary, hedge)
+                               if t in done and not t.cancelled() and t.exception() is None), None)
+        except asyncio.CancelledError:
+            primary.cancel()
+            hedge.cancel()
+            raise
+        if winner is None:
+            # Both failed: raise the error the call would have had without hedging
+            return primary.result()
+        for loser in pending:
+            loser.cancel()
+            # The loser took at least this long; leaving it out would bias the
+            # latency window (and the hedge threshold) towards fast calls
+            tracker.record(time.perf_counter() - started[loser])
+        if winner is hedge:
+            tracker.record_hedge_win()
+        return winner.result()
+
+
+def hedging_metrics(percentile: Optional[float] = None) -> Dict[str, Any]:
+    """Per-model call, hedge and latency statistics."""
+    with _trackers_lock:
+        trackers = dict(_trackers)
+    return {name: tracker.snapshot(percentile or 95) for name, tracker in trackers.items()}
@@ -0,0 +1,56 @@
+"""
+Shared chat model interface.
+
+Every agent, page-analysis extractor and emissions factor source gets its model
+from get_chat_model so that cross-cutting behaviour (like request hedging) can
+be configured in one place. Models are usually chosen by route, so the model
+of each node or tool is set in llm/routing.yaml (see llm/routing.py).
+
+Hedging is configured with environment variables:
+- LLM_HEDGE_PERCENTILE: Latency percentile after which a duplicate request is
+  sent (e.g. 95). Hedging is disabled when unset.
+- LLM_HEDGE_MAX_RATE: Maximum fraction of calls that may be hedged (default 0.05).
+- LLM_HEDGE_MIN_SAMPLES: Number of observed latencies required before hedging
+  starts (default 20).
+"""
+
+import os
+from typing import Any, Dict, Optional
+
+from llm.hedging import HedgedChatOpenAI, hedging_metrics
+from llm.routing import model_for, routing_table
+
+
+def _hedge_settings() -> Dict[str, Any]:
+    percentile = os.environ.get("LLM_HEDGE_PERCENTILE")
+    return {
+        "hedge_percentile": float(percentile) if percentile else None,
+        "hedge_max_rate": float(os.environ.get("LLM_HEDGE_MAX_RATE", 0.05)),
+        "hedge_min_samples": int(os.environ.get("LLM_HEDGE_MIN_SAMPLES", 20)),
+    }
+
+
+def get_chat_model(model_name: Optional[str] = None, route: Optional[str] = None, **kwargs: Any) -> HedgedChatOpenAI:
+    """
+    Create a chat model.
+
+    Args:
+        model_name: The OpenAI model name (e.g. "gpt-4o")
+        route: A route in the model routing file (e.g. "ef.picker"); its model
+            is used instead of model_name
+        **kwargs: Extra ChatOpenAI arguments such as temperature
+
+    Returns:
+        A ChatOpenAI compatible model
+    """
+    if route is not None:
+        model_name = model_for(route)
+    if model_name is None:
+        raise ValueError("Either a model name or a route is required")
+    return HedgedChatOpenAI(model_name=model_name, **{**_hedge_settings(), **kwargs})
+
+
+def llm_metrics() -> Dict[str, Any]:
+    """Metrics for the shared model interface, keyed by model name."""
+    percentile = os.environ.get("LLM_HEDGE_PERCENTILE")
+    return {"hedging": hedging_metrics(float(percentile) if percentile else None), "routing": routing_table()}
@@ -0,0 +1,70 @@
+"""
+Per-node model routing.
+
+llm/routing.yaml assigns a model to every node or tool that calls an LLM (page
+analysis extractors, lifecycle agents, emissions factor sources, the picker,
+...), either through a tier (fast, standard, strong) or by model name. Call
+sites ask for a route with get_chat_model(route=...) instead of naming a model.
+
+Configured with environment variables:
+- LLM_ROUTING_FILE: Use this routing file instead of llm/routing.yaml.
+- LLM_ROUTING_TIER: Run every route on this tier (used by the benchmark to
+  compare tiers).
+"""
+
+import os
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import yaml
+
+_ROUTING_FILE = Path(__file__).parent / "routing.yaml"
+
+
+@lru_cache(maxsize=1)
+def load_routing() -> Dict[str, Any]:
+    """
+    Raises:
+        ValueError: If the routing file has no tiers or routes
+    """
+    with open(os.environ.get("LLM_ROUTING_FILE") or _ROUTING_FILE, "r") as f:
+        routing = yaml.safe_load(f)
+    if not routing.get("tiers") or not routing.get("routes"):
+        raise ValueError("The model routing file must define tiers and routes")
+    return routing
+
+
+def model_for(route: str) -> str:
+    """
+    The model name for a route.
+
+    Raises:
+        KeyError: If the route is not in the routing file
+        ValueError: If LLM_ROUTING_TIER names an unknown tier
+    """
+    routing = load_routing()
+    if route not in routing["routes"]:
+        raise KeyError(f"No model route '{route}'. Add it to the routing file.")
+    tier = os.environ.get("LLM_ROUTING_TIER")
+    if tier:
+        if tier not in routing["tiers"]:
+            raise ValueError(f"Unknown LLM_ROUTING_TIER {tier}. Expected one of {list(routing['tiers'])}")
+        return routing["tiers"][tier]
+    target = routing["routes"][route]
+    return routing["tiers"].get(target, target)
+
+
+def routing_table() -> Dict[str, str]:
+    """Model of every route."""
+    return {route: model_for(route) for route in load_routing()["routes"]}
+
+
+def model_cost(model: str, input_tokens: int, output_tokens: int) -> Optional[float]:
+    """Estimated cost in USD of a model's token usage, or None if it has no price."""
+    prices = load_routing().get("prices", {})
+    matches = [name for name in prices if model.startswith(name)]
+    if not matches:
+        return None
+    price = prices[max(matches, key=len)]
+    return (input_tokens * price["input"] + output_tokens * price["output"]) / 1e6
@@ -0,0 +1,201 @@
+"""
+Span tracing of analyses, without LangSmith.
+
+Each WebSocket session and job is a trace. Its spans cover the graph nodes,
+every LLM call (each model turn of a ReAct agent is one iteration), the
+emissions factor tools and their sources, and page scrapes, with parent/child
+links and timings. Finished traces are appended to a JSONL file, one span per
+line, which python -m llm.waterfall renders as a waterfall with the critical
+path.
+
+Spans are only recorded inside a trace, so tools and models used elsewhere
+(notebooks, the batch processor) are unaffected. The current span is held in
+a context variable, which tasks and executor threads started by the graph
+inherit, so spans nest across them.
+
+Configured with environment variables:
+- TRACE_EXPORT_PATH: JSONL file traces are appended to (unset disables tracing).
+"""
+
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+
+class Span:
+    def __init__(self, trace: "Trace", name: str, kind: str, parent: Optional["Span"], attributes: Dict[str, Any]):
+        self.trace = trace
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.name = name
+        self.kind = kind
+        self.attributes = attributes
+        self.start = time.time()
+        self.end: Optional[float] = None
+        self.status = "ok"
+        self.error: Optional[str] = None
+        self._llm_calls = 0
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def next_iteration(self) -> int:
+        """Number of the LLM call about to start under this span (ReAct iterations)."""
+        with self.trace.lock:
+            self._llm_calls += 1
+            return self._llm_calls
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        self.end = time.time()
+        if error is not None:
+            self.status = "cancelled" if type(error).__name__ in ("CancelledError", "AnalysisCancelled") else "error"
+            self.error = f"{type(error).__name__}: {error}"
+        self.trace.add(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start": self.start,
+            "end": self.end,
+            "duration": self.end - self.start if self.end is not None else None,
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+class Trace:
+    def __init__(self):
+        self.trace_id = uuid.uuid4().hex
+        self.spans: List[Span] = []
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def add(self, span: Span) -> None:
+        # Spans finishing after the trace was exported (abandoned executor work) are dropped
+        with self.lock:
+            if not self.closed:
+                self.spans.append(span)
+
+
+class JsonlExporter:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, trace: Trace) -> None:
+        lines = "".join(json.dumps(span.to_dict(), default=str) + "\n" for span in trace.spans)
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a") as f:
+                f.write(lines)
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("trace_span", default=None)
+
+
+def _exporter() -> Optional[JsonlExporter]:
+    path = os.environ.get("TRACE_EXPORT_PATH")
+    return JsonlExporter(path) if path else None
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def annotate(**attributes: Any) -> None:
+    """Add attributes (e.g. the product URL) to the current span, if there is one."""
+    current = _current_span.get()
+    if current is not None:
+        current.set(**attributes)
+
+
+@contextmanager
+def start_trace(name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+    """
+    Trace a session (a WebSocket analysis, a job). The root span is yielded, or
+    None when tracing is disabled. The trace is exported when it ends.
+    """
+    exporter = _exporter()
+    if exporter is None:
+        yield None
+        return
+    trace = Trace()
+    root = Span(trace, name, "session", None, attributes)
+    token = _current_span.set(root)
+    try:
+        yield root
+    except BaseException as e:
+        root.finish(e)
+        raise
+    else:
+        root.finish()
+    finally:
+        _current_span.reset(token)
+        with trace.lock:
+            trace.closed = True
+        try:
+            exporter.export(trace)
+            print(f"Tracing: Trace {trace.trace_id} ({len(trace.spans)} spans) written to {exporter.path}")
+        except OSError as e:
+            print(f"Tracing: Could not export trace {trace.trace_id}: {e}")
+
+
+@contextmanager
+def span(name: str, kind: str = "internal", **attributes: Any) -> Iterator[Optional[Span]]:
+    """A child span of the current span; does nothing (yields None) outside a trace."""
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(parent.trace, name, kind, parent, attributes)
+    token = _current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.finish(e)
+        raise
+    else:
+        child.finish()
+    finally:
+        _current_span.reset(token)
+
+
+def trace_session(name: str):
+    """Decorator running each call of an async session function (a WebSocket endpoint, a job run) as a trace."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with start_trace(name):
+                return await fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def traced(name: str, kind: str = "internal"):
+    """Decorator running each call of a function (sync or async) in a span."""
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                with span(name, kind):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with span(name, kind):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,170 @@
+"""
+Waterfall and critical path of exported traces (see llm/tracing.py).
+
+    python -m llm.waterfall traces.jsonl              # the latest trace
+    python -m llm.waterfall traces.jsonl --list       # traces in the file
+    python -m llm.waterfall traces.jsonl --slowest --min-ms 50
+
+The waterfall draws every span as a bar on the trace's timeline, indented by
+depth. Spans marked with * are on the critical path: the chain of spans the
+session actually waited on, found by walking back from the end of each span
+through the child that finished last before it. The summary splits the
+critical path's time by span kind and name, so the spans worth speeding up
+are the ones at the top.
+"""
+
+import argparse
+import json
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+# Attributes shown next to span names in the waterfall
+_SHOWN_ATTRIBUTES = ["url", "model", "iteration", "process_desc", "requests", "looked_up", "input_tokens", "output_tokens"]
+
+
+def load_traces(path: str) -> Dict[str, List[Dict[str, Any]]]:
+    """Spans of every trace in a JSONL export, by trace id, in file order."""
+    traces: Dict[str, List[Dict[str, Any]]] = {}
+    with open(path, "r") as f:
+        for line in f:
+            if line.strip():
+                span = json.loads(line)
+                traces.setdefault(span["trace_id"], []).append(span)
+    return traces
+
+
+def _root(spans: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Raises:
+        ValueError: If the trace has no root span
+    """
+    roots = [span for span in spans if span["parent_id"] is None]
+    if not roots:
+        raise ValueError("The trace has no root span")
+    return roots[0]
+
+
+def _children(spans: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+    children = defaultdict(list)
+    for span in spans:
+        if span["parent_id"] is not None:
+            children[span["parent_id"]].append(span)
+    for siblings in children.values():
+        siblings.sort(key=lambda span: span["start"])
+    return children
+
+
+def critical_path(spans: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """The spans on the critical path, from the root down, in time order within each parent."""
+    children = _children(spans)
+
+    def walk(span: Dict[str, Any]) -> List[Dict[str, Any]]:
+        path = []
+        cursor = span["end"]
+        # Children are visited latest end first; each one that finished before the
+        # cursor is what the parent waited on until then
+        for child in sorted(children[span["span_id"]], key=lambda c: c["end"], reverse=True):
+            if child["end"] <= cursor:
+                path = walk(child) + path
+                cursor = child["start"]
+        return [span] + path
+
+    return walk(_root(spans))
+
+
+def critical_path_breakdown(spans: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Self time (seconds) of the critical path by span kind and by span name."""
+    path = critical_path(spans)
+    on_path = {span["span_id"] for span in path}
+    children = _children(spans)
+    by_kind: Dict[str, float] = defaultdict(float)
+    by_name: Dict[str, float] = defaultdict(float)
+    for span in path:
+        waited = sum(child["duration"] for child in children[span["span_id"]] if child["span_id"] in on_path)
+        self_time = max(0.0, span["duration"] - waited)
+        by_kind[span["kind"]] += self_time
+        by_name[span["name"]] += self_time
+    return {
+        "duration": _root(spans)["duration"],
+        "by_kind": dict(sorted(by_kind.items(), key=lambda item: -item[1])),
+        "by_name": dict(sorted(by_name.items(), key=lambda item: -item[1])),
+    }
+
+
+def render_waterfall(spans: List[Dict[str, Any]], width: int = 60, min_ms: float = 0,
+                     max_depth: Optional[int] = None) -> str:
+    """Text waterfall of a trace: offset, duration and a timeline bar per span."""
+    root = _root(spans)
+    children = _children(spans)
+    on_path = {span["span_id"] for span in critical_path(spans)}
+    total = root["duration"] or 1e-9
+    lines = [f"Trace {root['trace_id']} {root['name']}{_describe(root)}: {root['duration']:.2f}s, {len(spans)} spans"]
+
+    def draw(span: Dict[str, Any], depth: int) -> None:
+        if span["duration"] * 1000 < min_ms and span["span_id"] not in on_path:
+            return
+        offset = span["start"] - root["start"]
+        begin = min(width - 1, int(offset / total * width))
+        length = max(1, min(width - begin, round(span["duration"] / total * width)))
+        bar = " " * begin + ("#" if span["span_id"] in on_path else "=") * length
+        status = "" if span["status"] == "ok" else f" [{span['status']}]"
+        marker = "*" if span["span_id"] in on_path else " "
+        lines.append(f"{offset:8.2f}s {span['duration']:8.2f}s |{bar:<{width}}| {marker} {'  ' * depth}"
+                     f"{span['name']}{_describe(span)}{status}")
+        if max_depth is None or depth < max_depth:
+            for child in children[span["span_id"]]:
+                draw(child, depth + 1)
+
+    for child in children[root["span_id"]]:
+        draw(child, 0)
+    return "\n".join(lines)
+
+
+def _describe(span: Dict[str, Any]) -> str:
+    shown = [f"{key}={span['attributes'][key]}" for key in _SHOWN_ATTRIBUTES if span["attributes"].get(key) is not None]
+    return f" ({', '.join(shown)})" if shown else ""
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Render the waterfall and critical path of a trace.")
+    parser.add_argument("path", help="JSONL trace export (TRACE_EXPORT_PATH)")
+    parser.add_argument("--trace", default=None, help="Trace id, or a prefix of it (defaults to the latest trace)")
+    parser.add_argument("--slowest", action="store_true", help="Render the slowest trace in the file")
+    parser.add_argument("--list", action="store_true", help="List the traces in the file")
+    parser.add_argument("--width", type=int, default=60, help="Width of the timeline bars")
+    parser.add_argument("--min-ms", type=float, default=0, help="Hide spans shorter than this, unless they are on the critical path")
+    parser.add_argument("--depth", type=int, default=None, help="Deepest span level to draw")
+    args = parser.parse_args()
+
+    traces = load_traces(args.path)
+    if not traces:
+        parser.error(f"No traces in {args.path}")
+
+    if args.list:
+        for trace_id, spans in traces.items():
+            root = _root(spans)
+            print(f"{trace_id} {root['name']:<10} {root['duration']:8.2f}s {len(spans):5} spans{_describe(root)}")
+        return
+
+    if args.trace:
+        matches = [trace_id for trace_id in traces if trace_id.startswith(args.trace)]
+        if len(matches) != 1:
+            parser.error(f"{len(matches)} traces match {args.trace}")
+        spans = traces[matches[0]]
+    elif args.slowest:
+        spans = max(traces.values(), key=lambda spans: _root(spans)["duration"])
+    else:
+        spans = list(traces.values())[-1]
+
+    print(render_waterfall(spans, args.width, args.min_ms, args.depth))
+    breakdown = critical_path_breakdown(spans)
+    print(f"\nCritical path ({breakdown['duration']:.2f}s) by kind:")
+    for kind, seconds in breakdown["by_kind"].items():
+        print(f"  {kind:<12} {seconds:8.2f}s {seconds / breakdown['duration']:6.1%}")
+    print("Critical path by span:")
+    for name, seconds in list(breakdown["by_name"].items())[:10]:
+        print(f"  {name:<40} {seconds:8.2f}s {seconds / breakdown['duration']:6.1%}")
+
+
+if __name__ == "__main__":
+    main()
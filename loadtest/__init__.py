@@ -0,0 +1,7 @@
+"""
+WebSocket load testing.
+
+python -m loadtest starts the real FastAPI app with stub LLM and scraper
+backends (loadtest/server.py) and drives hundreds of concurrent /ws sessions
+against it, measuring the streaming path rather than OpenAI or Firecrawl.
+"""
@@ -0,0 +1,272 @@
+"""
+WebSocket load test.
+
+Starts the app with stub backends (loadtest/server.py) in a subprocess, or
+targets a running server with --url, then opens N concurrent /ws sessions
+for every concurrency level and records per session:
+
+- connect: WebSocket handshake time,
+- first_frame: time from sending the request to the first frame after it,
+- e2e: time from sending the request to AnalysisComplete,
+- frames and frames/s,
+- the outcome: complete, shed (ServerBusy), error (including sessions the
+  server sent an ErrorMessage frame) or timeout.
+
+While a level runs, /metrics is polled for the server's event loop lag and
+CPU use (api/loop_monitor.py). Each level is summarised with latency
+percentiles, session and frame throughput, and the concurrency the server
+sustains: the highest level with no failed sessions and a p99 event loop lag
+under --max-lag-ms.
+
+    python -m loadtest --clients 50 100 200 --ramp 5 --llm-latency-ms 200
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+import pandas as pd
+import websockets
+
+from api.framing import MSGPACK_PROTOCOL, TEXT_PROTOCOL, decode_envelope, parse_message
+
+DEFAULT_PRODUCT_URL = "https://example.com/products/stub-office-chair"
+
+
+def _percentile(values: List[float], percentile: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percentile / 100))]
+
+
+async def run_session(ws_url: str, request: Dict[str, Any], protocol: str, timeout: float) -> Dict[str, Any]:
+    """Run one analysis session and time it."""
+    result: Dict[str, Any] = {"outcome": "error", "connect": None, "first_frame": None, "e2e": None, "frames": 0, "error": None}
+    server_error = None
+    start = time.perf_counter()
+    try:
+        async with websockets.connect(ws_url, subprotocols=[protocol], max_size=None, open_timeout=timeout) as ws:
+            result["connect"] = time.perf_counter() - start
+            # Wait for the connection message, so the request is timed on its own
+            await asyncio.wait_for(ws.recv(), timeout)
+            await ws.send(json.dumps(request))
+            sent = time.perf_counter()
+            async with asyncio.timeout(timeout):
+                async for message in ws:
+                    frames = decode_envelope(message) if isinstance(message, bytes) else [parse_message(message)]
+                    if not frames:
+                        continue
+                    if result["first_frame"] is None:
+                        result["first_frame"] = time.perf_counter() - sent
+                    result["frames"] += len(frames)
+                    types = [frame["type"] for frame in frames]
+                    if server_error is None and "ErrorMessage" in types:
+                        server_error = f"ErrorMessage: {frames[types.index('ErrorMessage')].get('data')}"
+                    if "ServerBusy" in types:
+                        result["outcome"] = "shed"
+                        break
+                    if "AnalysisComplete" in types:
+                        result["outcome"] = "complete"
+                        result["e2e"] = time.perf_counter() - sent
+                        break
+                else:
+                    result["error"] = "Connection closed before AnalysisComplete"
+    except TimeoutError:
+        result["outcome"] = "timeout"
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    # A session the server reported an error for failed, whether the server
+    # then carried on, closed the connection or left it to time out
+    if server_error is not None and result["outcome"] != "shed":
+        result["outcome"] = "error"
+        result["error"] = server_error
+    return result
+
+
+async def poll_metrics(http_url: str, samples: List[Dict[str, Any]], interval: float = 1.0) -> None:
+    async with httpx.AsyncClient(base_url=http_url, timeout=10) as client:
+        while True:
+            try:
+                response = await client.get("/metrics")
+                samples.append(response.json().get("event_loop", {}))
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(interval)
+
+
+async def run_level(ws_url: str, http_url: str, clients: int, request: Dict[str, Any],
+                    protocol: str, ramp: float, timeout: float) -> Dict[str, Any]:
+    """Run clients concurrent sessions, started evenly over ramp seconds."""
+    async def delayed(index: int) -> Dict[str, Any]:
+        await asyncio.sleep(ramp * index / clients)
+        return await run_session(ws_url, request, protocol, timeout)
+
+    samples: List[Dict[str, Any]] = []
+    poller = asyncio.create_task(poll_metrics(http_url, samples))
+    start = time.perf_counter()
+    sessions = await asyncio.gather(*(delayed(i) for i in range(clients)))
+    wall = time.perf_counter() - start
+    poller.cancel()
+    return {"clients": clients, "wall": wall, "sessions": sessions, "server": samples}
+
+
+def summarise_level(level: Dict[str, Any], max_lag_ms: float) -> Dict[str, Any]:
+    sessions = level["sessions"]
+    completed = [s for s in sessions if s["outcome"] == "complete"]
+    connect = [s["connect"] for s in sessions if s["connect"] is not None]
+    first_frame = [s["first_frame"] for s in sessions if s["first_frame"] is not None]
+    e2e = [s["e2e"] for s in completed]
+    frame_rates = [s["frames"] / s["e2e"] for s in completed if s["e2e"]]
+    server = [sample for sample in level["server"] if sample.get("samples")]
+    lag_p99 = max((sample["lag_ms"]["p99"] for sample in server), default=None)
+    failed = len(sessions) - len(completed)
+    return {
+        "clients": level["clients"],
+        "completed": len(completed),
+        "shed": sum(1 for s in sessions if s["outcome"] == "shed"),
+        "errors": sum(1 for s in sessions if s["outcome"] == "error"),
+        "timeouts": sum(1 for s in sessions if s["outcome"] == "timeout"),
+        "connect_p50_ms": _ms(_percentile(connect, 50)),
+        "connect_p99_ms": _ms(_percentile(connect, 99)),
+        "first_frame_p50_ms": _ms(_percentile(first_frame, 50)),
+        "first_frame_p99_ms": _ms(_percentile(first_frame, 99)),
+        "e2e_p50_s": _percentile(e2e, 50),
+        "e2e_p90_s": _percentile(e2e, 90),
+        "e2e_p99_s": _percentile(e2e, 99),
+        "frames_per_s_session": statistics.mean(frame_rates) if frame_rates else None,
+        "frames_per_s_total": sum(s["frames"] for s in sessions) / level["wall"],
+        "sessions_per_s": len(completed) / level["wall"],
+        "loop_lag_p99_ms": lag_p99,
+        "loop_lag_max_ms": max((sample["lag_ms"]["max"] for sample in server), default=None),
+        "cpu_percent_mean": statistics.mean(sample["cpu_percent"] for sample in server) if server else None,
+        "cpu_percent_max": max((sample["cpu_percent"] for sample in server), default=None),
+        "sustained": failed == 0 and lag_p99 is not None and lag_p99 < max_lag_ms,
+    }
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return seconds * 1000 if seconds is not None else None
+
+
+def start_server(port: int, max_clients: int, llm_latency_ms: float, scrape_latency_ms: float, tmp: str) -> subprocess.Popen:
+    """Start loadtest/server.py, admitting every client at once so the streaming path is what is measured."""
+    env = {
+        **os.environ,
+        "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "loadtest"),
+        "FIRECRAWL_API_KEY": os.environ.get("FIRECRAWL_API_KEY", "loadtest"),
+        "MAX_CONCURRENT_ANALYSES": str(max_clients),
+        "MAX_QUEUED_ANALYSES": str(max_clients),
+        "JOBS_DB_PATH": os.path.join(tmp, "jobs.db"),
+        # Event loop statistics over the last second, one window per /metrics poll
+        "LOOP_MONITOR_INTERVAL_MS": "50",
+        "LOOP_MONITOR_WINDOW": "20",
+    }
+    log = open(os.path.join(tmp, "server.log"), "w")
+    # The app prints every stream event; keep that out of the measurements' way
+    return subprocess.Popen(
+        [sys.executable, "-m", "loadtest.server", "--port", str(port),
+         "--llm-latency-ms", str(llm_latency_ms), "--scrape-latency-ms", str(scrape_latency_ms)],
+        env=env, stdout=subprocess.DEVNULL, stderr=log,
+    )
+
+
+def wait_for_server(http_url: str, server: Optional[subprocess.Popen], timeout: float = 60) -> None:
+    """
+    Raises:
+        RuntimeError: If the server exits or does not answer within timeout seconds
+    """
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if server is not None and server.poll() is not None:
+            raise RuntimeError(f"The load test server exited with code {server.returncode}")
+        try:
+            if httpx.get(f"{http_url}/", timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"The server at {http_url} did not answer within {timeout}s")
+
+
+async def run_levels(args: argparse.Namespace, ws_url: str, http_url: str) -> List[Dict[str, Any]]:
+    request: Dict[str, Any] = {"url": args.product_url}
+    if args.phases:
+        request["phases"] = args.phases
+    protocol = MSGPACK_PROTOCOL if args.protocol == "msgpack" else TEXT_PROTOCOL
+    levels = []
+    for clients in args.clients:
+        print(f"{clients} clients ({args.protocol}, ramp {args.ramp}s)")
+        level = await run_level(ws_url, http_url, clients, request, protocol, args.ramp, args.timeout)
+        errors = {s["error"] for s in level["sessions"] if s["error"]}
+        if errors:
+            print(f"  errors: {', '.join(sorted(errors)[:3])}")
+        levels.append(level)
+        await asyncio.sleep(args.pause)
+    return levels
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load test the /ws streaming path with concurrent WebSocket clients.")
+    parser.add_argument("--clients", nargs="+", type=int, default=[50, 100, 200], help="Concurrency levels to run")
+    parser.add_argument("--ramp", type=float, default=5, help="Seconds over which a level's sessions are started")
+    parser.add_argument("--protocol", choices=["text", "msgpack"], default="text", help="WebSocket message protocol")
+    parser.add_argument("--phases", nargs="+", default=None, help="Lifecycle phases to run (defaults to all)")
+    parser.add_argument("--product-url", default=DEFAULT_PRODUCT_URL, help="Product URL sent by every client")
+    parser.add_argument("--timeout", type=float, default=300, help="Seconds a session may take")
+    parser.add_argument("--pause", type=float, default=2, help="Seconds between levels")
+    parser.add_argument("--max-lag-ms", type=float, default=100, help="p99 event loop lag a sustained level stays under")
+    parser.add_argument("--url", default=None, help="Test a running server (e.g. http://localhost:8000) instead of starting one")
+    parser.add_argument("--port", type=int, default=None, help="Port of the started server (defaults to a random free port)")
+    parser.add_argument("--llm-latency-ms", type=float, default=200, help="Mean latency of stub LLM calls")
+    parser.add_argument("--scrape-latency-ms", type=float, default=300, help="Mean latency of stub page scrapes")
+    parser.add_argument("--output", default=f"results/load_test_{int(time.time())}.json", help="Report file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        server = None
+        if args.url:
+            http_url = args.url.rstrip("/")
+        else:
+            port = args.port or random.randint(20000, 40000)
+            http_url = f"http://127.0.0.1:{port}"
+            server = start_server(port, max(args.clients), args.llm_latency_ms, args.scrape_latency_ms, tmp)
+        ws_url = http_url.replace("http", "ws", 1) + "/ws"
+        try:
+            wait_for_server(http_url, server)
+            levels = asyncio.run(run_levels(args, ws_url, http_url))
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+
+    summary = pd.DataFrame([summarise_level(level, args.max_lag_ms) for level in levels]).set_index("clients")
+    print()
+    print(summary.to_string(float_format=lambda x: f"{x:.2f}"))
+    sustained = [clients for clients, row in summary.iterrows() if row["sustained"]]
+    capacity = max(sustained) if sustained else None
+    print(f"\nSustained concurrency: {capacity if capacity is not None else f'below {min(args.clients)}'} sessions "
+          f"(no failed sessions, p99 event loop lag < {args.max_lag_ms:.0f} ms)")
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump({
+            "config": {k: v for k, v in vars(args).items() if k != "output"},
+            "capacity": capacity,
+            "summary": summary.reset_index().to_dict(orient="records"),
+            "levels": levels,
+        }, f, indent=2)
+    print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+"""
+The FastAPI app with stub LLM and scraper backends, for load tests.
+
+    python -m loadtest.server --port 8765 --llm-latency-ms 200 --scrape-latency-ms 300
+"""
+
+import argparse
+
+import uvicorn
+
+from loadtest.stubs import install_llm_stub, install_scraper_stub
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve the app with stub LLM and scraper backends.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--llm-latency-ms", type=float, default=200, help="Mean latency of stub LLM calls")
+    parser.add_argument("--scrape-latency-ms", type=float, default=300, help="Mean latency of stub page scrapes")
+    args = parser.parse_args()
+
+    # The agents create their models when imported, so the stub goes in first
+    install_llm_stub(args.llm_latency_ms / 1000)
+    import main as app_module
+    install_scraper_stub(args.scrape_latency_ms / 1000)
+
+    uvicorn.run(app_module.app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
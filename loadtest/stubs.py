@@ -0,0 +1,136 @@
+"""
+Stub LLM and scraper backends for load tests.
+
+StubChatModel replaces the OpenAI request of HedgedChatOpenAI, so hedging,
+cancellation and routing stay in the path. It sleeps for a configurable
+latency and answers with whatever the caller asked for:
+
+- structured output: an object filled in from the schema,
+- an agent with tools: one tool call (the emissions factor batch finder when
+  it is bound, so the emissions factor graph runs too), then a final answer,
+- plain prompts: a short text.
+
+StubFirecrawlApp returns a small product page after a configurable latency.
+"""
+
+import asyncio
+import json
+import random
+import time
+import uuid
+from types import SimpleNamespace
+from typing import Any, Dict, List
+
+from langchain_core.messages import AIMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from llm.hedging import HedgedChatOpenAI
+
+# Processes the stub agents look factors up for; drawn at random so concurrent
+# sessions both share (single-flight) and miss lookups
+PROCESSES = ["steel sheet production", "aluminum extrusion", "injection moulded polypropylene", "cotton fabric weaving",
+             "truck freight", "ocean freight", "grid electricity", "corrugated cardboard", "landfill of mixed plastics",
+             "lithium-ion battery cells", "printed circuit board assembly", "glass production"]
+
+
+def _sample_value(schema: Dict[str, Any], defs: Dict[str, Any], name: str = "") -> Any:
+    """A plausible value for a JSON schema."""
+    if "$ref" in schema:
+        return _sample_value(defs[schema["$ref"].split("/")[-1]], defs, name)
+    for combinator in ("anyOf", "oneOf", "allOf"):
+        if combinator in schema:
+            options = [option for option in schema[combinator] if option.get("type") != "null"]
+            return _sample_value(options[0] if options else {}, defs, name)
+    if "enum" in schema:
+        return schema["enum"][0]
+    kind = schema.get("type")
+    if kind == "object":
+        return {key: _sample_value(value, defs, key) for key, value in schema.get("properties", {}).items()}
+    if kind == "array":
+        return [_sample_value(schema.get("items", {}), defs, name)]
+    if kind == "integer":
+        return 0
+    if kind == "number":
+        return round(random.uniform(0.1, 5.0), 3)
+    if kind == "boolean":
+        return False
+    if "process" in name:
+        return random.choice(PROCESSES)
+    if name == "units":
+        return "kgCO2e/kg"
+    return f"stub {name or 'text'}"
+
+
+def _schema(response_format: Any) -> Dict[str, Any]:
+    if isinstance(response_format, dict):
+        return response_format.get("json_schema", {}).get("schema", {})
+    return response_format.model_json_schema()
+
+
+# Mean latency (seconds) of stub LLM calls
+llm_latency = 0.2
+
+
+class StubChatModel(HedgedChatOpenAI):
+    def _stub_result(self, messages: List[Any], **kwargs: Any) -> ChatResult:
+        tools = kwargs.get("tools") or []
+        if kwargs.get("response_format") is not None:
+            schema = _schema(kwargs["response_format"])
+            parsed = _sample_value(schema, schema.get("$defs", {}))
+            message = AIMessage(content=json.dumps(parsed), additional_kwargs={"parsed": parsed})
+        elif tools and not any(isinstance(m, ToolMessage) for m in messages):
+            names = [tool["function"]["name"] for tool in tools]
+            tool = tools[names.index("emissions_factors_batch_finder_tool")] if "emissions_factors_batch_finder_tool" in names else tools[0]
+            parameters = tool["function"].get("parameters", {})
+            args = _sample_value(parameters, parameters.get("$defs", {}))
+            message = AIMessage(content="Looking up the emissions factors I need.", tool_calls=[
+                {"name": tool["function"]["name"], "args": args, "id": f"call_{uuid.uuid4().hex[:12]}", "type": "tool_call"}
+            ])
+        else:
+            message = AIMessage(content="Stub answer: the estimate is based on typical values for this product.")
+        message.usage_metadata = {"input_tokens": 500, "output_tokens": 50, "total_tokens": 550}
+        return ChatResult(generations=[ChatGeneration(message=message)], llm_output={"model_name": self.model_name})
+
+    def _latency(self) -> float:
+        return llm_latency * random.uniform(0.5, 1.5)
+
+    def _timed_generate(self, messages, stop, run_manager, **kwargs):
+        time.sleep(self._latency())
+        return self._stub_result(messages, **kwargs)
+
+    async def _timed_agenerate(self, messages, stop, run_manager, **kwargs):
+        await asyncio.sleep(self._latency())
+        return self._stub_result(messages, **kwargs)
+
+
+class StubFirecrawlApp:
+    def __init__(self, latency: float = 0.3):
+        self.latency = latency
+
+    def scrape_url(self, url: str, formats: Any = None, **kwargs: Any) -> Any:
+        time.sleep(self.latency * random.uniform(0.5, 1.5))
+        markdown = (
+            "# Stub Product\n\nBrand: Stubco\n\nA sturdy office chair with a steel frame, polypropylene seat "
+            "and nylon castors. Weight 12 kg. Ships flat-packed in a cardboard box.\n\n"
+            "![Stub Product](https://example.com/images/stub-product.jpg)\n"
+        )
+        return SimpleNamespace(markdown=markdown, html=None, metadata={"title": "Stub Product", "ogImage": "https://example.com/images/stub-product.jpg"})
+
+
+def install_llm_stub(latency: float) -> None:
+    """Make get_chat_model return stub models. Must run before the agents are imported."""
+    global llm_latency
+    import llm.models
+    from agents.page_context import count_tokens
+    llm_latency = latency
+    llm.models.HedgedChatOpenAI = StubChatModel
+    # Load the token encoding now rather than in the first sessions: tiktoken
+    # downloads it on first use (without network access, token counts are
+    # approximated; see agents/page_context.py)
+    count_tokens("")
+
+
+def install_scraper_stub(latency: float) -> None:
+    import agents.page_analysis
+    app = StubFirecrawlApp(latency)
+    agents.page_analysis.firecrawl_app = lambda: app
@@ -1,23 +1,50 @@
 # Standard library imports
 import asyncio
 import json
-from typing import Union # Union might not be needed directly here
+import os
+import uuid
+from contextlib import asynccontextmanager
+from typing import Optional
 
 # Load environment variables from .env.local file Do this before project
 # specific files as some want environment variables already loaded.
 from dotenv import load_dotenv
 load_dotenv(".env.local")
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+from agents.priors import record_analysis
 from agents.state import FootprintState
-from api.graph import setup_graph, process_phase_update, process_summarizer_update, send_agent_messages, page_analysis_phase
+from api import framing
+from api.admission import AdmissionRejected, admission
+from api.comparison import run_comparison, validate_urls
+from api.loop_monitor import loop_monitor
+from api.memory import memory_profiler
+from api.jobs import BulkJobRequest, JobRequest, JOB_STATUSES, job_manager
+from api.graph import setup_graph, stored_state, validate_phases, process_phase_update, process_summarizer_update, send_agent_messages, send_partial_footprint, send_prior_estimate, send_prior_outlier, page_analysis_phase, footprint, footprint_summary, analysis_deadline, DeadlineStream, LIFECYCLE_PHASES
+from llm.cancellation import cancellation_metrics, enter_scope
+from llm.models import llm_metrics
+from llm.tracing import annotate, trace_session
+from tools.emissions_factors.emissions_factors import ef_single_flight
 
 
 # --- FastAPI App Setup ---
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Start tracemalloc if memory profiling is enabled
+    memory_profiler.start()
+    # Start the analysis job workers (and re-queue jobs interrupted by a restart)
+    await job_manager.start()
+    # Sample event loop lag and CPU use for /metrics
+    loop_monitor.start()
+    yield
+    await loop_monitor.stop()
+    await job_manager.stop()
+
 app = FastAPI(
     title="Footprint-Any-Product API",
     description="Carbon footprint analysis for any product with real-time streaming results",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Health check endpoint
@@ -26,17 +53,121 @@ def read_root():
     """API health check endpoint."""
     return {"status": "healthy", "service": "footprint-any-product"}
 
-# Example parametrized endpoint (for demonstration)
-@app.get("/items/{item_id}")
-def read_item(item_id: int, q: Union[str, None] = None):
-    """Example endpoint with path and query parameters."""
-    return {"item_id": item_id, "q": q}
+# Metrics endpoint
+@app.get("/metrics")
+def read_metrics():
+    """Runtime metrics, including LLM request hedging, emissions factor de-duplication and event loop lag statistics."""
+    return {
+        "llm": llm_metrics(),
+        "emissions_factors": {"single_flight": ef_single_flight.stats()},
+        "jobs": job_manager.stats(),
+        "admission": admission.stats(),
+        "cancellation": cancellation_metrics.snapshot(),
+        "event_loop": loop_monitor.stats(),
+    }
+
+
+@app.get("/debug/memory")
+def read_memory(limit: int = 20, group_by: str = "lineno", types: bool = False):
+    """
+    Top allocators of traced memory and recent per-session memory profiles
+    (404 unless MEMORY_PROFILING=1). group_by is lineno, filename or traceback;
+    types adds live object counts by type.
+    """
+    if not memory_profiler.enabled:
+        raise HTTPException(status_code=404, detail="Memory profiling is disabled. Set MEMORY_PROFILING=1 to enable it.")
+    if group_by not in ("lineno", "filename", "traceback"):
+        raise HTTPException(status_code=422, detail="group_by must be lineno, filename or traceback")
+    return memory_profiler.report(limit, group_by, types)
+
+# --- Job API Endpoints ---
+
+def submit_jobs(requests):
+    try:
+        return job_manager.submit(requests)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+@app.post("/jobs", status_code=202)
+def create_job(request: JobRequest):
+    """Queue an analysis. The request takes the same fields as the WebSocket request."""
+    return submit_jobs([request])[0]
+
+@app.post("/jobs/bulk", status_code=202)
+def create_jobs(request: BulkJobRequest):
+    """Queue many analyses at once. Nothing is queued if any request is invalid."""
+    return {"jobs": submit_jobs(request.jobs)}
+
+@app.get("/jobs")
+def list_jobs(status: Optional[str] = None, limit: int = 100):
+    """Most recent jobs first, optionally filtered by status."""
+    if status is not None and status not in JOB_STATUSES:
+        raise HTTPException(status_code=422, detail=f"Unknown status {status}. Valid statuses: {JOB_STATUSES}")
+    return {"jobs": job_manager.list(status, limit)}
+
+@app.get("/jobs/{job_id}")
+def read_job(job_id: str):
+    """Job status, timestamps and, once finished, its result or error."""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job
+
+@app.get("/jobs/{job_id}/result")
+def read_job_result(job_id: str):
+    """The analysis result of a succeeded job (409 while it is queued or running)."""
+    job = read_job(job_id)
+    if job["status"] == "failed":
+        raise HTTPException(status_code=409, detail=f"Job {job_id} failed: {job['error']}")
+    if job["status"] != "succeeded":
+        raise HTTPException(status_code=409, detail=f"Job {job_id} is {job['status']}")
+    return job["result"]
 
 
 # --- WebSocket API Endpoint ---
 
+async def wait_for_admission(websocket: WebSocket) -> None:
+    """
+    Wait for an analysis slot, sending "QueuePosition: {n}" while queued.
+    
+    Raises:
+        AdmissionRejected: If the queue is full
+        WebSocketDisconnect: If the client disconnects while queued
+    """
+    async def send_position(position: int) -> None:
+        await websocket.send_text(f"QueuePosition: {position}")
+
+    acquire = asyncio.create_task(admission.acquire(send_position))
+    try:
+        while True:
+            # Watch the socket so a client that leaves gives up its place in the queue
+            receive = asyncio.create_task(websocket.receive())
+            done, _ = await asyncio.wait({acquire, receive}, return_when=asyncio.FIRST_COMPLETED)
+            if acquire in done:
+                receive.cancel()
+                return acquire.result()
+            if receive.result()["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect()
+    except BaseException:
+        acquire.cancel()
+        raise
+
+async def cancel_on_disconnect(websocket: WebSocket, scope, task: asyncio.Task) -> None:
+    """Cancel the analysis run by task (and its scope) as soon as the client disconnects."""
+    while True:
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            print("WebSocket: Client disconnected, cancelling the analysis")
+            scope.cancel("disconnect")
+            task.cancel()
+            return
+
 @app.websocket("/ws")
 @app.websocket("/") # Add this line to also handle WebSocket connections at the root path
+@memory_profiler.profile_session("websocket")
+@trace_session("websocket")
 async def websocket_endpoint(websocket: WebSocket, recursion_limit: int = 50):
     """
     WebSocket endpoint for streaming real-time carbon footprint analysis.
@@ -46,8 +177,30 @@ async def websocket_endpoint(websocket: WebSocket, recursion_limit: int = 50):
     2. Runs the LangGraph workflow to analyze the product
     3. Streams real-time updates from the agent system back to the client
     
+    The request is a JSON object with a "url". It may also contain:
+    - "phases": A list of lifecycle phases to run (defaults to all)
+    - "state": A stored analysis state (brand, category, long_description, ...
+      and optionally earlier phase results). Page analysis is skipped and the
+      total is recomputed from the stored and freshly run phases.
+    - "deadline": Seconds after which the analysis stops and a partial
+      footprint of the finished phases is sent (defaults to
+      ANALYSIS_DEADLINE_SECONDS, or no deadline)
+    - "identifiers": Product identifiers (e.g. {"gtin": "..."}) used to find
+      the product in the local catalogue (see agents/catalogue.py)
+    
+    Instead of a "url", the request may hold "urls": 2 to MAX_COMPARISON_PRODUCTS
+    product URLs to analyse concurrently and compare (with "phases" and
+    "deadline" applying to each). Messages about a product are prefixed with
+    "Product({n}) ", and a "Comparison: {json}" summary is sent at the end
+    (see api/comparison.py). A comparison takes one admission slot.
+    
+    At most MAX_CONCURRENT_ANALYSES analyses run at once. Later sessions wait
+    in a FIFO queue of up to MAX_QUEUED_ANALYSES and are shed when it is full.
+    
     All messages follow standardized formats:
     - "SystemMessage: {content}" - System info messages
+    - "QueuePosition: {position}" - Position in the admission queue (1 is next)
+    - "ServerBusy: {retry_after_seconds}" - The queue is full; retry later
     - "PhaseStart: {phase_key}" - Start of phase analysis
     - "Agent({phase_key}): {content}" - Agent thinking
     - "AgentAction({phase_key}): {action}" - Agent actions
@@ -55,12 +208,28 @@ async def websocket_endpoint(websocket: WebSocket, recursion_limit: int = 50):
     - "AgentObs({phase_key}): {observation}" - Observations
     - "PhaseSummary({phase_key}): {summary}" - Phase summary
     - "PhaseCarbon({phase_key}): {carbon_value}" - Phase carbon footprint value
+    - "PartialFootprint: {json}" - Running total after each phase finishes
+    - "Prior: {json}" - Provisional estimate from past results for the product
+      category, with ranges, sent once the category is known (see agents/priors.py)
+    - "PriorOutlier({phase_key}): {json}" - The phase result is far outside its
+      category prior
     - "FinalSummary: {content}" - Final analysis summary
     - "CarbonFootprint: {value}" - Total carbon footprint value
+    - "Footprint: {json}" - Final structured footprint: total, by_phase,
+      missing phases and whether the deadline cut the analysis short
+    - "Comparison: {json}" - Side-by-side results of a comparison: products,
+      ranking (lowest total first) and carbon by phase per product
     - "AnalysisComplete" - Analysis finished message
     - "ErrorMessage: {error}" - Error messages
+    
+    Clients that request the "footprint.msgpack.v1" subprotocol receive the
+    same messages as typed frames in batched binary msgpack envelopes
+    instead (see api/framing.py).
     """
-    await websocket.accept()
+    # Negotiate the message protocol; messages are written through the returned FrameWriter
+    websocket = await framing.accept(websocket)
+    admitted = False
+    disconnect_watcher = None
     
     # Send an immediate confirmation that the connection is established
     await websocket.send_text("SystemMessage: WebSocket connection established")
@@ -71,34 +240,82 @@ async def websocket_endpoint(websocket: WebSocket, recursion_limit: int = 50):
         request_data = json.loads(data)
         
         # Extract the product URL from the request_data
-        product_url = request_data.get("url")
+        stored = request_data.get("state")
+        product_url = request_data.get("url") or (stored or {}).get("url")
+        comparison_urls = request_data.get("urls")
 
-        if not product_url:
+        if not product_url and comparison_urls is None:
             await websocket.send_text("ErrorMessage: Product URL was not provided by the client.")
             return
 
+        try:
+            if comparison_urls is not None:
+                comparison_urls = validate_urls(comparison_urls)
+            phases = validate_phases(request_data.get("phases"))
+            initial_stored_state = stored_state(stored) if stored else None
+            deadline = analysis_deadline(request_data.get("deadline"))
+        except ValueError as e:
+            await websocket.send_text(f"ErrorMessage: {str(e)}")
+            return
+
+        memory_profiler.annotate(url=product_url or comparison_urls)
+        annotate(url=product_url or comparison_urls, phases=phases)
+
+        # Wait for an analysis slot, or shed the session if the queue is full
+        try:
+            await wait_for_admission(websocket)
+        except AdmissionRejected as e:
+            print(f"WebSocket: Session shed ({e})")
+            await websocket.send_text(f"ErrorMessage: {os.environ.get('SERVER_BUSY_MESSAGE', 'The server is busy. Please try again shortly.')}")
+            await websocket.send_text(f"ServerBusy: {os.environ.get('SERVER_BUSY_RETRY_AFTER', 30)}")
+            await websocket.close(code=1013) # Try Again Later
+            return
+        admitted = True
+
+        # Stop the graph, its agents and their tool calls if the client goes away
+        scope = enter_scope()
+        disconnect_watcher = asyncio.create_task(cancel_on_disconnect(websocket, scope, asyncio.current_task()))
+
+        # Compare several products in this session
+        if comparison_urls is not None:
+            await websocket.send_text(f"SystemMessage: Comparing {len(comparison_urls)} products")
+            await run_comparison(websocket, comparison_urls, phases, deadline)
+            await websocket.send_text("AnalysisComplete")
+            return
+
         # Initial messages to client
         await websocket.send_text(f"SystemMessage: Starting carbon footprint analysis for URL: {product_url}")
         await websocket.send_text("SystemMessage: Processing carbon footprint analysis in real-time")
         
         # Initialize and run the LangGraph workflow
-        graph = setup_graph()
-        config = {"configurable": {"thread_id": "websocket-session"}}
+        graph = setup_graph(phases=phases, from_page_analysis=initial_stored_state is not None)
+        config = {"configurable": {"thread_id": f"websocket-{uuid.uuid4().hex}"}}
         
         # Prepare the initial state for the graph, primarily with the URL
         initial_graph_state: FootprintState = { # Type hint for clarity
             "url": product_url,
-            "user_input": f"Analyze product from URL: {product_url}", # This can be used by the planner if needed
+            "user_input": f"Analyze product from URL: {product_url}",
             "messages": [("human", f"Analyze carbon footprint for product at URL: {product_url}")]
             # brand, category, short_description, long_description, product_image_urls will be populated by page_analysis_phase
         }
+        if request_data.get("identifiers"):
+            initial_graph_state["identifiers"] = request_data["identifiers"]
+        if initial_stored_state:
+            initial_graph_state.update(initial_stored_state)
         
-        # Stream the workflow execution
-        stream = graph.astream(
+        # Stream the workflow execution, stopping at the deadline if there is one
+        stream = DeadlineStream(graph.astream(
             initial_graph_state, # Pass the state with the URL
             config,
             stream_mode=["updates", "values"]
-        )
+        ), deadline)
+
+        # Phase results so far, for the running total
+        phase_results = {phase: initial_graph_state[phase] for phase in LIFECYCLE_PHASES if phase in initial_graph_state}
+
+        # The product category, for the category prior estimate and outlier checks
+        category = initial_graph_state.get("category")
+        prior_sent = False
 
         # Track processed nodes to prevent infinite recursion
         processed_nodes: Set[str] = set()
@@ -140,8 +357,8 @@ async def websocket_endpoint(websocket: WebSocket, recursion_limit: int = 50):
                     print(f"Current state keys: {list(event.keys())}")
                     
                     # Check for agent outputs and node outputs
-                    # Ensure "page_analysis", "planner" are included in the list of phases to check
-                    for phase_name in ["page_analysis", "planner", "materials", "manufacturing", "packaging", "transportation", "use", "eol"]:
+                    # Ensure "page_analysis" is included in the list of phases to check
+                    for phase_name in ["page_analysis", "materials", "manufacturing", "packaging", "transportation", "use", "eol"]:
                         # Check for direct phase keys in the state (event is the full state in "values" mode)
                         # Note: page_analysis_phase returns its data at the top level of the state, not nested under "page_analysis"
                         # Special handling for page_analysis output which is at the top level of the state
@@ -153,6 +370,10 @@ async def websocket_endpoint(websocket: WebSocket, recursion_limit: int = 50):
                             if "category" in event:
                                 await websocket.send_text(f"PageAnalysisCategory: {event['category']}")
                                 await asyncio.sleep(0.05)
+                                # A provisional estimate from past results, while the agents work
+                                category = event["category"]
+                                if not prior_sent:
+                                    prior_sent = await send_prior_estimate(websocket, category)
                             if "short_description" in event:
                                 await websocket.send_text(f"PageAnalysisShortDescription: {event['short_description']}")
                                 await asyncio.sleep(0.05)
@@ -170,12 +391,12 @@ async def websocket_endpoint(websocket: WebSocket, recursion_limit: int = 50):
                                     # await websocket.send_text(f"ErrorMessage: Failed to send image URLs: {json_err}")
                             continue # Move to next phase_name check
 
-                        # Check for agent outputs and node outputs (planner, materials, etc.)
+                        # Check for agent outputs and node outputs (materials, manufacturing, etc.)
                         # Iterate through potential phase keys
                         # The loop header is already defined above, this is just the check inside the loop
-                        if phase_name in event and isinstance(event[phase_name], dict): # For planner and other agents
+                        if phase_name in event and isinstance(event[phase_name], dict): # For the lifecycle agents
                             phase_key = phase_name
-                            phase_data = event[phase_name] # e.g. event["planner"] or event["materials"]
+                            phase_data = event[phase_name] # e.g. event["materials"]
                         else:
                             continue
                             
@@ -243,14 +464,14 @@ async def websocket_endpoint(websocket: WebSocket, recursion_limit: int = 50):
                             phase_key_for_processing = key.replace("_phase", "")
                             print(f"Converting node name {key} to phase key {phase_key_for_processing}")
                         
-                        # This handles updates from the planner and other lifecycle agents.
+                        # This handles updates from the lifecycle agents.
                         # Note: page_analysis_phase updates are now primarily handled in the 'values' mode
-                        # 'value' for these nodes is typically structured like: {"planner": {"messages": ..., "summary": ...}}
+                        # 'value' for these nodes is typically structured like: {"materials": {"messages": ..., "summary": ...}}
                         # or {"materials": {...}} if the node name was "materials_phase" and we converted it.
                         # So, we need to access value[phase_key_for_processing] if the node output is nested.
                         # However, our agent phases (materials_phase, etc.) return a dict like {"materials": result}
                         # So, 'value' will be {"materials": data}. We need to process value[phase_key_for_processing].
-                        if phase_key_for_processing in ["planner", "materials", "manufacturing", "packaging", "transportation", "use", "eol"]:
+                        if phase_key_for_processing in LIFECYCLE_PHASES:
                             # Check if the actual data for the phase is nested under the phase_key_for_processing within the 'value' dict
                             if isinstance(value, dict) and phase_key_for_processing in value and isinstance(value[phase_key_for_processing], dict):
                                 phase_data_to_process = value[phase_key_for_processing]
@@ -258,6 +479,10 @@ async def websocket_endpoint(websocket: WebSocket, recursion_limit: int = 50):
                                 await websocket.send_text(f"SystemMessage: Processing {phase_key_for_processing} phase update with {messages_count} messages")
                                 # Use the existing helper to process messages, carbon, and summary from this update chunk
                                 await process_phase_update(websocket, phase_key_for_processing, phase_data_to_process)
+                                if phase_key_for_processing in LIFECYCLE_PHASES:
+                                    phase_results[phase_key_for_processing] = phase_data_to_process
+                                    await send_partial_footprint(websocket, footprint(phase_results))
+                                    await send_prior_outlier(websocket, category, phase_key_for_processing, phase_data_to_process.get("carbon"))
                             # This case handles if the node's output (value) is *directly* the data for that phase.
                             # This shouldn't happen for our current agent structure but is a fallback.
                             # elif isinstance(value, dict) and not (phase_key_for_processing in value and isinstance(value[phase_key_for_processing], dict)):
@@ -290,6 +515,19 @@ async def websocket_endpoint(websocket: WebSocket, recursion_limit: int = 50):
                 print(f"Error processing update: {str(e)}")
                 await websocket.send_text(f"ErrorMessage: {str(e)}")
         
+        # At the deadline, report what the finished phases add up to
+        if stream.expired:
+            print(f"WebSocket: Deadline of {deadline}s reached for {product_url}")
+            result = footprint(phase_results, partial=True)
+            await process_summarizer_update(websocket, {
+                "footprint": result,
+                "messages": [{"role": "ai", "content": footprint_summary(result)}]
+            })
+
+        # Add the phases computed in this session to the category priors
+        record_analysis(category, {phase: phase_results[phase] for phase in phases if phase in phase_results},
+                        complete=not stream.expired and phases == LIFECYCLE_PHASES)
+
         # Send completion message
         await websocket.send_text("AnalysisComplete")
         
@@ -307,3 +545,13 @@ async def websocket_endpoint(websocket: WebSocket, recursion_limit: int = 50):
                 await websocket.send_text(f"ErrorMessage: {str(e)}")
         except Exception as send_err:
             print(f"WebSocket error sending error message: {send_err}")
+    finally:
+        if disconnect_watcher is not None:
+            disconnect_watcher.cancel()
+        try:
+            # Send any frames still waiting in a batch
+            await websocket.flush()
+        except Exception as flush_err:
+            print(f"WebSocket error flushing frames: {flush_err}")
+        if admitted:
+            admission.release()
@@ -0,0 +1,5 @@
+import os
+
+# Modules that create OpenAI or Firecrawl clients at import time need keys set
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("FIRECRAWL_API_KEY", "test")
@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+
+from api.admission import AdmissionController, AdmissionRejected
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_sessions_are_admitted_in_order_and_shed_when_the_queue_is_full():
+    async def scenario():
+        admission = AdmissionController(max_concurrent=1, max_queued=2)
+        await admission.acquire()
+        positions = {"a": [], "b": []}
+        order = []
+
+        async def session(name):
+            async def on_position(position):
+                positions[name].append(position)
+            await admission.acquire(on_position)
+            order.append(name)
+
+        a = asyncio.create_task(session("a"))
+        await _settle()
+        b = asyncio.create_task(session("b"))
+        await _settle()
+        with pytest.raises(AdmissionRejected):
+            await admission.acquire()
+
+        admission.release()
+        await a
+        await _settle()
+        admission.release()
+        await b
+        admission.release()
+        return admission.stats(), positions, order
+
+    stats, positions, order = asyncio.run(scenario())
+    assert order == ["a", "b"]
+    assert positions == {"a": [1], "b": [2, 1]}
+    assert stats["running"] == 0
+    assert stats["waiting"] == 0
+    assert (stats["admitted"], stats["queued"], stats["rejected"]) == (3, 2, 1)
+
+
+def test_a_session_leaving_the_queue_moves_the_others_up():
+    async def scenario():
+        admission = AdmissionController(max_concurrent=1, max_queued=4)
+        await admission.acquire()
+        positions = []
+
+        async def on_position(position):
+            positions.append(position)
+
+        first = asyncio.create_task(admission.acquire())
+        await _settle()
+        second = asyncio.create_task(admission.acquire(on_position))
+        await _settle()
+        first.cancel()
+        await _settle()
+
+        admission.release()
+        await second
+        admission.release()
+        return admission.stats(), positions, first.cancelled()
+
+    stats, positions, cancelled = asyncio.run(scenario())
+    assert cancelled
+    assert positions == [2, 1]
+    assert stats["running"] == 0
+    assert stats["waiting"] == 0
+
+
+def test_a_slot_handed_to_a_cancelled_session_is_released():
+    async def scenario():
+        admission = AdmissionController(max_concurrent=1, max_queued=4)
+        await admission.acquire()
+        waiting = asyncio.create_task(admission.acquire())
+        await _settle()
+        # The slot is handed over, then the session goes away before it resumes
+        admission.release()
+        waiting.cancel()
+        await _settle()
+        return admission.stats(), waiting.cancelled()
+
+    stats, cancelled = asyncio.run(scenario())
+    assert cancelled
+    assert stats["running"] == 0
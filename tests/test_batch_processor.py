@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("matplotlib")
+pytest.importorskip("pyarrow")
+
+import pyarrow.parquet as pq
+
+import batch_processor
+from batch_processor import (RESULTS_SCHEMA, RunningStats, adaptive_product_analysis, analyze_results,
+                             append_results_parquet, load_results_parquet, stored_result_state)
+
+
+def _result(run_id, carbon, mode="fixed", rerun_phases=None):
+    return {
+        "product_url": "https://example.com/kettle", "run_id": run_id, "brand": "Acme", "category": "Kettle",
+        "description": "Kettle", "page_analysis": {"brand": "Acme"}, "carbon_total": carbon,
+        "carbon_by_phase": {"materials": carbon}, "summary_by_phase": {"materials": ""},
+        "rerun_phases": rerun_phases, "mode": mode, "timestamp": 1.0, "success": True,
+    }
+
+
+def test_running_stats():
+    stats = RunningStats()
+    for value in [2.0, 4.0, 6.0]:
+        stats.add(value)
+    assert stats.mean == 4.0
+    assert stats.variance == 4.0
+    assert stats.converged(rel_precision=10, min_runs=3)
+    assert not stats.converged(rel_precision=10, min_runs=4)
+
+
+def test_adaptive_sampling_stops_when_a_phase_never_returns(monkeypatch):
+    calls = []
+
+    async def fake_run(product_url, run_id, phases=None, stored=None, mode="fixed"):
+        calls.append(phases)
+        # The use agent always fails, and the other phases are noisy
+        by_phase = {phase: 1.0 + (run_id % 3) for phase in batch_processor.LIFECYCLE_PHASES if phase != "use"}
+        return {"success": True, "carbon_by_phase": by_phase, "run_id": run_id}
+
+    monkeypatch.setattr(batch_processor, "run_single_analysis", fake_run)
+    result = asyncio.run(adaptive_product_analysis("https://example.com", 0, asyncio.Semaphore(2),
+                                                   min_runs=3, max_runs=5, wave_size=2, rel_precision=0.01))
+    assert len(result["runs"]) <= 5
+    assert result["stats"]["use"].n == 0
+
+
+def test_parquet_batches_share_a_schema_and_statistics_can_leave_out_reruns(tmp_path):
+    dataset = str(tmp_path / "results.parquet")
+    failed = {"product_url": "https://example.com/kettle", "run_id": 2, "success": False, "error": "timeout",
+              "mode": "fixed", "timestamp": 1.0}
+    append_results_parquet([_result(0, 10), _result(1, 12), failed], dataset, batch_id=1)
+    append_results_parquet([_result(0, 40, mode="rerun", rerun_phases=["materials"])], dataset, batch_id=2)
+
+    for name in ["batch_1.parquet", "batch_2.parquet"]:
+        assert pq.read_schema(str(tmp_path / "results.parquet" / name)).remove_metadata() == RESULTS_SCHEMA
+    df = load_results_parquet(dataset)
+    assert len(df) == 4
+
+    _, summary = analyze_results(df, modes=["fixed"])
+    assert summary[("total", "mean")].iloc[0] == 11
+    assert summary[("total", "count")].iloc[0] == 2
+    _, summary = analyze_results(df)
+    assert summary[("total", "count")].iloc[0] == 3
+
+
+def test_stored_result_state_rebuilds_page_analysis_and_phases():
+    state = stored_result_state(_result(0, 10))
+    assert state == {"brand": "Acme", "materials": {"carbon": 10, "summary": "", "messages": []}}
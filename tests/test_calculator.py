@@ -0,0 +1,43 @@
+import pytest
+
+from tools.calculator.calculator import evaluate_expressions
+
+
+def test_total_excludes_referenced_intermediates():
+    result = evaluate_expressions({"a": "2*3", "b": "4*5", "sum": "a+b"})
+    assert result["sum"] == 26.0
+    assert result["total"] == 26.0
+
+
+def test_total_sums_independent_results():
+    result = evaluate_expressions({"a": "2*3", "b": "4*5"})
+    assert result["total"] == 26.0
+
+
+def test_total_over_arrays():
+    result = evaluate_expressions(
+        {"emissions": "mass_kg * ef"},
+        {"mass_kg": [0.2, 0.05, 0.01], "ef": [2.1, 8.6, 1.9]},
+    )
+    assert result["emissions"] == pytest.approx([0.42, 0.43, 0.019])
+    assert result["total"] == pytest.approx(0.869)
+
+
+def test_total_of_named_expression():
+    result = evaluate_expressions({"a": "2*3", "b": "a*2", "c": "10"}, total_of="a")
+    assert result["total"] == 6.0
+
+
+def test_total_is_reserved():
+    with pytest.raises(ValueError, match="reserved"):
+        evaluate_expressions({"total": "1+1"})
+
+
+def test_unknown_total_of():
+    with pytest.raises(ValueError):
+        evaluate_expressions({"a": "1"}, total_of="b")
+
+
+def test_undefined_variable():
+    with pytest.raises(ValueError, match="undefined"):
+        evaluate_expressions({"a": "x + 1"})
@@ -0,0 +1,57 @@
+import pytest
+
+from agents.catalogue import Catalogue, canonical_url, identifiers_from_url
+
+KETTLE = {
+    "url": "https://www.example.com/kettles/steel-kettle/?utm_source=newsletter",
+    "brand": "Acme",
+    "category": "Kettle",
+    "long_description": "A 1.7 litre stainless steel kettle",
+    "gtin": "0012345678905",
+}
+
+
+@pytest.fixture
+def catalogue(tmp_path):
+    return Catalogue(str(tmp_path / "catalogue.db"))
+
+
+def test_canonical_url():
+    assert canonical_url("https://WWW.Example.com/a/b/#top") == "example.com/a/b"
+    # The query is kept, sorted and without tracking parameters
+    assert canonical_url("https://example.com/p?variant=2&pid=7&utm_source=mail&gclid=x") == "example.com/p?pid=7&variant=2"
+    assert canonical_url("https://example.com/p/?utm_campaign=spring") == "example.com/p"
+
+
+def test_products_named_in_the_query_are_told_apart(catalogue):
+    catalogue.add([{**KETTLE, "url": "https://example.com/product?pid=1", "gtin": None},
+                   {**KETTLE, "url": "https://example.com/product?pid=2", "gtin": None, "brand": "Other"}])
+    assert catalogue.lookup("https://example.com/product?pid=2&utm_source=ad")["brand"] == "Other"
+    assert catalogue.lookup("https://example.com/product?pid=1")["brand"] == "Acme"
+    assert catalogue.lookup("https://example.com/product") is None
+
+
+def test_identifiers_from_url():
+    assert identifiers_from_url("https://www.amazon.com/Some-Kettle/dp/B000123456?th=1") == ["asin:b000123456"]
+    assert identifiers_from_url("https://example.com/kettle") == []
+
+
+def test_lookup_by_url_and_identifier(catalogue):
+    assert catalogue.add([KETTLE, {"brand": "No URL"}]) == 1
+    assert catalogue.lookup("http://example.com/kettles/steel-kettle")["brand"] == "Acme"
+    assert catalogue.lookup(identifiers={"gtin": " 0012345678905 "})["brand"] == "Acme"
+    assert catalogue.lookup("https://example.com/toaster") is None
+    assert len(catalogue) == 1
+
+
+def test_replaced_record_drops_its_old_keys(catalogue):
+    catalogue.add([KETTLE])
+    catalogue.add([{**{k: v for k, v in KETTLE.items() if k != "gtin"}, "brand": "Acme Home"}])
+    assert catalogue.lookup(KETTLE["url"])["brand"] == "Acme Home"
+    assert catalogue.lookup(identifiers={"gtin": KETTLE["gtin"]}) is None
+    assert len(catalogue) == 1
+
+
+def test_record_without_long_description_is_a_miss(catalogue):
+    catalogue.add([{**KETTLE, "long_description": ""}])
+    assert catalogue.lookup(KETTLE["url"]) is None
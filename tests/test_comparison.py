@@ -0,0 +1,95 @@
+import asyncio
+import time
+
+import pytest
+
+import api.comparison as comparison
+from api.comparison import comparison_summary, run_comparison, validate_urls
+from llm.cancellation import check_cancelled, enter_scope
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.messages = []
+
+    async def send_text(self, text):
+        self.messages.append(text)
+
+
+class FakeGraph:
+    """Streams a materials result after delay seconds, checking the cancel scope first like an LLM call would."""
+
+    def __init__(self, delay):
+        self.delay = delay
+
+    async def astream(self, state, config, stream_mode):
+        await asyncio.sleep(self.delay)
+        check_cancelled()
+        yield {"materials_phase": {"materials": {"carbon": 2.0, "summary": "steel", "messages": []}}}
+
+
+@pytest.fixture(autouse=True)
+def no_priors(monkeypatch):
+    monkeypatch.delenv("PRIORS_PATH", raising=False)
+    monkeypatch.setattr(comparison, "record_analysis", lambda *args, **kwargs: None)
+
+
+def test_validate_urls():
+    assert validate_urls(["https://a.com/x", "https://b.com/y"]) == ["https://a.com/x", "https://b.com/y"]
+    with pytest.raises(ValueError):
+        validate_urls(["https://a.com/x"])
+    with pytest.raises(ValueError):
+        validate_urls(["https://a.com/x?utm_source=mail", "https://a.com/x"])
+
+
+def test_a_product_reaching_the_deadline_does_not_cancel_the_others(monkeypatch):
+    graphs = iter([FakeGraph(10), FakeGraph(0.35)])
+
+    def setup_graph(phases):
+        graph = next(graphs)
+        if graph.delay < 1:
+            # Building the second product's graph takes a while, so its deadline
+            # runs out after the first product's
+            time.sleep(0.8)
+        return graph
+
+    monkeypatch.setattr(comparison, "setup_graph", setup_graph)
+    websocket = FakeWebSocket()
+
+    async def compare():
+        session = enter_scope()
+        summary = await run_comparison(websocket, ["https://a.com/slow", "https://b.com/fast"], ["materials"], 1.0)
+        return summary, session
+
+    summary, session = asyncio.run(compare())
+    slow, fast = summary["products"]
+    assert slow["partial"] and slow["missing"][0] == "materials"
+    assert "error" not in fast
+    assert fast["total"] == 2.0 and not fast["partial"]
+    assert not session.cancelled
+    assert not any("ErrorMessage" in message for message in websocket.messages)
+
+
+def test_cancelling_the_session_cancels_every_product(monkeypatch):
+    monkeypatch.setattr(comparison, "setup_graph", lambda phases: FakeGraph(0.2))
+    websocket = FakeWebSocket()
+
+    async def compare():
+        session = enter_scope()
+        asyncio.get_running_loop().call_later(0.1, session.cancel, "disconnect")
+        return await run_comparison(websocket, ["https://a.com/x", "https://b.com/y"], ["materials"], None)
+
+    summary = asyncio.run(compare())
+    assert [product["error"] for product in summary["products"]] == ["disconnect", "disconnect"]
+    assert summary["ranking"] == []
+
+
+def test_comparison_summary_ranks_the_analysed_products():
+    def result(total):
+        return {"brand": "Acme", "category": "Chair", "carbon_total": total,
+                "footprint": {"by_phase": {"materials": total}, "missing": [], "partial": False}}
+
+    summary = comparison_summary(["a", "b", "c"], [result(5.0), RuntimeError("scrape failed"), result(2.0)])
+    assert summary["ranking"] == [3, 1]
+    assert summary["products"][1] == {"product": 2, "url": "b", "error": "scrape failed"}
+    assert summary["by_phase"] == {"materials": {1: 5.0, 3: 2.0}}
@@ -0,0 +1,148 @@
+import asyncio
+
+import pytest
+
+import tools.emissions_factors.emissions_factors as ef
+from tools.emissions_factors.emissions_factors import FactorCache, batch_source_picker, normalize_request
+from tools.emissions_factors.single_flight import SingleFlight
+
+
+class FakeBatchGraph:
+    """Answers each request with a factor named after it, recording the chunks it was asked."""
+
+    def __init__(self):
+        self.chunks = []
+
+    async def ainvoke(self, state):
+        self.chunks.append([r["process_desc"] for r in state["requests"]])
+        return {"emissions_factors": [{"CO2e_factor": 1.0, "units": "kgCO2e/kg", "description": r["process_desc"]}
+                                      for r in state["requests"]]}
+
+
+@pytest.fixture
+def batch_graph(monkeypatch):
+    graph = FakeBatchGraph()
+    monkeypatch.setattr(ef, "ef_batch_graph", graph)
+    monkeypatch.setattr(ef, "ef_single_flight", SingleFlight())
+    monkeypatch.setenv("EF_BATCH_CHUNK_SIZE", "2")
+    return graph
+
+
+def _lookup(requests):
+    return ef.emissions_factors_batch_finder_tool.ainvoke({"requests": requests})
+
+
+def test_normalize_request():
+    assert normalize_request("  Steel   sheet. ", "Materials") == ("steel sheet", "materials")
+
+
+def test_batch_tool_deduplicates_and_chunks_requests(batch_graph):
+    requests = [
+        {"process_desc": "steel sheet", "phase": "materials"},
+        {"process_desc": "Steel sheet.", "phase": "materials"},
+        {"process_desc": "truck freight", "phase": "transportation"},
+        {"process_desc": "grid electricity", "phase": "use"},
+    ]
+    results = asyncio.run(_lookup(requests))
+    assert sorted(len(chunk) for chunk in batch_graph.chunks) == [1, 2]
+    assert sum(len(chunk) for chunk in batch_graph.chunks) == 3
+    # One result per request, in request order, duplicates sharing a factor
+    assert [r["process_desc"] for r in results] == [r["process_desc"] for r in requests]
+    assert results[1]["emissions_factor"] == results[0]["emissions_factor"]
+    assert results[3]["emissions_factor"]["description"] == "grid electricity"
+
+
+def test_batch_tool_reuses_the_session_cache(batch_graph):
+    async def scenario():
+        cache = FactorCache()
+        ef.ef_session_cache.set(cache)
+        await _lookup([{"process_desc": "steel sheet", "phase": "materials"}])
+        await _lookup([{"process_desc": "steel sheet", "phase": "materials"},
+                       {"process_desc": "glass", "phase": "materials"}])
+        return cache
+
+    cache = asyncio.run(scenario())
+    assert batch_graph.chunks == [["steel sheet"], ["glass"]]
+    assert cache.hits == 1
+
+
+class FakePicker:
+    def __init__(self, picks):
+        self.picks = picks
+        self.prompts = []
+
+    def with_structured_output(self, schema):
+        self.schema = schema
+        return self
+
+    async def ainvoke(self, messages):
+        self.prompts.append(messages[-1]["content"])
+        return self.schema(best_indices=[{"request_index": i, "best_index": j} for i, j in self.picks])
+
+
+def _candidate(request_index, factor, units="kgCO2e/kg", citation="EPA"):
+    return {"request_index": request_index, "CO2e_factor": factor, "units": units, "description": "",
+            "citation_desc": citation}
+
+
+def test_batch_picker_only_asks_about_contested_requests(monkeypatch):
+    picker = FakePicker([(1, 1), (2, 7)])
+    monkeypatch.setattr(ef, "get_chat_model", lambda **kwargs: picker)
+    state = {
+        "requests": [{"process_desc": p, "phase": "materials"} for p in ["steel", "glass", "cotton", "wood"]],
+        "ef_candidates": [
+            _candidate(0, 2.0), _candidate(0, -1),
+            _candidate(1, 1.0), _candidate(1, 2000.0, units="lbCO2e/short ton"),
+            _candidate(2, 5.0), _candidate(2, 6.0),
+            _candidate(3, -1),
+        ],
+    }
+    picked = asyncio.run(batch_source_picker(state))["emissions_factors"]
+    # One picker call, for the two contested requests
+    assert len(picker.prompts) == 1
+    assert "steel" not in picker.prompts[0] and "wood" not in picker.prompts[0]
+    assert picked[0]["CO2e_factor"] == 2.0
+    # Candidates are compared (and returned) in canonical units
+    assert picked[1]["CO2e_factor"] == pytest.approx(1.0)
+    assert picked[1]["units"] == "kgCO2e/kg"
+    assert picked[1]["original_units"] == "lbCO2e/short ton"
+    # An out-of-range pick falls back to the first candidate
+    assert picked[2]["CO2e_factor"] == 5.0
+    assert picked[3] is None
+
+
+def test_batch_picker_makes_no_call_without_contested_requests(monkeypatch):
+    monkeypatch.setattr(ef, "get_chat_model", lambda **kwargs: pytest.fail("no picker call expected"))
+    state = {"requests": [{"process_desc": "steel", "phase": "materials"}], "ef_candidates": [_candidate(0, 2.0)]}
+    assert asyncio.run(batch_source_picker(state))["emissions_factors"][0]["CO2e_factor"] == 2.0
+
+
+def test_a_waiter_takes_over_a_lookup_abandoned_by_a_cancelled_analysis(batch_graph, monkeypatch):
+    class StalledFirstCall(FakeBatchGraph):
+        async def ainvoke(self, state):
+            if not self.chunks:
+                self.chunks.append(["stalled"])
+                await asyncio.sleep(10)
+            return await super().ainvoke(state)
+
+    graph = StalledFirstCall()
+    monkeypatch.setattr(ef, "ef_batch_graph", graph)
+    steel = [{"process_desc": "steel sheet", "phase": "materials"}]
+
+    async def scenario():
+        leader = asyncio.ensure_future(_lookup(steel))
+        await asyncio.sleep(0.05)
+        waiter = asyncio.ensure_future(_lookup(steel))
+        await asyncio.sleep(0.05)
+        # The leader's analysis is cancelled while the waiter is joined to its lookup
+        leader.cancel()
+        results = await waiter
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return results
+
+    results = asyncio.run(scenario())
+    assert results[0]["emissions_factor"]["description"] == "steel sheet"
+    assert graph.chunks == [["stalled"], ["steel sheet"]]
+    stats = ef.ef_single_flight.stats()
+    assert (stats["hits"], stats["abandoned"], stats["in_flight"]) == (1, 1, 0)
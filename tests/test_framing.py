@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+
+from api.framing import MSGPACK_PROTOCOL, TEXT_PROTOCOL, FrameWriter, decode_envelope, parse_message
+
+
+@pytest.mark.parametrize("text, frame", [
+    ("PhaseCarbon(eol): 0.75", {"type": "PhaseCarbon", "phase": "eol", "data": 0.75}),
+    ("QueuePosition: 3", {"type": "QueuePosition", "data": 3}),
+    ("CarbonFootprint: 1e3", {"type": "CarbonFootprint", "data": 1000.0}),
+    ('AgentObs(use): {"kWh": 12}', {"type": "AgentObs", "phase": "use", "data": {"kWh": 12}}),
+    ('Prior: {"total": 4.2}', {"type": "Prior", "data": {"total": 4.2}}),
+    ("AgentMessage(materials): Looking up: steel", {"type": "AgentMessage", "phase": "materials", "data": "Looking up: steel"}),
+    ("AnalysisComplete", {"type": "AnalysisComplete"}),
+    ("Product(2) PhaseCarbon(eol): 0.75", {"type": "PhaseCarbon", "phase": "eol", "data": 0.75, "product": 2}),
+])
+def test_parse_message(text, frame):
+    assert parse_message(text) == frame
+
+
+def test_malformed_payloads_are_kept_as_text():
+    assert parse_message("PhaseCarbon(eol): unknown") == {"type": "PhaseCarbon", "phase": "eol", "data": "unknown"}
+    assert parse_message("AgentObs(eol): not json") == {"type": "AgentObs", "phase": "eol", "data": "not json"}
+
+
+class _WebSocket:
+    def __init__(self):
+        self.texts = []
+        self.envelopes = []
+
+    async def send_text(self, text):
+        self.texts.append(text)
+
+    async def send_bytes(self, data):
+        self.envelopes.append(decode_envelope(data))
+
+
+def test_text_protocol_sends_each_message():
+    async def send():
+        websocket = _WebSocket()
+        writer = FrameWriter(websocket, TEXT_PROTOCOL)
+        await writer.send_text("PhaseCarbon(eol): 0.75")
+        return websocket
+
+    assert asyncio.run(send()).texts == ["PhaseCarbon(eol): 0.75"]
+
+
+def test_msgpack_protocol_batches_frames():
+    async def send():
+        websocket = _WebSocket()
+        writer = FrameWriter(websocket, MSGPACK_PROTOCOL, max_batch=2, flush_interval=0.01)
+        for text in ["PhaseCarbon(eol): 1", "PhaseCarbon(use): 2", "AnalysisComplete"]:
+            await writer.send_text(text)
+        # The first two fill a batch; the last is flushed after the interval
+        full = list(websocket.envelopes)
+        await asyncio.sleep(0.05)
+        return full, websocket.envelopes
+
+    full, envelopes = asyncio.run(send())
+    assert [len(envelope) for envelope in full] == [2]
+    assert envelopes[1] == [{"type": "AnalysisComplete"}]
@@ -0,0 +1,116 @@
+import asyncio
+
+import pytest
+
+import api.graph as graph
+from api.graph import (LIFECYCLE_PHASES, DeadlineStream, analysis_deadline, footprint, footprint_summary, rerun_phases,
+                       setup_graph, stored_state, validate_phases)
+from llm.cancellation import enter_scope
+
+
+def test_footprint_totals_the_phases_with_results():
+    state = {"materials": {"carbon": 1.5}, "use": {"carbon": 2.0}, "eol": {"carbon": None}, "packaging": "pending"}
+    result = footprint(state, partial=True)
+    assert result["total"] == 3.5
+    assert result["by_phase"] == {"materials": 1.5, "use": 2.0}
+    assert result["missing"] == ["manufacturing", "packaging", "transportation", "eol"]
+    assert footprint_summary(result) == ("Total carbon footprint: 3.5 kg CO2e "
+                                         "(partial result, missing phases: manufacturing, packaging, transportation, eol)")
+
+
+def test_validate_phases_keeps_lifecycle_order():
+    assert validate_phases(["use", "materials"]) == ["materials", "use"]
+    with pytest.raises(ValueError):
+        validate_phases(["cooking"])
+    with pytest.raises(ValueError):
+        validate_phases([])
+
+
+def test_analysis_deadline(monkeypatch):
+    monkeypatch.delenv("ANALYSIS_DEADLINE_SECONDS", raising=False)
+    assert analysis_deadline() is None
+    monkeypatch.setenv("ANALYSIS_DEADLINE_SECONDS", "30")
+    assert analysis_deadline() == 30.0
+    assert analysis_deadline(5) == 5.0
+
+
+async def _updates(closed, delays):
+    try:
+        for i, delay in enumerate(delays):
+            await asyncio.sleep(delay)
+            yield i
+    finally:
+        closed.append(True)
+
+
+def test_deadline_stream_without_a_deadline_yields_everything():
+    async def collect():
+        closed = []
+        stream = DeadlineStream(_updates(closed, [0, 0, 0]), None)
+        return [update async for update in stream], stream.expired, closed
+
+    assert asyncio.run(collect()) == ([0, 1, 2], False, [True])
+
+
+def test_deadline_stream_stops_at_the_deadline_and_cancels_the_scope():
+    async def collect():
+        scope = enter_scope()
+        closed = []
+        stream = DeadlineStream(_updates(closed, [0, 0, 10]), 0.2)
+        updates = [update async for update in stream]
+        return updates, stream.expired, closed, scope.reason
+
+    updates, expired, closed, reason = asyncio.run(collect())
+    assert updates == [0, 1]
+    assert expired
+    assert closed == [True]
+    assert reason == "deadline"
+
+
+STORED = {
+    "url": "https://example.com/kettle",
+    "brand": "Acme",
+    "category": "Kettle",
+    "long_description": "A 1.7 litre stainless steel kettle",
+    "bill_of_materials": {"components": [], "total_mass_kg": 1.2, "assumptions": ""},
+    "messages": [],
+    **{phase: {"carbon": 1.0, "summary": f"stored {phase}", "messages": []} for phase in LIFECYCLE_PHASES},
+}
+
+
+def test_stored_state_keeps_page_analysis_and_phase_results():
+    state = stored_state(STORED)
+    assert "messages" not in state
+    assert state["brand"] == "Acme"
+    assert state["use"] == {"carbon": 1.0, "summary": "stored use", "messages": []}
+    assert "use" not in stored_state(STORED, keep_phases=False)
+    with pytest.raises(ValueError, match="long_description"):
+        stored_state({"brand": "Acme", "category": "Kettle"})
+
+
+def test_graphs_only_run_the_selected_phases():
+    nodes = set(setup_graph(phases=["use"], from_page_analysis=True).get_graph().nodes)
+    assert nodes == {"__start__", "use_phase", "summarizer", "__end__"}
+    nodes = set(setup_graph(phases=["packaging"]).get_graph().nodes)
+    assert {"page_analysis_phase", "page_details_phase", "bill_of_materials_phase", "packaging_phase"} <= nodes
+    assert "use_phase" not in nodes
+
+
+def test_rerun_phases_totals_stored_and_fresh_results(monkeypatch):
+    ran = []
+
+    def fake_phase(phase, carbon):
+        async def node(state, config):
+            ran.append(phase)
+            # The shared bill of materials is reused, not estimated again
+            assert state["weight_kg"] == 1.2
+            return {phase: {"carbon": carbon, "summary": "fresh", "messages": []}}
+        return node
+
+    monkeypatch.setitem(graph.PHASE_NODES, "packaging", fake_phase("packaging", 3.0))
+    monkeypatch.setitem(graph.PHASE_NODES, "use", fake_phase("use", 10.0))
+    result = asyncio.run(rerun_phases(STORED, ["use", "packaging"]))
+    assert sorted(ran) == ["packaging", "use"]
+    assert result["use"]["summary"] == "fresh"
+    assert result["materials"]["summary"] == "stored materials"
+    assert result["footprint"]["total"] == 4 * 1.0 + 3.0 + 10.0
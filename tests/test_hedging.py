@@ -0,0 +1,132 @@
+import asyncio
+import contextvars
+import itertools
+import time
+
+import pytest
+
+from llm.cancellation import AnalysisCancelled, cancellation_metrics, enter_scope
+from llm.hedging import HedgedChatOpenAI, get_tracker
+
+_models = itertools.count()
+
+
+class ScriptedChatModel(HedgedChatOpenAI):
+    """Attempts follow a script of (delay in seconds, result or exception), one entry per attempt."""
+
+    def __init__(self, script, **kwargs):
+        super().__init__(model_name=f"hedge-test-{next(_models)}", api_key="test", hedge_percentile=50,
+                         hedge_min_samples=1, hedge_max_rate=1.0, **kwargs)
+        object.__setattr__(self, "_script", iter(script))
+        object.__setattr__(self, "attempts", [])
+
+    async def _timed_agenerate(self, messages, stop, run_manager, **kwargs):
+        delay, outcome = next(self._script)
+        attempt = {"delay": delay, "cancelled": False}
+        self.attempts.append(attempt)
+        start = time.perf_counter()
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            attempt["cancelled"] = True
+            raise
+        if isinstance(outcome, Exception):
+            raise outcome
+        self._tracker().record(time.perf_counter() - start)
+        return outcome
+
+    def _timed_generate(self, messages, stop, run_manager, **kwargs):
+        delay, outcome = next(self._script)
+        self.attempts.append({"delay": delay})
+        time.sleep(delay)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+def _hedged(model):
+    # A 50 ms threshold: attempts still running after it are hedged
+    model._tracker().record(0.05)
+    return model
+
+
+def test_a_slow_primary_is_beaten_by_the_hedge():
+    model = _hedged(ScriptedChatModel([(0.5, "primary"), (0.0, "hedge")]))
+    result = asyncio.run(model._hedged_agenerate([], None, None))
+    assert result == "hedge"
+    assert model.attempts[0]["cancelled"]
+    tracker = get_tracker(model.model_name)
+    assert (tracker.hedges, tracker.hedge_wins) == (1, 1)
+    # The cancelled primary still counts towards the latency window
+    assert tracker.snapshot(50)["samples"] == 3
+
+
+def test_a_failing_hedge_does_not_fail_the_call():
+    model = _hedged(ScriptedChatModel([(0.3, "primary"), (0.0, RuntimeError("hedge 503"))]))
+    assert asyncio.run(model._hedged_agenerate([], None, None)) == "primary"
+    assert get_tracker(model.model_name).hedge_wins == 0
+
+
+def test_the_primary_error_is_raised_when_both_fail():
+    model = _hedged(ScriptedChatModel([(0.1, RuntimeError("primary 500")), (0.0, RuntimeError("hedge 503"))]))
+    with pytest.raises(RuntimeError, match="primary 500"):
+        asyncio.run(model._hedged_agenerate([], None, None))
+
+
+def test_cancelling_the_call_cancels_both_attempts():
+    model = _hedged(ScriptedChatModel([(1.0, "primary"), (1.0, "hedge")]))
+
+    async def cancel():
+        call = asyncio.ensure_future(model._hedged_agenerate([], None, None))
+        await asyncio.sleep(0.1)
+        call.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await call
+        await asyncio.sleep(0)
+
+    asyncio.run(cancel())
+    assert [attempt["cancelled"] for attempt in model.attempts] == [True, True]
+
+
+def test_sync_calls_keep_the_first_success():
+    model = _hedged(ScriptedChatModel([(0.3, "primary"), (0.0, RuntimeError("hedge 503"))]))
+    assert model._hedged_generate([], None, None) == "primary"
+    model = _hedged(ScriptedChatModel([(0.5, "primary"), (0.0, "hedge")]))
+    assert model._hedged_generate([], None, None) == "hedge"
+
+
+def test_a_cancelled_analysis_skips_later_calls():
+    model = ScriptedChatModel([(0.0, "unused")])
+    skipped = cancellation_metrics.snapshot()["reclaimed"]["llm_calls_skipped"]
+
+    async def call_after_cancel():
+        enter_scope().cancel("disconnect")
+        await model._agenerate([])
+
+    with pytest.raises(AnalysisCancelled, match="disconnect"):
+        asyncio.run(call_after_cancel())
+    # The sync path (agents' tools in executor threads) checks the scope too
+    def sync_call_after_cancel():
+        enter_scope().cancel("deadline")
+        model._generate([])
+
+    with pytest.raises(AnalysisCancelled, match="deadline"):
+        contextvars.copy_context().run(sync_call_after_cancel)
+    assert model.attempts == []
+    assert cancellation_metrics.snapshot()["reclaimed"]["llm_calls_skipped"] == skipped + 2
+
+
+def test_a_call_cancelled_in_flight_is_counted():
+    model = ScriptedChatModel([(1.0, "primary")])
+    cancelled = cancellation_metrics.snapshot()["reclaimed"]["llm_calls_cancelled"]
+
+    async def cancel():
+        call = asyncio.ensure_future(model._agenerate([]))
+        await asyncio.sleep(0.05)
+        call.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await call
+
+    asyncio.run(cancel())
+    assert model.attempts[0]["cancelled"]
+    assert cancellation_metrics.snapshot()["reclaimed"]["llm_calls_cancelled"] == cancelled + 1
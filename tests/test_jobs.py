@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+
+from api.jobs import JobManager, JobRequest
+
+
+@pytest.fixture
+def manager(tmp_path):
+    return JobManager(str(tmp_path / "jobs.db"), workers=1)
+
+
+def test_the_job_table_is_opened_on_start(tmp_path):
+    manager = JobManager(str(tmp_path / "jobs.db"))
+    assert not (tmp_path / "jobs.db").exists()
+    assert manager.stats()["by_status"] == {}
+    with pytest.raises(RuntimeError, match="not been started"):
+        manager.submit([JobRequest(url="https://example.com/kettle")])
+
+    async def start():
+        await manager.start()
+        await manager.stop()
+
+    asyncio.run(start())
+    assert (tmp_path / "jobs.db").exists()
+
+
+def test_submit_validates_requests(manager):
+    async def submit():
+        await manager.start()
+        try:
+            with pytest.raises(ValueError):
+                manager.submit([JobRequest()])
+            with pytest.raises(ValueError):
+                manager.submit([JobRequest(url="https://example.com/kettle", phases=["cooking"])])
+        finally:
+            await manager.stop()
+
+    asyncio.run(submit())
+
+
+def test_jobs_submitted_from_threads_run_and_errors_dont_stop_the_worker(manager, monkeypatch):
+    ran = []
+
+    async def run(job_id):
+        ran.append(job_id)
+        if len(ran) == 1:
+            raise RuntimeError("could not record the analysis")
+        manager.store.update(job_id, status="succeeded")
+
+    monkeypatch.setattr(manager, "_run", run)
+
+    async def submit():
+        await manager.start()
+        try:
+            # The REST endpoints call submit from the threadpool
+            jobs = await asyncio.to_thread(manager.submit, [JobRequest(url="https://example.com/a"),
+                                                            JobRequest(url="https://example.com/b")])
+            await asyncio.wait_for(manager._queue.join(), timeout=5)
+        finally:
+            await manager.stop()
+        return jobs
+
+    first, second = asyncio.run(submit())
+    assert ran == [first["id"], second["id"]]
+    assert manager.get(first["id"])["status"] == "failed"
+    assert manager.get(first["id"])["error"] == "could not record the analysis"
+    assert manager.get(second["id"])["status"] == "succeeded"
@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+import websockets
+
+from api.framing import TEXT_PROTOCOL
+from loadtest.__main__ import _percentile, run_session, summarise_level
+
+
+def test_percentile():
+    assert _percentile([], 50) is None
+    assert _percentile([3.0], 99) == 3.0
+    values = list(range(100, 0, -1))
+    assert _percentile(values, 50) == 51
+    assert _percentile(values, 99) == 100
+    assert _percentile(values, 100) == 100
+
+
+def _session(outcome, e2e=None, frames=10):
+    return {"outcome": outcome, "connect": 0.01, "first_frame": 0.1, "e2e": e2e, "frames": frames, "error": None}
+
+
+def _server_sample(lag_p99, cpu):
+    return {"samples": 20, "lag_ms": {"p99": lag_p99, "max": lag_p99 * 2}, "cpu_percent": cpu}
+
+
+def test_summarise_level():
+    level = {
+        "clients": 4,
+        "wall": 2.0,
+        "sessions": [_session("complete", 1.0), _session("complete", 2.0), _session("shed", frames=2), _session("timeout")],
+        "server": [_server_sample(20, 40.0), _server_sample(60, 80.0), {"samples": 0}],
+    }
+    summary = summarise_level(level, max_lag_ms=100)
+    assert (summary["completed"], summary["shed"], summary["errors"], summary["timeouts"]) == (2, 1, 0, 1)
+    assert summary["e2e_p50_s"] == 2.0
+    assert summary["connect_p50_ms"] == pytest.approx(10)
+    assert summary["frames_per_s_session"] == pytest.approx((10 / 1.0 + 10 / 2.0) / 2)
+    assert summary["frames_per_s_total"] == 32 / 2.0
+    assert summary["sessions_per_s"] == 1.0
+    assert (summary["loop_lag_p99_ms"], summary["loop_lag_max_ms"]) == (60, 120)
+    assert summary["cpu_percent_mean"] == 60.0
+    # Failed sessions mean the level wasn't sustained, whatever the lag
+    assert not summary["sustained"]
+    level["sessions"] = level["sessions"][:2]
+    assert summarise_level(level, max_lag_ms=100)["sustained"]
+    assert not summarise_level(level, max_lag_ms=50)["sustained"]
+    assert not summarise_level({**level, "server": []}, max_lag_ms=100)["sustained"]
+
+
+def _run_against(*messages):
+    """Run a session against a server that sends messages after the request, then leaves the connection open."""
+    async def handler(ws):
+        await ws.send("SystemMessage: Connected")
+        await ws.recv()
+        for message in messages:
+            await ws.send(message)
+        await ws.wait_closed()
+
+    async def run():
+        async with websockets.serve(handler, "127.0.0.1", 0) as server:
+            port = server.sockets[0].getsockname()[1]
+            return await run_session(f"ws://127.0.0.1:{port}", {"url": "https://example.com"}, TEXT_PROTOCOL, 0.5)
+
+    return asyncio.run(run())
+
+
+def test_run_session_outcomes():
+    complete = _run_against("PhaseCarbon(use): 1.5", "AnalysisComplete")
+    assert complete["outcome"] == "complete" and complete["frames"] == 2 and complete["e2e"] is not None
+    assert _run_against("PhaseCarbon(use): 1.5")["outcome"] == "timeout"
+    assert _run_against("ErrorMessage: The server is busy.", "ServerBusy: 30")["outcome"] == "shed"
+
+
+def test_server_errors_are_reported_as_errors_not_timeouts():
+    result = _run_against("ErrorMessage: Product URL was not provided by the client.")
+    assert result["outcome"] == "error"
+    assert result["error"] == "ErrorMessage: Product URL was not provided by the client."
+    # An error during the analysis fails the session even if it then completes
+    assert _run_against("Product(2) ErrorMessage: scrape failed", "AnalysisComplete")["outcome"] == "error"
@@ -0,0 +1,69 @@
+import asyncio
+import tracemalloc
+
+import pytest
+
+from api.memory import MemoryProfiler
+
+_leaks = []
+
+
+@pytest.fixture
+def tracing():
+    tracemalloc.start(1)
+    yield
+    tracemalloc.stop()
+    _leaks.clear()
+
+
+async def _leaky_node(state):
+    _leaks.append(bytearray(512 * 1024))
+    return {}
+
+
+def test_disabled_profiler_leaves_nodes_alone():
+    assert MemoryProfiler().profile_node("node", _leaky_node) is _leaky_node
+
+
+def test_session_profile_reports_retained_memory_by_node(tracing):
+    profiler = MemoryProfiler(enabled=True)
+    node = profiler.profile_node("leaky_phase", _leaky_node)
+
+    @profiler.profile_session("job")
+    async def session():
+        profiler.annotate(url="https://example.com/kettle")
+        await node({})
+
+    asyncio.run(session())
+    [profile] = profiler.sessions
+    assert profile["kind"] == "job" and profile["url"] == "https://example.com/kettle"
+    assert not profile["overlapped"]
+    assert profile["retained_kb"] >= 500
+    assert profile["by_node"]["leaky_phase"] >= 500
+    assert any("test_memory.py" in entry["location"] for entry in profile["top_retained"])
+    assert not any(key.startswith("_") for key in profile)
+
+
+def test_unsampled_sessions_are_not_profiled_but_flag_overlaps(tracing):
+    profiler = MemoryProfiler(enabled=True, sample_rate=0.0)
+    node = profiler.profile_node("leaky_phase", _leaky_node)
+
+    @profiler.profile_session("websocket")
+    async def session(delay):
+        await node({})
+        await asyncio.sleep(delay)
+
+    asyncio.run(session(0))
+    assert len(profiler.sessions) == 0
+
+    async def overlapping():
+        # A profiled session, then an unsampled one starting while it runs
+        profiler.sample_rate = 1.0
+        profiled = asyncio.ensure_future(session(0.1))
+        await asyncio.sleep(0.01)
+        profiler.sample_rate = 0.0
+        await asyncio.gather(profiled, session(0))
+
+    asyncio.run(overlapping())
+    [profile] = profiler.sessions
+    assert profile["overlapped"]
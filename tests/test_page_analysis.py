@@ -0,0 +1,43 @@
+import asyncio
+
+import agents.page_analysis as page_analysis
+from agents.page_analysis import page_details_phase, short_description_from
+
+
+def _record_questions(monkeypatch):
+    asked = []
+
+    async def fake_query(markdown, question, field):
+        asked.append((field, markdown))
+        return f"{field} from the page"
+
+    monkeypatch.setattr(page_analysis, "aquery_markdown", fake_query)
+    monkeypatch.delenv("PREFETCH_PRODUCT_IMAGES", raising=False)
+    return asked
+
+
+def test_page_details_reads_and_clears_the_page_context(monkeypatch):
+    asked = _record_questions(monkeypatch)
+    updates = asyncio.run(page_details_phase({"page_context": "# Kettle\n1.7 litres", "long_description": "A kettle"}))
+    assert asked == [("short_description", "# Kettle\n1.7 litres")]
+    assert updates == {"page_context": None, "short_description": "short_description from the page"}
+
+
+def test_page_details_keeps_a_catalogue_short_description(monkeypatch):
+    asked = _record_questions(monkeypatch)
+    updates = asyncio.run(page_details_phase({"short_description": "A kettle", "page_context": "# Kettle"}))
+    assert asked == []
+    assert updates == {"page_context": None}
+
+
+def test_page_details_without_a_page_uses_the_long_description(monkeypatch):
+    asked = _record_questions(monkeypatch)
+    state = {"long_description": "A 1.7 litre stainless steel kettle. It has a 3 kW element."}
+    updates = asyncio.run(page_details_phase(state))
+    assert asked == []
+    assert updates["short_description"] == "A 1.7 litre stainless steel kettle."
+
+
+def test_short_description_from_caps_the_words():
+    assert short_description_from("") == ""
+    assert short_description_from("word " * 40, max_words=5) == "word word word word word..."
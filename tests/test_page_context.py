@@ -0,0 +1,77 @@
+import pytest
+
+import agents.page_context as page_context
+from agents.page_context import build_page_context, strip_boilerplate
+
+
+class _WordEncoding:
+    """Whitespace tokens, in place of the tiktoken encoding (which is downloaded on first use)."""
+
+    def encode(self, text):
+        return text.split()
+
+    def decode(self, tokens):
+        return " ".join(tokens)
+
+
+@pytest.fixture
+def word_tokens(monkeypatch):
+    monkeypatch.setattr(page_context, "_encoding", lambda: _WordEncoding())
+
+
+def test_boilerplate_sections_are_dropped():
+    markdown = "# Kettle\n1.7 litres\n## Customer Reviews\nGreat kettle\n## You may also like\nA toaster\n## Help\nCall us"
+    text = strip_boilerplate(markdown)
+    assert "1.7 litres" in text
+    assert "Great kettle" not in text
+    assert "A toaster" not in text
+    assert "Call us" not in text
+
+
+@pytest.mark.parametrize("heading", ["Operating Instructions", "Helpful Specifications", "Power Rating",
+                                     "Energy Rating", "Care & Related Details"])
+def test_product_headings_are_kept(heading):
+    text = strip_boilerplate(f"# Kettle\n## {heading}\n3000 W")
+    assert "3000 W" in text
+
+
+def test_links_images_navigation_and_repeats_are_removed():
+    markdown = ("[Home](/) > [Kitchen](/kitchen) > [Kettles](/kettles)\n"
+                "# Kettle ![photo](/k.jpg)\n"
+                "Made of [stainless steel](/steel)\n"
+                "Free delivery\n"
+                "## Details\n"
+                "Free delivery\n")
+    text = strip_boilerplate(markdown)
+    assert "Home" not in text
+    assert "# Kettle photo" in text
+    assert "Made of stainless steel" in text
+    assert text.count("Free delivery") == 1
+
+
+def test_page_context_fits_the_budget_and_keeps_product_sections_first(word_tokens):
+    markdown = ("# Kettle\nA kettle\n"
+                "## Shipping\n" + "ship " * 100 + "\n"
+                "## Specifications\n" + "spec " * 20)
+    context, tokens = build_page_context(markdown, token_budget=80)
+    assert "A kettle" in context
+    assert "spec spec" in context
+    assert tokens["context"] <= 80
+    assert tokens["saved"] == tokens["raw"] - tokens["context"]
+    # Sections stay in page order
+    assert context.index("Shipping") < context.index("Specifications")
+
+
+def test_token_counts_are_approximated_without_the_encoding(monkeypatch):
+    def unavailable(name):
+        raise ConnectionError("no network")
+
+    monkeypatch.setattr(page_context.tiktoken, "get_encoding", unavailable)
+    page_context._encoding.cache_clear()
+    try:
+        assert page_context.count_tokens("a" * 40) == 10
+        context, tokens = build_page_context("# Kettle\n" + "word " * 400, token_budget=100)
+        assert tokens["context"] <= 100
+        assert context.startswith("# Kettle")
+    finally:
+        page_context._encoding.cache_clear()
@@ -0,0 +1,69 @@
+import math
+
+import pytest
+
+import agents.priors as priors
+from agents.priors import PriorIndex, normalize_category, record_analysis
+
+
+@pytest.mark.parametrize("category, normalized", [
+    ("Office_Chairs", "office chair"),
+    ("Batteries", "battery"),
+    ("Lunch Boxes", "lunch box"),
+    ("Glass", "glass"),
+    ("  T-Shirts ", "t shirt"),
+    ("---", ""),
+])
+def test_normalize_category(category, normalized):
+    assert normalize_category(category) == normalized
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = PriorIndex(str(tmp_path / "priors.db"))
+    for total in [10.0, 20.0, 40.0]:
+        index.add("Office Chairs", {"materials": total / 2, "use": 1.0, "total": total})
+    return index
+
+
+def test_estimate_is_the_geometric_mean_with_a_range(index):
+    estimate = index.estimate("office chair")
+    assert estimate["matched"] == "office chair"
+    assert estimate["total"]["estimate"] == pytest.approx(20.0)
+    assert estimate["total"]["low"] < 20.0 < estimate["total"]["high"]
+    assert estimate["total"]["samples"] == 3
+    # A constant phase still gets the minimum spread
+    assert estimate["by_phase"]["use"]["estimate"] == pytest.approx(1.0)
+    assert estimate["by_phase"]["use"]["high"] == pytest.approx(math.exp(1.645 * 0.35))
+
+
+def test_estimate_falls_back_to_shorter_categories(index):
+    assert index.estimate("Ergonomic Office Chair")["matched"] == "office chair"
+    assert index.estimate("office chair", min_samples=4) is None
+    assert index.estimate("kettle") is None
+    index.add_bounds("kettles", 5, 15)
+    assert index.estimate("electric kettle") == {"category": "electric kettle", "matched": None, "by_phase": {},
+                                                 "total": None, "reference": {"category": "kettle", "low": 5, "high": 15}}
+
+
+def test_check_flags_results_far_from_the_prior(index):
+    assert index.check("office chair", "total", 30.0) is None
+    outlier = index.check("office chair", "total", 5000.0)
+    assert outlier["phase"] == "total"
+    assert outlier["expected"] == pytest.approx(20.0)
+    assert outlier["z"] > 3
+    assert index.check("office chair", "packaging", 5000.0) is None
+    assert index.check("office chair", "total", None) is None
+
+
+def test_record_analysis_leaves_out_outliers(index, monkeypatch):
+    monkeypatch.setattr(priors, "get_priors", lambda: index)
+    phases = {phase: {"carbon": 1.0} for phase in priors.PRIOR_PHASES[:-1]}
+    record_analysis("Office Chair", {**phases, "materials": {"carbon": 10.0}}, complete=True)
+    record_analysis("Office Chair", {**phases, "materials": {"carbon": 5000.0}}, complete=True)
+    stats = index._stats("office chair")
+    assert stats["materials"][0] == 4
+    assert stats["use"][0] == 5
+    # The complete analysis without outliers adds its total; the other doesn't
+    assert stats["total"][0] == 4
+    assert stats["packaging"][0] == 2
@@ -0,0 +1,57 @@
+import pytest
+
+from llm.models import get_chat_model, llm_metrics
+from llm.routing import load_routing, model_cost, model_for, routing_table
+
+
+@pytest.fixture(autouse=True)
+def default_routing(monkeypatch):
+    monkeypatch.delenv("LLM_ROUTING_FILE", raising=False)
+    monkeypatch.delenv("LLM_ROUTING_TIER", raising=False)
+    load_routing.cache_clear()
+    yield
+    load_routing.cache_clear()
+
+
+def test_routes_resolve_tiers_and_model_names():
+    assert model_for("ef.picker") == load_routing()["tiers"]["standard"]
+    assert model_for("ef.source.epa") == "gpt-4o"
+    assert get_chat_model(route="bill_of_materials").model_name == load_routing()["tiers"]["strong"]
+
+
+def test_unknown_routes_and_tiers_are_rejected(monkeypatch):
+    with pytest.raises(KeyError, match="agents.cooking"):
+        model_for("agents.cooking")
+    monkeypatch.setenv("LLM_ROUTING_TIER", "fast")
+    assert set(routing_table().values()) == {load_routing()["tiers"]["fast"]}
+    monkeypatch.setenv("LLM_ROUTING_TIER", "huge")
+    with pytest.raises(ValueError, match="huge"):
+        model_for("ef.picker")
+    with pytest.raises(ValueError):
+        get_chat_model()
+
+
+def test_routing_file_override(monkeypatch, tmp_path):
+    path = tmp_path / "routing.yaml"
+    path.write_text("tiers:\n  fast: tiny-model\nroutes:\n  ef.picker: fast\n  agents.use: big-model\n")
+    monkeypatch.setenv("LLM_ROUTING_FILE", str(path))
+    assert routing_table() == {"ef.picker": "tiny-model", "agents.use": "big-model"}
+    path.write_text("routes:\n  ef.picker: fast\n")
+    load_routing.cache_clear()
+    with pytest.raises(ValueError, match="tiers and routes"):
+        load_routing()
+
+
+def test_model_cost_uses_the_longest_price_prefix():
+    # 1M input and 1M output tokens of a dated gpt-4.1-mini snapshot, not gpt-4.1
+    assert model_cost("gpt-4.1-mini-2025-04-14", 1_000_000, 1_000_000) == pytest.approx(0.40 + 1.60)
+    assert model_cost("gpt-4o-2024-08-06", 2_000, 1_000) == pytest.approx((2_000 * 2.50 + 1_000 * 10.00) / 1e6)
+    assert model_cost("claude-unknown", 1_000, 1_000) is None
+
+
+def test_llm_metrics_report_every_route_with_a_priced_model():
+    metrics = llm_metrics()
+    assert metrics["routing"] == routing_table()
+    assert "hedging" in metrics
+    for route, model in metrics["routing"].items():
+        assert model_cost(model, 1_000, 1_000) is not None, route
@@ -0,0 +1,136 @@
+import asyncio
+import threading
+
+import pytest
+
+from llm.cancellation import AnalysisCancelled
+from tools.emissions_factors.single_flight import Abandoned, SingleFlight, wait
+
+
+def test_claim_leader_and_follower():
+    flight = SingleFlight()
+    future, leader = flight.claim("k")
+    joined, follower_leads = flight.claim("k")
+    assert leader and not follower_leads
+    assert joined is future
+    flight.resolve("k", future, 1.5)
+    assert joined.result() == 1.5
+    assert flight.stats()["in_flight"] == 0
+    assert flight.stats()["hits"] == 1
+
+
+def test_reject_propagates_error():
+    flight = SingleFlight()
+    future, _ = flight.claim("k")
+    flight.fail("k", future, ValueError("boom"))
+    with pytest.raises(ValueError):
+        future.result()
+
+
+def test_cancelled_leader_abandons():
+    flight = SingleFlight()
+    future, _ = flight.claim("k")
+    flight.fail("k", future, AnalysisCancelled("disconnect"))
+    with pytest.raises(Abandoned):
+        future.result()
+    assert flight.stats()["abandoned"] == 1
+
+
+def test_stale_leader_does_not_touch_newer_leader():
+    flight = SingleFlight()
+    old, _ = flight.claim("k")
+    flight.fail("k", old, ValueError("boom"))
+    new, leader = flight.claim("k")
+    assert leader and new is not old
+    # The first leader's late result (or a second failure) is ignored
+    flight.resolve("k", old, 1.0)
+    flight.fail("k", old, ValueError("again"))
+    assert not new.done()
+    assert flight.stats()["in_flight"] == 1
+    flight.resolve("k", new, 2.0)
+    assert new.result() == 2.0
+
+
+def test_do_runs_once_for_concurrent_callers():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 3.0
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do("k", compute)))
+    leader.start()
+    started.wait(5)
+    follower = threading.Thread(target=lambda: results.append(flight.do("k", compute)))
+    follower.start()
+    release.set()
+    leader.join(5)
+    follower.join(5)
+    assert results == [3.0, 3.0]
+    assert len(calls) == 1
+
+
+def test_ado_follower_takes_over_abandoned_key():
+    flight = SingleFlight()
+
+    async def scenario():
+        future, _ = flight.claim("k")
+        follower = asyncio.create_task(flight.ado("k", lambda: asyncio.sleep(0, result=4.0)))
+        await asyncio.sleep(0)
+        flight.fail("k", future, asyncio.CancelledError())
+        return await follower
+
+    assert asyncio.run(scenario()) == 4.0
+
+
+def test_wait_is_shielded():
+    flight = SingleFlight()
+
+    async def scenario():
+        future, _ = flight.claim("k")
+        waiter = asyncio.create_task(wait(future))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert not future.done()
+        flight.resolve("k", future, 1.0)
+        return future.result()
+
+    assert asyncio.run(scenario()) == 1.0
+
+
+def test_batch_tool_cancels_sibling_chunks_on_failure(monkeypatch):
+    from tools.emissions_factors import emissions_factors as ef
+
+    sibling_cancelled = asyncio.Event()
+
+    class FakeBatchGraph:
+        async def ainvoke(self, state):
+            if state["requests"][0]["process_desc"] == "fails":
+                raise ValueError("source down")
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                sibling_cancelled.set()
+                raise
+
+    monkeypatch.setattr(ef, "ef_batch_graph", FakeBatchGraph())
+    monkeypatch.setattr(ef, "ef_single_flight", SingleFlight())
+    monkeypatch.setenv("EF_BATCH_CHUNK_SIZE", "1")
+
+    async def scenario():
+        with pytest.raises(ValueError):
+            await ef.emissions_factors_batch_finder_tool.coroutine([
+                {"process_desc": "fails", "phase": "materials"},
+                {"process_desc": "slow", "phase": "materials"},
+            ])
+        assert sibling_cancelled.is_set()
+        assert ef.ef_single_flight.stats()["in_flight"] == 0
+
+    asyncio.run(scenario())
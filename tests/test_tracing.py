@@ -0,0 +1,116 @@
+import asyncio
+import time
+
+import pytest
+
+from llm.tracing import annotate, span, trace_session, traced
+from llm.waterfall import critical_path, critical_path_breakdown, load_traces, render_waterfall
+
+
+@pytest.fixture
+def trace_path(monkeypatch, tmp_path):
+    path = tmp_path / "traces" / "traces.jsonl"
+    monkeypatch.setenv("TRACE_EXPORT_PATH", str(path))
+    return path
+
+
+@traced("lookup", "tool")
+def _lookup_in_thread(name):
+    annotate(process_desc=name)
+    with span("llm", "llm", model="stub"):
+        time.sleep(0.01)
+
+
+@traced("agent", "node")
+async def _agent(name):
+    with span("llm", "llm", model="stub"):
+        await asyncio.sleep(0.01)
+    # Tools run in executor threads, which inherit the current span
+    await asyncio.to_thread(_lookup_in_thread, name)
+
+
+def test_spans_nest_across_gather_and_executor_threads(trace_path):
+    @trace_session("job")
+    async def session():
+        annotate(url="https://example.com/kettle")
+        await asyncio.gather(_agent("steel"), _agent("glass"))
+
+    asyncio.run(session())
+    [spans] = load_traces(str(trace_path)).values()
+    by_id = {s["span_id"]: s for s in spans}
+    [root] = [s for s in spans if s["parent_id"] is None]
+    assert root["name"] == "job" and root["attributes"] == {"url": "https://example.com/kettle"}
+
+    agents = [s for s in spans if s["name"] == "agent"]
+    assert len(agents) == 2 and all(a["parent_id"] == root["span_id"] for a in agents)
+    lookups = [s for s in spans if s["name"] == "lookup"]
+    assert sorted(s["attributes"]["process_desc"] for s in lookups) == ["glass", "steel"]
+    assert {by_id[s["parent_id"]]["name"] for s in lookups} == {"agent"}
+    # Each agent has its own model call and lookup, and each lookup its own model call
+    assert len({s["parent_id"] for s in lookups}) == 2
+    llm_parents = [by_id[s["parent_id"]]["name"] for s in spans if s["name"] == "llm"]
+    assert sorted(llm_parents) == ["agent", "agent", "lookup", "lookup"]
+    assert all(s["status"] == "ok" and s["end"] >= s["start"] for s in spans)
+
+
+def test_spans_outside_a_trace_are_not_recorded(trace_path):
+    with span("llm", "llm") as current:
+        assert current is None
+    assert asyncio.run(_agent("steel")) is None
+    assert not trace_path.exists()
+
+
+def test_exporter_appends_traces_and_records_failures(trace_path):
+    @trace_session("websocket")
+    async def session(error):
+        with span("scrape", "scrape"):
+            raise error
+
+    for error in [RuntimeError("503 from the scraper"), asyncio.CancelledError()]:
+        with pytest.raises(BaseException):
+            asyncio.run(session(error))
+
+    traces = list(load_traces(str(trace_path)).values())
+    assert len(traces) == 2
+    failed, cancelled = [{s["name"]: s for s in spans} for spans in traces]
+    assert failed["scrape"]["status"] == "error"
+    assert failed["scrape"]["error"] == "RuntimeError: 503 from the scraper"
+    assert failed["websocket"]["status"] == "error"
+    assert cancelled["scrape"]["status"] == "cancelled"
+
+
+def _span(span_id, parent_id, start, end, name=None, kind="node"):
+    return {"trace_id": "t1", "span_id": span_id, "parent_id": parent_id, "name": name or span_id, "kind": kind,
+            "start": start, "end": end, "duration": end - start, "status": "ok", "error": None, "attributes": {}}
+
+
+# A session waiting on two parallel agents (the slower one waits on an LLM
+# call), then on the summarizer
+SPANS = [
+    _span("session", None, 0.0, 10.0, kind="session"),
+    _span("fast_agent", "session", 0.0, 4.0),
+    _span("slow_agent", "session", 0.0, 9.0),
+    _span("slow_llm", "slow_agent", 1.0, 8.0, name="llm", kind="llm"),
+    _span("summarizer", "session", 9.0, 10.0),
+]
+
+
+def test_critical_path_follows_what_the_session_waited_on():
+    assert [s["span_id"] for s in critical_path(SPANS)] == ["session", "slow_agent", "slow_llm", "summarizer"]
+
+
+def test_critical_path_breakdown_splits_self_time():
+    breakdown = critical_path_breakdown(SPANS)
+    assert breakdown["duration"] == 10.0
+    assert breakdown["by_kind"] == {"llm": 7.0, "node": 3.0, "session": 0.0}
+    assert breakdown["by_name"] == {"llm": 7.0, "slow_agent": 2.0, "summarizer": 1.0, "session": 0.0}
+
+
+def test_render_waterfall_marks_the_critical_path():
+    lines = render_waterfall(SPANS, width=10).splitlines()
+    assert lines[0].startswith("Trace t1 session: 10.00s, 5 spans")
+    marked = {line.split()[-1]: "*" in line for line in lines[1:]}
+    assert marked == {"fast_agent": False, "slow_agent": True, "llm": True, "summarizer": True}
+    # Short spans are hidden unless they are on the critical path
+    lines = render_waterfall(SPANS, width=10, min_ms=5000).splitlines()
+    assert [line.split()[-1] for line in lines[1:]] == ["slow_agent", "llm", "summarizer"]
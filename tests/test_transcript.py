@@ -0,0 +1,42 @@
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from agents.transcript import compact_messages, load_transcript, load_transcripts, store_transcript
+
+CONFIG = {"configurable": {"thread_id": "session-1"}}
+
+
+def test_compact_messages():
+    messages = [
+        HumanMessage(content="How heavy is it?"),
+        AIMessage(content="", tool_calls=[{"name": "calculator", "args": {"expression": "2 * 3" * 10}, "id": "call-1"}]),
+        ToolMessage(content=[{"type": "text", "text": "6"}], tool_call_id="call-1", name="calculator"),
+        {"role": "ai", "content": "x" * 50},
+    ]
+    records = compact_messages(messages, max_content_chars=20)
+    assert [record["role"] for record in records] == ["human", "ai", "tool", "ai"]
+    assert records[1]["tool_calls"] == [{"name": "calculator", "args": {"expression": "2 * 32 * 32 * 32 ..."}, "id": "call-1"}]
+    assert records[2]["content"] == "6"
+    assert records[2]["tool_call_id"] == "call-1"
+    assert records[3]["content"] == "x" * 17 + "..."
+
+
+def test_no_store_without_a_directory(monkeypatch):
+    monkeypatch.delenv("TRANSCRIPT_STORE_DIR", raising=False)
+    assert store_transcript(CONFIG, "use", [HumanMessage(content="hi")]) is None
+
+
+def test_transcripts_round_trip_and_reruns_keep_earlier_ones(tmp_path, monkeypatch):
+    monkeypatch.setenv("TRANSCRIPT_STORE_DIR", str(tmp_path))
+    first = store_transcript(CONFIG, "use", [HumanMessage(content="first run"), AIMessage(content="12 kWh")])
+    second = store_transcript(CONFIG, "use", [{"role": "ai", "content": "second run"}])
+    assert first != second
+
+    latest = load_transcript("session-1", "use")
+    assert latest == [{"role": "ai", "content": "second run"}]
+    runs = load_transcripts("session-1", "use")
+    assert len(runs) == 2
+    assert runs[0][0]["type"] == "human"
+    assert runs[0][1]["data"]["content"] == "12 kWh"
+    with pytest.raises(FileNotFoundError):
+        load_transcript("session-1", "eol")
@@ -0,0 +1,51 @@
+import pytest
+
+from tools.emissions_factors.units import conversion_factor, convert_values, normalize_factor, normalize_factors, parse_factor_units
+
+
+@pytest.mark.parametrize("units, expected", [
+    ("kgCO2e/kg", (1.0, "CO2e", "mass")),
+    ("kg CO2e per kg", (1.0, "CO2e", "mass")),
+    ("lbCO2/MWh", (0.45359237 / 1000, "CO2", "energy")),
+    ("Metric Tons CO2e / Short Ton", (1000 / 907.18474, "CO2e", "mass")),
+    ("g CH4 per 1,000 kg", (1e-6, "CH4", "mass")),
+    ("kgCO2/short ton-mile", (1 / (0.90718474 * 1.609344), "CO2", "freight")),
+    ("CO2e/kWh", (1.0, "CO2e", "energy")),
+])
+def test_parse_factor_units(units, expected):
+    multiplier, gas, dimension = parse_factor_units(units)
+    assert multiplier == pytest.approx(expected[0])
+    assert (gas, dimension) == expected[1:]
+
+
+@pytest.mark.parametrize("units", ["kgCO2e", "kgCO2e/furlong", "kg/kg", "dollars CO2e/kg"])
+def test_unparseable_units(units):
+    assert parse_factor_units(units) is None
+
+
+def test_conversion_factor():
+    assert conversion_factor("lb", "kg") == pytest.approx(0.45359237)
+    assert conversion_factor("lbCO2/MWh", "kgCO2/kWh") == pytest.approx(0.45359237 / 1000)
+    assert list(convert_values([1, 2], "t", "kg")) == [1000.0, 2000.0]
+    with pytest.raises(ValueError):
+        conversion_factor("kg", "km")
+    with pytest.raises(ValueError):
+        conversion_factor("kgCO2/kWh", "kgCO2e/kWh")
+
+
+def test_normalize_factors():
+    factors = [
+        {"CO2e_factor": 1000.0, "units": "lbCO2e/MWh", "source": "egrid"},
+        {"CO2e_factor": 2.0, "units": "kgCO2e/kg"},
+        {"CO2e_factor": 5.0, "units": "kgCO2e per furlong"},
+        {"CO2e_factor": -1, "units": "lbCO2e/MWh"},
+        None,
+        {"CO2e_factor": 2000.0, "units": "lbCO2e/MWh"},
+    ]
+    normalized = normalize_factors(factors)
+    assert normalized[0] == {"CO2e_factor": pytest.approx(0.45359237), "units": "kgCO2e/kWh", "source": "egrid",
+                             "original_CO2e_factor": 1000.0, "original_units": "lbCO2e/MWh"}
+    assert normalized[5]["CO2e_factor"] == pytest.approx(2 * 0.45359237)
+    # Canonical, unparseable, not found and missing factors are left as they are
+    assert normalized[1:5] == factors[1:5]
+    assert normalize_factor(factors[1]) is factors[1]
@@ -1,6 +1,13 @@
+import json
 import numexpr
 import math
+import numpy as np
+from functools import lru_cache
+from typing import Optional, Union
 from langchain_core.tools import tool
+from numexpr.necompiler import getExprNames
+
+CONSTANTS = {"pi": math.pi, "e": math.e}
 
 # See https://python.langchain.com/api_reference/langchain/chains/langchain.chains.llm_math.base.LLMMathChain.html
 @tool
@@ -23,4 +30,81 @@ def calculator(expression: str) -> str:
             global_dict={},  # restrict access to globals
             local_dict=local_dict,  # add common mathematical functions
         )
-    )
\ No newline at end of file
+    )
+
+@lru_cache(maxsize=1024)
+def compile_expression(expression: str) -> tuple[numexpr.NumExpr, tuple[str, ...]]:
+    """Parse and compile an expression once, returning it with its variable names."""
+    names, _ = getExprNames(expression, {})
+    signature = [(name, np.float64) for name in names]
+    return numexpr.NumExpr(expression, signature=signature), tuple(names)
+
+def evaluate_expressions(expressions: dict[str, str], variables: Optional[dict[str, Union[float, list[float]]]] = None,
+                         total_of: Optional[str] = None) -> dict:
+    """
+    Evaluate named expressions over scalar or array variables.
+
+    Expressions are evaluated in order and may reference the variables, the
+    constants pi and e, and the results of earlier expressions by name.
+
+    Args:
+        expressions: Expressions by name ("total" is reserved)
+        variables: Scalars or equal-length lists
+        total_of: Expression whose result is totalled. Defaults to every
+            expression no other expression references (the final results,
+            not the intermediates they are built from).
+
+    Returns:
+        Dict with each expression's result (a float, or a list for arrays) and
+        "total", the sum of all elements of the totalled expressions.
+
+    Raises:
+        ValueError: If an expression is named "total", uses undefined
+            variables, or total_of is not an expression
+    """
+    if "total" in expressions:
+        raise ValueError("'total' is reserved for the sum of the results; give the expression another name")
+    if total_of is not None and total_of not in expressions:
+        raise ValueError(f"total_of '{total_of}' is not one of the expressions")
+
+    scope = {**CONSTANTS}
+    for name, value in (variables or {}).items():
+        scope[name] = np.asarray(value, dtype=np.float64)
+
+    results = {}
+    referenced = set()
+    for name, expression in expressions.items():
+        compiled, names = compile_expression(expression.strip())
+        missing = [n for n in names if n not in scope]
+        if missing:
+            raise ValueError(f"Expression '{name}' uses undefined variables: {missing}")
+        referenced.update(n for n in names if n in results)
+        args = [np.asarray(scope[n], dtype=np.float64) for n in names]
+        # Broadcast so scalar-only expressions and mixed scalar/array ones both work
+        value = np.asarray(compiled(*np.broadcast_arrays(*args)) if args else compiled(), dtype=np.float64)
+        scope[name] = value
+        results[name] = value.tolist()
+
+    totalled = [total_of] if total_of is not None else [name for name in expressions if name not in referenced]
+    results["total"] = float(sum(np.sum(scope[name]) for name in totalled))
+    return results
+
+@tool
+def batch_calculator(expressions: dict[str, str], variables: Optional[dict[str, Union[float, list[float]]]] = None,
+                     total_of: Optional[str] = None) -> str:
+    """Calculate several named expressions in one call using numexpr, vectorised over arrays.
+
+    Use this instead of repeated calculator calls, e.g. to multiply every
+    material mass by its emissions factor and add them up. Variables may be
+    numbers or equal-length lists of numbers. Expressions are evaluated in
+    order and can use the results of earlier expressions by name. The
+    result contains every expression's value plus "total": the sum of the
+    values of the expressions no other expression uses, or of the one named
+    by total_of. Don't name an expression "total".
+
+    Example:
+        variables={"mass_kg": [0.2, 0.05, 0.01], "ef": [2.1, 8.6, 1.9]}
+        expressions={"emissions": "mass_kg * ef"}
+        returns {"emissions": [0.42, 0.43, 0.019], "total": 0.869}
+    """
+    return json.dumps(evaluate_expressions(expressions, variables, total_of))
@@ -1,55 +1,117 @@
+import asyncio
+import os
+import re
+from contextvars import ContextVar
+from typing import Any, Dict, Hashable, Optional
 from pydantic import BaseModel, Field
-from langchain_openai import ChatOpenAI
+from llm.models import get_chat_model
+from llm.tracing import annotate, traced
 from langchain_core.tools import tool
 from langgraph.graph import StateGraph, START, END
-from tools.emissions_factors.sources.epa_emissions_factors_hub import epa_ef_finder
-from tools.emissions_factors.sources.parametric_knowledge import parametric_knowledge_ef_finder
-from tools.emissions_factors.state import EFState
+from tools.emissions_factors.sources.epa_emissions_factors_hub import epa_ef_finder, epa_ef_batch_finder
+from tools.emissions_factors.sources.parametric_knowledge import parametric_knowledge_ef_finder, parametric_knowledge_ef_batch_finder
+from tools.emissions_factors.single_flight import Abandoned, SingleFlight, wait
+from tools.emissions_factors.state import EFState, EFBatchState, EFRequest
+from tools.emissions_factors.units import normalize_factors
 
+picker_sys_prompt = """
+You will be provided with 2 or more CO2 emissions factor values. Evaluate
+the sources and decide which is the best fit for the supplied process and
+analysis phase. Always prefer an emissions factor with a real citation
+over an emissions factor based on parametric knowledge.
+"""
 
 def source_picker(state:EFState):
-    # Remove invalid candidates (those with a negative factor value)
-    valid_candidates = [c for c in state["ef_candidates"] if c["CO2e_factor"] >= 0]
+    # Remove invalid candidates (those with a negative factor value), and put
+    # the rest into canonical units so they can be compared (and used) directly
+    valid_candidates = normalize_factors([c for c in state["ef_candidates"] if c["CO2e_factor"] >= 0])
 
     # If there's only one valid candidate, just return it
     if len(valid_candidates) == 1:
         return {"emissions_factor": valid_candidates[0]}
-    
+
     class BestIndex(BaseModel):
         best_index: int = Field(description="The index (starting at zero) of the best emission factor candidate")
 
-    ef_picker_llm = ChatOpenAI(
-        model_name="gpt-4o", 
+    ef_picker_llm = get_chat_model(
+        route="ef.picker",
         temperature=0,
     ).with_structured_output(BestIndex)
 
-    sys_prompt = """
-    You will be provided with 2 or more CO2 emissions factor values. Evaluate
-    the sources and decide which is the best fit for the supplied process and
-    analysis phase. Always prefer an emissions factor with a real citation
-    over an emissions factor based on parametric knowledge.
-    """
     data_prompt = f"Process: {state['process_desc']}, Phase: {state['phase']}\n\n---\n\n"
     data_prompt += "\n\n".join([f"[{i}]: {c}" for i, c in enumerate(valid_candidates)])
 
     response:BestIndex = ef_picker_llm.invoke([
-        {"role": "system", "content": sys_prompt},
+        {"role": "system", "content": picker_sys_prompt},
         {"role": "user", "content": data_prompt}
     ])
 
     return {"emissions_factor": valid_candidates[response.best_index]}
 
+async def batch_source_picker(state:EFBatchState):
+    """Picks the best candidate for every request, using one LLM call for all contested requests."""
+    candidates_by_request = [[] for _ in state["requests"]]
+    for c in state["ef_candidates"]:
+        # Remove invalid candidates (those with a negative factor value)
+        if c["CO2e_factor"] >= 0:
+            candidate = {k: v for k, v in c.items() if k != "request_index"}
+            candidates_by_request[c["request_index"]].append(candidate)
+
+    # Put every candidate into canonical units in one pass
+    flat = normalize_factors([c for candidates in candidates_by_request for c in candidates])
+    for candidates in candidates_by_request:
+        candidates[:], flat = flat[:len(candidates)], flat[len(candidates):]
+
+    # Requests with zero or one valid candidate need no picking
+    picked = [candidates[0] if len(candidates) == 1 else None for candidates in candidates_by_request]
+    contested = [i for i, candidates in enumerate(candidates_by_request) if len(candidates) > 1]
+    if not contested:
+        return {"emissions_factors": picked}
+
+    class RequestBestIndex(BaseModel):
+        request_index: int = Field(description="The index of the process")
+        best_index: int = Field(description="The index (starting at zero) of the best emission factor candidate for this process")
+
+    class BestIndices(BaseModel):
+        best_indices: list[RequestBestIndex] = Field(description="The best candidate for each process")
+
+    ef_picker_llm = get_chat_model(
+        route="ef.picker",
+        temperature=0,
+    ).with_structured_output(BestIndices)
+
+    data_prompt = "\n\n===\n\n".join([
+        f"Process [{i}]: {state['requests'][i]['process_desc']}, Phase: {state['requests'][i]['phase']}\n\n---\n\n"
+        + "\n\n".join([f"[{j}]: {c}" for j, c in enumerate(candidates_by_request[i])])
+        for i in contested
+    ])
+
+    response:BestIndices = await ef_picker_llm.ainvoke([
+        {"role": "system", "content": picker_sys_prompt + "\nDo this separately for each process."},
+        {"role": "user", "content": data_prompt}
+    ])
+
+    for best in response.best_indices:
+        if best.request_index in contested and 0 <= best.best_index < len(candidates_by_request[best.request_index]):
+            picked[best.request_index] = candidates_by_request[best.request_index][best.best_index]
+    # Fall back to the first candidate if the picker skipped a request
+    for i in contested:
+        if picked[i] is None:
+            picked[i] = candidates_by_request[i][0]
+
+    return {"emissions_factors": picked}
+
 builder = StateGraph(EFState)
 builder.add_node(source_picker)
 sources = [
-    parametric_knowledge_ef_finder, 
+    parametric_knowledge_ef_finder,
     epa_ef_finder
 ]
 named_sources = {f"source-{i}": source for i, source in enumerate(sources)}
 
 # Fan out
 for name, source in named_sources.items():
-    builder.add_node(name, source)
+    builder.add_node(name, traced(source.__name__, "ef_source")(source))
     builder.add_edge(START, name)
 
 # Fan in
@@ -58,15 +120,161 @@ builder.add_edge("source_picker", END)
 
 ef_graph = builder.compile()
 
+# The batch graph mirrors ef_graph, but each source answers all requests in a
+# single LLM call.
+batch_builder = StateGraph(EFBatchState)
+batch_builder.add_node(batch_source_picker)
+batch_sources = [
+    parametric_knowledge_ef_batch_finder,
+    epa_ef_batch_finder
+]
+named_batch_sources = {f"source-{i}": source for i, source in enumerate(batch_sources)}
+
+# Fan out
+for name, source in named_batch_sources.items():
+    batch_builder.add_node(name, traced(source.__name__, "ef_source")(source))
+    batch_builder.add_edge(START, name)
+
+# Fan in
+batch_builder.add_edge(named_batch_sources.keys(), "batch_source_picker")
+batch_builder.add_edge("batch_source_picker", END)
+
+ef_batch_graph = batch_builder.compile()
+
+def normalize_request(process_desc: str, phase: str) -> tuple[str, str]:
+    """Normalized (process_desc, phase) key, so trivially different requests are treated as identical."""
+    def normalize(text):
+        return re.sub(r"\s+", " ", text).strip().strip(".").lower()
+    return normalize(process_desc), normalize(phase)
+
+# Identical lookups that are already in flight (from any agent or session)
+# wait on the pending computation instead of calling the sources again
+ef_single_flight = SingleFlight()
+
+class FactorCache:
+    """Factors found so far in a session, so later lookups of the same process reuse them."""
+
+    def __init__(self):
+        self.factors: Dict[Hashable, Any] = {}
+        self.hits = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        factor = self.factors.get(key)
+        if factor is not None:
+            self.hits += 1
+        return factor
+
+    def put(self, key: Hashable, factor: Any) -> None:
+        self.factors[key] = factor
+
+# Set by sessions that analyse several products (see api/comparison.py); tasks
+# and executor threads started by the session inherit it
+ef_session_cache: ContextVar[Optional[FactorCache]] = ContextVar("ef_session_cache", default=None)
+
 @tool
+@traced("emissions_factor_finder_tool", "tool")
 def emissions_factor_finder_tool(process_desc: str, phase: str) -> float:
-    """Given a process and phase, returns the most appropriate emissions factor."""
+    """Given a process and phase, returns the most appropriate emissions factor.
+    Factors are in canonical units: kgCO2e (or kgCO2) per kg, kWh, km, tonne-km, L, m2 or item."""
     print(f"TOOL: Emissions Factor Finder {process_desc} {phase}")
 
-    response = ef_graph.invoke({"process_desc": process_desc, "phase": phase})
+    annotate(process_desc=process_desc, phase=phase)
+    key = normalize_request(process_desc, phase)
+    cache = ef_session_cache.get()
+    if cache is not None and (factor := cache.get(key)) is not None:
+        annotate(cached=True)
+        return factor
+
+    factor = ef_single_flight.do(
+        key,
+        lambda: ef_graph.invoke({"process_desc": process_desc, "phase": phase})["emissions_factor"]
+    )
+    if cache is not None:
+        cache.put(key, factor)
+    return factor
+
+@tool
+@traced("emissions_factors_batch_finder_tool", "tool")
+async def emissions_factors_batch_finder_tool(requests: list[EFRequest]) -> list:
+    """Given a list of processes and phases, returns the most appropriate emissions factor for each.
+    Prefer this over calling emissions_factor_finder_tool several times when you need more than one factor.
+    Factors are in canonical units: kgCO2e (or kgCO2) per kg, kWh, km, tonne-km, L, m2 or item."""
+    requests = [r if isinstance(r, EFRequest) else EFRequest(**r) for r in requests]
+    print(f"TOOL: Emissions Factors Batch Finder ({len(requests)} requests)")
+
+    # De-duplicate requests
+    unique = {}
+    for r in requests:
+        unique.setdefault(normalize_request(r.process_desc, r.phase), r)
+
+    # Reuse factors found earlier in the session
+    cache = ef_session_cache.get()
+    cached = {}
+    if cache is not None:
+        for key in unique:
+            if (factor := cache.get(key)) is not None:
+                cached[key] = factor
+
+    # Join lookups already in flight elsewhere, and claim the rest
+    futures = {}
+    keys = []
+    for key in unique:
+        if key in cached:
+            continue
+        futures[key], leader = ef_single_flight.claim(key)
+        if leader:
+            keys.append(key)
+
+    annotate(requests=len(requests), unique=len(unique), cached=len(cached), looked_up=len(keys), joined=len(futures) - len(keys))
+
+    async def resolve_chunk(chunk):
+        try:
+            response = await ef_batch_graph.ainvoke({"requests": [unique[key].model_dump() for key in chunk]})
+        except BaseException as e:
+            for key in chunk:
+                ef_single_flight.fail(key, futures[key], e)
+            raise
+        for key, factor in zip(chunk, response["emissions_factors"]):
+            ef_single_flight.resolve(key, futures[key], factor)
+
+    # Resolve chunks of requests concurrently, each chunk with one LLM call per source
+    chunk_size = int(os.environ.get("EF_BATCH_CHUNK_SIZE", 8))
+    chunks = [keys[i:i + chunk_size] for i in range(0, len(keys), chunk_size)]
+    tasks = [asyncio.ensure_future(resolve_chunk(chunk)) for chunk in chunks]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException as e:
+        # Stop the sibling chunks (their keys are abandoned, so waiters take
+        # them over) and release claimed keys whose chunk never got to run
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for key in keys:
+            ef_single_flight.fail(key, futures[key], e)
+        raise
+
+    async def factor(key):
+        try:
+            return await wait(futures[key])
+        except Abandoned:
+            # The analysis looking it up was cancelled; look it up here instead
+            async def lookup():
+                response = await ef_batch_graph.ainvoke({"requests": [unique[key].model_dump()]})
+                return response["emissions_factors"][0]
+            return await ef_single_flight.ado(key, lookup)
+
+    factors = {key: await factor(key) for key in futures}
+    if cache is not None:
+        for key, value in factors.items():
+            cache.put(key, value)
+    factors.update(cached)
 
-    return response["emissions_factor"]
+    return [{
+        "process_desc": r.process_desc,
+        "phase": r.phase,
+        "emissions_factor": factors[normalize_request(r.process_desc, r.phase)]
+    } for r in requests]
 
 # Test call
 #emissions_factor_finder("LCD display for a cell phone", "manufacturing")
-#emissions_factor_finder("Driving a freight truck", "transportation")
\ No newline at end of file
+#emissions_factor_finder("Driving a freight truck", "transportation")
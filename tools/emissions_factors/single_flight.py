@@ -0,0 +1,139 @@
+"""
+Single-flight de-duplication of in-flight emissions factor lookups.
+
+The lifecycle agents start at the same time and often ask for the same factor
+(grid electricity, truck freight, landfill) at nearly the same moment, as do
+concurrent sessions. A request whose key is already being computed waits for
+that computation instead of starting its own. Nothing is cached once the
+computation finishes.
+
+The emissions factor tools run both on the event loop and in executor threads,
+so in-flight computations are tracked with thread-safe concurrent futures.
+
+A leader whose analysis is cancelled abandons its computation rather than
+failing it: the waiters get Abandoned and one of them takes over.
+"""
+
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+from llm.cancellation import AnalysisCancelled
+
+
+class Abandoned(Exception):
+    """The leader of an in-flight computation was cancelled before finishing it."""
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight: Dict[Hashable, Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.abandoned = 0
+
+    def claim(self, key: Hashable) -> tuple[Future, bool]:
+        """
+        Join the in-flight computation for key, or start tracking a new one.
+
+        Returns:
+            The future for key and whether the caller is the leader. The leader
+            must call resolve (or reject or fail) with that future once it has
+            computed the result.
+        """
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.hits += 1
+                return future, False
+            future = Future()
+            self._in_flight[key] = future
+            self.misses += 1
+            return future, True
+
+    def _release(self, key: Hashable, future: Future) -> bool:
+        """
+        Stop tracking the leader's future, unless a newer leader has claimed
+        key since (after this one failed). Returns whether the future is still
+        unsettled, i.e. whether the caller should settle it.
+        """
+        with self._lock:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+        return not future.done()
+
+    def resolve(self, key: Hashable, future: Future, result: Any) -> None:
+        if self._release(key, future):
+            future.set_result(result)
+
+    def reject(self, key: Hashable, future: Future, error: BaseException) -> None:
+        if self._release(key, future):
+            future.set_exception(error)
+
+    def fail(self, key: Hashable, future: Future, error: BaseException) -> None:
+        """Reject the leader's future, or abandon it if the leader was cancelled."""
+        if isinstance(error, (asyncio.CancelledError, AnalysisCancelled)):
+            if self._release(key, future):
+                with self._lock:
+                    self.abandoned += 1
+                future.set_exception(Abandoned())
+        else:
+            self.reject(key, future, error)
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """Run fn unless an identical call is already in flight, in which case wait for it."""
+        while True:
+            future, leader = self.claim(key)
+            if leader:
+                break
+            try:
+                return future.result()
+            except Abandoned:
+                continue
+        try:
+            result = fn()
+        except BaseException as e:
+            self.fail(key, future, e)
+            raise
+        self.resolve(key, future, result)
+        return result
+
+    async def ado(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Async version of do."""
+        while True:
+            future, leader = self.claim(key)
+            if leader:
+                break
+            try:
+                return await wait(future)
+            except Abandoned:
+                continue
+        try:
+            result = await fn()
+        except BaseException as e:
+            self.fail(key, future, e)
+            raise
+        self.resolve(key, future, result)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            in_flight = len(self._in_flight)
+            hits, misses, abandoned = self.hits, self.misses, self.abandoned
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            "in_flight": in_flight,
+            "abandoned": abandoned,
+        }
+
+
+async def wait(future: Future) -> Any:
+    """
+    Await a shared future. The future is shielded, so a cancelled waiter
+    leaves it running for the leader and the other waiters.
+    """
+    return await asyncio.shield(asyncio.wrap_future(future))
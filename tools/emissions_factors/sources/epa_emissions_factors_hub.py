@@ -1,7 +1,8 @@
+from functools import lru_cache
 from typing import Literal
 from pydantic import BaseModel, Field
-from langchain_openai import ChatOpenAI
-from tools.emissions_factors.state import EFState
+from llm.models import get_chat_model
+from tools.emissions_factors.state import EFState, EFBatchState
 import os
 
 class EPAEmissionsFactor(BaseModel):
@@ -9,15 +10,19 @@ class EPAEmissionsFactor(BaseModel):
     units: Literal["kgCO2/vehicle-mile", "kgCO2/short ton-mile", "kgCO2/mmBtu", "kgCO2/gallon", "kgCO2/scf", "lbCO2/MWh", "Metric Tons CO2e / Short Ton", "N/A"] = Field(description="The units associated with the carbon emissions factor (use N/A if no appropriate emissions factor can be found)")
     description: str = Field(description="Details about the emissions factor")
 
-def epa_ef_finder(state:EFState):
-    process_desc = state["process_desc"]
-    phase = state["phase"]
+class IndexedEPAEmissionsFactor(EPAEmissionsFactor):
+    request_index: int = Field(description="The index of the process this emissions factor is for")
 
-    ef_llm = ChatOpenAI(
-        model_name="gpt-4o", 
-        temperature=0,
-    ).with_structured_output(EPAEmissionsFactor)
-    
+class EPAEmissionsFactorList(BaseModel):
+    emissions_factors: list[IndexedEPAEmissionsFactor] = Field(description="One emissions factor per process")
+
+CITATION = {
+    "citation_desc": "The 2025 annual update of the Emission Factors Hub (January 2025)",
+    "citation_url": "https://www.epa.gov/climateleadership/ghg-emission-factors-hub"
+}
+
+@lru_cache(maxsize=1)
+def epa_system_prompt():
     base_sys_prompt = """
     You are an expert at identifying the most appropriate emission factor given
     a process description and phase (e.g. manufacturing, transportation, etc).
@@ -26,37 +31,55 @@ def epa_ef_finder(state:EFState):
     for the units."""
 
     # Load and append the EPA emissions data
-    data_path = os.path.join(os.path.dirname(__file__), "../..", "data", "epa", "GHG-Emission-Factors-Hub.md")
+    data_path = os.path.join(os.path.dirname(__file__), "../../..", "data", "epa", "GHG-Emission-Factors-Hub.md")
     with open(data_path, 'r') as f:
         epa_data = f.read()
-    
+
     if epa_data is None:
         raise FileNotFoundError()
-    
-    sys_prompt = f"{base_sys_prompt}\n\n{epa_data}"
-    
+
+    return f"{base_sys_prompt}\n\n{epa_data}"
+
+def epa_ef_finder(state:EFState):
+    process_desc = state["process_desc"]
+    phase = state["phase"]
+
+    ef_llm = get_chat_model(
+        route="ef.source.epa",
+        temperature=0,
+    ).with_structured_output(EPAEmissionsFactor)
+
     prompt = f"What is your best estimate of the carbon emissions factor for the process: {process_desc} in this phase: {phase}?"
     response:EPAEmissionsFactor = ef_llm.invoke([
-        {"role": "system", "content": sys_prompt},
+        {"role": "system", "content": epa_system_prompt()},
         {"role": "user", "content": prompt}
     ])
     #print(response)
 
-    converted = response.model_dump()
-    if converted["units"] == "lbCO2/MWh":
-        converted["CO2e_factor"] = converted["CO2e_factor"] * 0.453592/1000
-        converted["units"] = "kgCO2/kWh"
-    elif converted["units"] == "kgCO2/mmBtu":
-        converted["CO2e_factor"] = converted["CO2e_factor"] * 0.003412
-        converted["units"] = "kgCO2/kWh"
-    elif converted["units"] == "kgCO2/short ton-mile":
-        converted["CO2e_factor"] = converted["CO2e_factor"] * 1.1023
-        converted["units"] = "kgCO2/tonne-mile"
-
     return {
         "ef_candidates": [{
-            **converted,
-            "citation_desc": "The 2025 annual update of the Emission Factors Hub (January 2025)",
-            "citation_url": "https://www.epa.gov/climateleadership/ghg-emission-factors-hub"
+            **response.model_dump(),
+            **CITATION
         }]
     }
+
+async def epa_ef_batch_finder(state:EFBatchState):
+    """Answers every request in the batch with a single LLM call, sending the EPA data once."""
+    ef_llm = get_chat_model(
+        route="ef.source.epa",
+        temperature=0,
+    ).with_structured_output(EPAEmissionsFactorList)
+
+    prompt = "What is your best estimate of the carbon emissions factor for each of these processes and phases? Return one emissions factor per index.\n\n"
+    prompt += "\n".join([f"[{i}]: process: {r['process_desc']}, phase: {r['phase']}" for i, r in enumerate(state["requests"])])
+    response:EPAEmissionsFactorList = await ef_llm.ainvoke([
+        {"role": "system", "content": epa_system_prompt()},
+        {"role": "user", "content": prompt}
+    ])
+
+    return {
+        "ef_candidates": [{
+            **ef.model_dump(),
+            **CITATION
+        } for ef in response.emissions_factors if 0 <= ef.request_index < len(state["requests"])]
+    }
@@ -1,12 +1,13 @@
-from tools.emissions_factors.state import EFState, EmissionsFactor
-from langchain_openai import ChatOpenAI
+from pydantic import BaseModel, Field
+from tools.emissions_factors.state import EFState, EFBatchState, EmissionsFactor
+from llm.models import get_chat_model
 
 def parametric_knowledge_ef_finder(state: EFState):
     process_desc = state["process_desc"]
     phase = state["phase"]
 
-    ef_llm = ChatOpenAI(
-        model_name="gpt-4o", 
+    ef_llm = get_chat_model(
+        route="ef.source.parametric_knowledge",
         temperature=0,
     ).with_structured_output(EmissionsFactor)
     
@@ -20,3 +21,28 @@ def parametric_knowledge_ef_finder(state: EFState):
             "citation_url": "N/A"
         }]
     }
+
+class IndexedEmissionsFactor(EmissionsFactor):
+    request_index: int = Field(description="The index of the process this emissions factor is for.")
+
+class EmissionsFactorList(BaseModel):
+    emissions_factors: list[IndexedEmissionsFactor] = Field(description="One emissions factor per process.")
+
+async def parametric_knowledge_ef_batch_finder(state: EFBatchState):
+    """Answers every request in the batch with a single LLM call."""
+    ef_llm = get_chat_model(
+        route="ef.source.parametric_knowledge",
+        temperature=0,
+    ).with_structured_output(EmissionsFactorList)
+
+    prompt = "What is your best estimate of the carbon emissions factor for each of these processes and phases? Return one emissions factor per index.\n\n"
+    prompt += "\n".join([f"[{i}]: process: {r['process_desc']}, phase: {r['phase']}" for i, r in enumerate(state["requests"])])
+    response:EmissionsFactorList = await ef_llm.ainvoke([{"role": "user", "content": prompt}])
+
+    return {
+        "ef_candidates": [{
+            **ef.model_dump(),
+            "citation_desc": "parametric knowledge",
+            "citation_url": "N/A"
+        } for ef in response.emissions_factors if 0 <= ef.request_index < len(state["requests"])]
+    }
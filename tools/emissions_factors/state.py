@@ -15,4 +15,14 @@ class EFState(TypedDict):
     ef_candidates: Annotated[list[EmissionsFactor], operator.add]
     emissions_factor: EmissionsFactor
     process_desc: str
-    phase: str
\ No newline at end of file
+    phase: str
+
+class EFRequest(BaseModel):
+    """A single emissions factor lookup."""
+    process_desc: str = Field(description="The process to find an emissions factor for (e.g. 'injection molding of ABS plastic').")
+    phase: str = Field(description="The lifecycle phase (e.g. materials, manufacturing, transportation).")
+
+class EFBatchState(TypedDict):
+    requests: list[dict] # EFRequest dicts
+    ef_candidates: Annotated[list[dict], operator.add] # Candidates tagged with the "request_index" they answer
+    emissions_factors: list # One picked emissions factor (or None) per request
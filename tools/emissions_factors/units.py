@@ -0,0 +1,219 @@
+"""
+Unit registry and converter for emissions factors.
+
+Emissions factors come back from the sources in whatever units the data (or
+the LLM) uses: lbCO2/MWh, kgCO2/mmBtu, Metric Tons CO2e / Short Ton,
+kgCO2/short ton-mile, ... normalize_factor rewrites a factor into canonical
+units, so the agents can multiply it straight into their activity data:
+
+    kg<gas> per kg | kWh | km | tonne-km | L | m2 | item
+
+where <gas> is CO2e, CO2, CH4 or N2O as given by the source. Unit strings are
+parsed deterministically; factors whose units can't be parsed are returned
+unchanged.
+"""
+
+import re
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# Canonical unit of each dimension
+CANONICAL_UNITS = {
+    "mass": "kg",
+    "energy": "kWh",
+    "distance": "km",
+    "freight": "tonne-km",
+    "volume": "L",
+    "area": "m2",
+    "count": "item",
+}
+
+# Unit aliases -> (dimension, size in canonical units)
+UNITS: Dict[str, Tuple[str, float]] = {}
+
+def register_unit(dimension: str, factor: float, *aliases: str) -> None:
+    """Register a unit (and its aliases) as factor canonical units of dimension."""
+    for alias in aliases:
+        UNITS[_normalize_name(alias)] = (dimension, factor)
+
+def _normalize_name(name: str) -> str:
+    name = name.strip().lower()
+    name = re.sub(r"[\s_]+", " ", name)
+    name = re.sub(r"\s*-\s*", "-", name)
+    return name
+
+_KG_PER_LB = 0.45359237
+_KG_PER_SHORT_TON = 907.18474
+_KG_PER_LONG_TON = 1016.0469088
+_KM_PER_MILE = 1.609344
+_KM_PER_NAUTICAL_MILE = 1.852
+_L_PER_US_GALLON = 3.785411784
+
+# Mass
+register_unit("mass", 1.0, "kg", "kgs", "kilogram", "kilograms")
+register_unit("mass", 1e-3, "g", "gram", "grams")
+register_unit("mass", 1e-6, "mg", "milligram", "milligrams")
+register_unit("mass", 1000.0, "t", "tonne", "tonnes", "metric ton", "metric tons", "metric tonne", "metric tonnes", "mt")
+register_unit("mass", _KG_PER_LB, "lb", "lbs", "pound", "pounds")
+register_unit("mass", _KG_PER_LB / 16, "oz", "ounce", "ounces")
+register_unit("mass", _KG_PER_SHORT_TON, "short ton", "short tons", "ton", "tons", "us ton", "us tons")
+register_unit("mass", _KG_PER_LONG_TON, "long ton", "long tons")
+
+# Energy
+register_unit("energy", 1.0, "kwh", "kilowatt-hour", "kilowatt hour", "kilowatt-hours", "kilowatt hours")
+register_unit("energy", 1e-3, "wh", "watt-hour", "watt hour")
+register_unit("energy", 1e3, "mwh", "megawatt-hour", "megawatt hour", "megawatt-hours")
+register_unit("energy", 1e6, "gwh", "gigawatt-hour")
+register_unit("energy", 1 / 3.6e6, "j", "joule", "joules")
+register_unit("energy", 1 / 3.6e3, "kj", "kilojoule", "kilojoules")
+register_unit("energy", 1 / 3.6, "mj", "megajoule", "megajoules")
+register_unit("energy", 1000 / 3.6, "gj", "gigajoule", "gigajoules")
+register_unit("energy", 1 / 3412.14, "btu")
+register_unit("energy", 1e6 / 3412.14, "mmbtu", "million btu", "mbtu")
+register_unit("energy", 1e5 / 3412.14, "therm", "therms")
+
+# Distance
+register_unit("distance", 1.0, "km", "kilometer", "kilometers", "kilometre", "kilometres")
+register_unit("distance", 1e-3, "m", "meter", "meters", "metre", "metres")
+register_unit("distance", _KM_PER_MILE, "mi", "mile", "miles", "vehicle-mile", "vehicle-miles", "vehicle mile", "passenger-mile", "passenger mile")
+register_unit("distance", _KM_PER_NAUTICAL_MILE, "nmi", "nautical mile", "nautical miles")
+register_unit("distance", 1.0, "vehicle-km", "vkm", "passenger-km", "pkm")
+
+# Freight (mass moved over a distance)
+register_unit("freight", 1.0, "tonne-km", "tkm", "t-km", "tonne-kilometer", "tonne-kilometre", "metric ton-km", "tonne km")
+register_unit("freight", _KM_PER_MILE, "tonne-mile", "tonne-miles", "metric ton-mile", "metric ton-miles", "t-mile")
+register_unit("freight", _KG_PER_SHORT_TON / 1000 * _KM_PER_MILE, "short ton-mile", "short ton-miles", "ton-mile", "ton-miles", "us ton-mile")
+register_unit("freight", 1e-3, "kg-km", "kgkm")
+
+# Volume
+register_unit("volume", 1.0, "l", "liter", "liters", "litre", "litres")
+register_unit("volume", 1e-3, "ml", "milliliter", "milliliters", "millilitre", "millilitres")
+register_unit("volume", 1000.0, "m3", "cubic meter", "cubic meters", "cubic metre", "cubic metres")
+register_unit("volume", _L_PER_US_GALLON, "gal", "gallon", "gallons", "us gallon", "us gallons")
+register_unit("volume", 28.316846592, "scf", "cf", "ft3", "cubic foot", "cubic feet", "standard cubic foot", "standard cubic feet")
+register_unit("volume", 158.987294928, "bbl", "barrel", "barrels")
+
+# Area
+register_unit("area", 1.0, "m2", "m^2", "square meter", "square meters", "square metre", "square metres", "sq m")
+register_unit("area", 0.09290304, "ft2", "ft^2", "sq ft", "square foot", "square feet")
+
+# Count
+register_unit("count", 1.0, "item", "items", "unit", "units", "piece", "pieces", "pc", "pcs", "each", "product", "products")
+
+_GASES = ["co2e", "co2eq", "co2-eq", "co2", "ch4", "n2o"]
+_GAS_LABELS = {"co2e": "CO2e", "co2eq": "CO2e", "co2-eq": "CO2e", "co2": "CO2", "ch4": "CH4", "n2o": "N2O"}
+
+
+def _parse_emissions(numerator: str) -> Optional[Tuple[float, str]]:
+    """Parse an emitted-mass unit such as 'kgCO2e', 'lb CO2' or 'Metric Tons CO2e' into (kg, gas label)."""
+    text = _normalize_name(numerator)
+    for gas in _GASES:
+        match = re.fullmatch(rf"(.*?)\s*{re.escape(gas)}", text)
+        if match:
+            mass = UNITS.get(_normalize_name(match.group(1)) or "kg")
+            if mass and mass[0] == "mass":
+                return mass[1], _GAS_LABELS[gas]
+    return None
+
+
+def _parse_activity(denominator: str) -> Optional[Tuple[str, float]]:
+    text = _normalize_name(re.sub(r"^(per|/)\s*", "", denominator.strip(), flags=re.IGNORECASE))
+    if text in UNITS:
+        return UNITS[text]
+    # "1 kg", "1,000 kg"
+    match = re.fullmatch(r"([\d.,]+)\s*(.+)", text)
+    if match and match.group(2) in UNITS:
+        dimension, size = UNITS[match.group(2)]
+        return dimension, size * float(match.group(1).replace(",", ""))
+    return None
+
+
+@lru_cache(maxsize=1024)
+def parse_factor_units(units: str) -> Optional[Tuple[float, str, str]]:
+    """
+    Parse emissions factor units like 'lbCO2/MWh' or 'kg CO2e per kg'.
+
+    Returns:
+        (multiplier to canonical units, gas label, activity dimension), or None
+        if the units can't be parsed
+    """
+    parts = re.split(r"\s*/\s*|\s+per\s+", units.strip(), maxsplit=1, flags=re.IGNORECASE)
+    if len(parts) != 2:
+        return None
+    emissions = _parse_emissions(parts[0])
+    activity = _parse_activity(parts[1])
+    if emissions is None or activity is None:
+        return None
+    emitted_kg, gas = emissions
+    dimension, activity_size = activity
+    return emitted_kg / activity_size, gas, dimension
+
+
+def canonical_units(gas: str, dimension: str) -> str:
+    return f"kg{gas}/{CANONICAL_UNITS[dimension]}"
+
+
+def conversion_factor(from_units: str, to_units: str) -> float:
+    """
+    Multiplier converting a value in from_units to to_units. Works for plain
+    units ('lb' -> 'kg') and emissions factor units ('lbCO2/MWh' -> 'kgCO2/kWh').
+
+    Raises:
+        ValueError: If a unit is unknown or the dimensions don't match
+    """
+    plain_from, plain_to = UNITS.get(_normalize_name(from_units)), UNITS.get(_normalize_name(to_units))
+    if plain_from and plain_to:
+        if plain_from[0] != plain_to[0]:
+            raise ValueError(f"Cannot convert {from_units} ({plain_from[0]}) to {to_units} ({plain_to[0]})")
+        return plain_from[1] / plain_to[1]
+
+    parsed_from, parsed_to = parse_factor_units(from_units), parse_factor_units(to_units)
+    if parsed_from is None or parsed_to is None:
+        raise ValueError(f"Unknown units: {from_units if parsed_from is None else to_units}")
+    if parsed_from[1:] != parsed_to[1:]:
+        raise ValueError(f"Cannot convert {from_units} to {to_units}")
+    return parsed_from[0] / parsed_to[0]
+
+
+def convert_values(values: Iterable[float], from_units: str, to_units: str) -> np.ndarray:
+    """Convert an array of values from one unit to another in a single vectorised operation."""
+    return np.asarray(values, dtype=np.float64) * conversion_factor(from_units, to_units)
+
+
+def normalize_factor(factor: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Rewrite an emissions factor dict (CO2e_factor, units, ...) into canonical
+    units, keeping the source values as original_CO2e_factor / original_units.
+    Factors with unparseable units or the -1 "not found" value are returned unchanged.
+    """
+    return normalize_factors([factor])[0]
+
+
+def normalize_factors(factors: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Normalise many emissions factors, converting all values that share units at once."""
+    by_units: Dict[str, List[int]] = {}
+    for i, factor in enumerate(factors):
+        if factor is not None and factor.get("CO2e_factor", -1) >= 0 and isinstance(factor.get("units"), str):
+            by_units.setdefault(factor["units"], []).append(i)
+
+    normalized = list(factors)
+    for units, indices in by_units.items():
+        parsed = parse_factor_units(units)
+        if parsed is None:
+            continue
+        multiplier, gas, dimension = parsed
+        target = canonical_units(gas, dimension)
+        if units == target:
+            continue
+        values = np.asarray([factors[i]["CO2e_factor"] for i in indices], dtype=np.float64) * multiplier
+        for i, value in zip(indices, values):
+            normalized[i] = {
+                **factors[i],
+                "CO2e_factor": float(value),
+                "units": target,
+                "original_CO2e_factor": factors[i]["CO2e_factor"],
+                "original_units": units,
+            }
+    return normalized